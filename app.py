@@ -1,18 +1,53 @@
 import streamlit as st
-import pandas as pd
 from routers.users import chat
 import plotly.graph_objects as go
 import sqlparse
-from utility.chat_helper import data_processing,delete_cache_folder
+from utility.chat_helper import data_processing_stream,delete_cache_folder
+from utility.sql_templates import template_registry
+from utility.stream_channel import StreamChannel
+from utility.api_calls import close_async_client
 import sqlite3
 import asyncio
 import io
 import json
 import os
 import random
+import threading
 import time
 
 
+# Labels of the agent chains that can answer a question, see classify_question
+LANE_LABELS={"fast":"Fast lane","full":"Full chain","fallback":"Full chain (fast lane fallback)","cache":"Answer cache",
+             "template":"SQL template"}
+# Seconds between two refreshes of the streamed progress while the answer is generated
+STREAM_REFRESH_SECONDS=0.1
+
+
+def render_stream(placeholder, snapshot):
+    """Show the current stage and the insights streamed so far."""
+    text=f"*{snapshot['stage']}...*" if snapshot["stage"] else ""
+    for i,insight in enumerate(snapshot["insights"]):
+        text+=f"\n\n{i+1}. {insight}"
+    placeholder.markdown(text)
+
+
+async def chat_with_stream(prompt, placeholder):
+    """Run `chat`, rendering its progress into `placeholder` from this (the script) thread until it returns."""
+    stream_channel=StreamChannel()
+    task=asyncio.create_task(chat(prompt, stream_channel))
+    version=None
+    try:
+        while not task.done():
+            snapshot=stream_channel.snapshot()
+            if snapshot["version"]!=version:
+                version=snapshot["version"]
+                render_stream(placeholder, snapshot)
+            await asyncio.wait({task}, timeout=STREAM_REFRESH_SECONDS)
+        return task.result()
+    finally:
+        # asyncio.run closes this loop on return, the client created for it would leak its connection pool
+        await close_async_client()
+
 st.set_page_config(page_title="Quin", layout="wide")
 st.markdown("""
     <div style='text-align: center; margin-top:-50px; margin-bottom: 5px;margin-left: -50px;'>
@@ -90,19 +125,58 @@ if "file_name" not in st.session_state:
 
 
 with st.sidebar:
+    ingest_mode="replace"
+    month_policy="skip"
     if os.path.exists("database.db"):
         uploaded_file = st.file_uploader("Please upload a file", type=["csv"])
         st.info("The data is already loaded. To load new data, you can upload a file here. Otherwise, feel free to ignore this and proceed to ask your query.")
+        load_option=st.radio("Load mode", ["Append new months","Replace all data"])
+        if load_option=="Append new months":
+            ingest_mode="append"
+            month_option=st.radio("Months already loaded", ["Skip","Replace"])
+            month_policy=month_option.lower()
     else:
         uploaded_file = st.file_uploader("Please upload a file", type=["csv"])
     if uploaded_file is not None and st.session_state.file_name==None:
         try:
-            df = pd.read_csv(uploaded_file)
-            data_processing(df)
+            # Stream the file into the database on a worker thread, the script thread only renders progress
+            progress_bar=st.progress(0.0, text="Loading file into the database...")
+            progress={}
+            ingest_result={}
+            def run_ingest():
+                try:
+                    ingest_result["stats"]=data_processing_stream(uploaded_file, progress_callback=progress.update,
+                                                                  mode=ingest_mode, month_policy=month_policy)
+                except Exception as e:
+                    ingest_result["error"]=e
+            ingest_thread=threading.Thread(target=run_ingest, daemon=True)
+            ingest_thread.start()
+            while ingest_thread.is_alive():
+                if progress:
+                    progress_bar.progress(progress["fraction"] or 0.0,
+                        text=f"{progress['rows']:,} rows loaded ({progress['rows_per_sec']:,.0f} rows/sec)")
+                time.sleep(0.2)
+            if "error" in ingest_result:
+                raise ingest_result["error"]
+            ingest_stats=ingest_result["stats"]
+            progress_bar.progress(1.0, text=f"{ingest_stats['rows']:,} rows loaded ({ingest_stats['rows_per_sec']:,.0f} rows/sec)")
+            if ingest_stats["skipped"]:
+                st.info("This file has already been loaded, nothing to do.")
+            else:
+                st.success("File has been saved in local Database.")
             st.write("Uploaded file details:")
             st.write(f"File name: {uploaded_file.name}")
             st.session_state.file_name="process_df.csv"
             st.write(f"File size: {uploaded_file.size / 1024:.2f} KB")
+            st.write(f"Rows loaded: {ingest_stats['rows']:,} in {ingest_stats['total_time']:.1f} seconds "
+                     f"(load {ingest_stats['load_time']:.1f}s, indexes {ingest_stats['index_time']:.1f}s, "
+                     f"rollups {ingest_stats['rollup_time']:.1f}s)")
+            if ingest_stats["mode"]=="append":
+                st.write(f"Months added: {', '.join(ingest_stats['months']) or 'None'}")
+                if ingest_stats["skipped_rows"]:
+                    st.write(f"Rows skipped (month already loaded): {ingest_stats['skipped_rows']:,}")
+                if ingest_stats["replaced_months"]:
+                    st.write(f"Months replaced: {', '.join(ingest_stats['replaced_months'])}")
             # st.rerun()
         except Exception as e:
             st.error(f"Error occurred at data preprocessing :: {e}")
@@ -112,6 +186,14 @@ with st.sidebar:
         delete_cache_folder()
         st.info("Delete the autogen cache succesfully.")
 
+    template_stats=template_registry.stats()
+    if template_stats["questions"]:
+        with st.expander("SQL template stats"):
+            st.write(f"Match rate: {template_stats['match_rate']:.0%} of {template_stats['questions']} questions "
+                     f"({template_stats['answered']} answered, {template_stats['fallbacks']} sent to the agents)")
+            st.write(f"Average latency: match {template_stats['avg_match_ms']:.2f} ms, query {template_stats['avg_execution_ms']:.1f} ms")
+            st.write(template_stats["by_template"])
+
 if os.path.exists("database.db"):
     # Display chat messages from history on app rerun
     for message in st.session_state.messages:
@@ -156,9 +238,10 @@ if os.path.exists("database.db"):
         # Display user message in chat message container
         with st.chat_message("user"):
             st.markdown(prompt)
-        # Display assistant response in chat message container
-        with st.spinner():
-            response= chat(prompt) # await
+        # Display assistant response in chat message container, streaming the progress while it is generated
+        stream_placeholder=st.empty()
+        response= asyncio.run(chat_with_stream(prompt, stream_placeholder))
+        stream_placeholder.empty()
         
         tab1,tab2,tab3,tab4=st.tabs(['Insights',"📈 Plot","SQL Query","🗃 Data"])
         insights=""
@@ -176,6 +259,12 @@ if os.path.exists("database.db"):
             min_date=st.session_state.date_range['Min_date']
             message = f"Data available is till {max_date}.  || " #f"The data is available from {min_date} to {max_date}.   ||  "
             message+= f"Response Time :: {response_time:.2f} seconds"
+        # Time until the user saw the first part of the answer
+        if response.get('Time_to_first_output') is not None:
+            message+= f"  || First output :: {response['Time_to_first_output']:.2f} seconds"
+        # Which chain answered the question
+        lane=LANE_LABELS.get(response.get('lane'),"Full chain")
+        message+= f"  || Answered by :: {lane}"
         # Tab 1 :: Insights
         tab1.markdown(insights)
         tab1.info(message)
@@ -1,51 +1,139 @@
 # from utility.temp_history import SessionHistoryManager
 from utility.autogen_agents import initiate_chat
+from utility.entity_linker import link_question
+from utility.sql_templates import template_registry
 import streamlit as st
 from utility.api_calls import refine_question
 from utility.chat_helper import get_agent_chat_summary,DataDictionaryPrompt
+from utility.answer_cache import answer_cache,is_cacheable
+from utility.db_pool import get_dataset_version
+from utility.stream_channel import StreamChannel
 import time
+import asyncio
 
 
 if "data_dictionary_prompt" not in st.session_state:
     st.session_state.data_dictionary_prompt=None
 
+if "data_dictionary_version" not in st.session_state:
+    st.session_state.data_dictionary_version=None
 
-def chat(user_question): # async
+if "data_dictionary_schema" not in st.session_state:
+    st.session_state.data_dictionary_schema=None
+
+
+def total_time(inf_time):
+    """Sum the stage timings of `inf_time`, skipping nested breakdowns."""
+    return sum(value for value in inf_time.values() if isinstance(value,(int,float)))
+
+
+def first_output_time(stream_channel):
+    """Seconds until the first answer content was shown, the answer itself when nothing was streamed."""
+    stream_channel.mark_output()
+    return stream_channel.time_to_first_output()
+
+
+async def chat(user_question, stream_channel=None):
+    # Stage and streamed insights for the UI, see StreamChannel
+    stream_channel=stream_channel or StreamChannel()
+    stream_channel.stage("question")
     usage={'prompt_tokens': 0, 'completion_tokens': 0}
     dict_prompt_start_time=time.time()
-    if st.session_state.data_dictionary_prompt==None:
+    dataset_version=get_dataset_version()
+    if st.session_state.data_dictionary_prompt==None or st.session_state.data_dictionary_version!=dataset_version:
         print("Step-1) -------------Data Dictionary prompt---------------------")
         dict_obj=DataDictionaryPrompt()
-        st.session_state.data_dictionary_prompt,st.session_state.date_range=dict_obj.get_prompt()
+        artifacts=dict_obj.get_artifacts()
+        st.session_state.data_dictionary_prompt,st.session_state.date_range=artifacts["prompt"],artifacts["date_range"]
+        # Kept to prune the dictionary per question, see `SchemaPruner`
+        st.session_state.data_dictionary_schema=artifacts["schema_json"]
+        st.session_state.data_dictionary_version=dataset_version
         print("Step-1) -------------Data Dictionary Prompt Ready---------------------")
     else:
         print("Step-1) -------------Data Dictionary Prompt Ready---------------------")
     dict_prompt_end_time=time.time()
     dict_prompt_time=dict_prompt_end_time-dict_prompt_start_time
 
-    # Intiate Chat
+    # Refine follow up questions
     if len(st.session_state.history_manager)==0:
         print("---------------------No Follow up---------------------------")
-        result, logging_session_id,inf_time= initiate_chat(user_question,st.session_state.data_dictionary_prompt) # await
      
     else:
         print("---------------------Follow Up---------------------------")
-        user_question,refine_usage= refine_question(st.session_state.history_manager,user_question) # await
+        user_question,refine_usage= await refine_question(st.session_state.history_manager,user_question)
         print("Refine Question:", user_question)
-        result, logging_session_id,inf_time= initiate_chat(user_question,st.session_state.data_dictionary_prompt) # await
         usage['prompt_tokens'] += refine_usage["prompt_tokens"]
         usage['completion_tokens'] += refine_usage["completion_tokens"]
         print("total usage is:", usage)
+
+    # Answer repeated questions on the same dataset from the answer cache
+    answer_cache_start_time=time.time()
+    cached_response=await asyncio.to_thread(answer_cache.get,user_question)
+    answer_cache_time=time.time()-answer_cache_start_time
+    if cached_response is not None:
+        print("---------------------Answer Cache Hit---------------------------")
+        # Same as a completed answer, the follow up history is cleared
+        st.session_state.history_manager=[]
+        cached_response['question']=user_question
+        cached_response['usage']=usage
+        cached_response['answer_cache']="hit"
+        cached_response['lane']="cache"
+        inf_time={"dict_prompt_time":dict_prompt_time,"answer_cache_time":answer_cache_time}
+        print(inf_time)
+        cached_response['Total_time']=total_time(inf_time)
+        cached_response['Time_to_first_output']=first_output_time(stream_channel)
+        return cached_response
+
+    # Answer the frequent question shapes from vetted SQL templates, without the agent chain
+    entity_link_start_time=time.time()
+    linked=await asyncio.to_thread(link_question,user_question)
+    entity_link_time=time.time()-entity_link_start_time
+    template_start_time=time.time()
+    template_response=await asyncio.to_thread(template_registry.answer,user_question,linked[0])
+    template_time=time.time()-template_start_time
+    if template_response is not None:
+        print("---------------------SQL Template Answer---------------------------")
+        # Same as a completed answer, the follow up history is cleared
+        st.session_state.history_manager=[]
+        template_response['usage']=usage
+        template_response['answer_cache']="miss"
+        template_response['lane']="template"
+        inf_time={"dict_prompt_time":dict_prompt_time,"answer_cache_time":answer_cache_time,
+                  "entity_link_time":entity_link_time,"template_time":template_time}
+        print(inf_time)
+        print("SQL Template stats ::",template_registry.stats())
+        template_response['Total_time']=total_time(inf_time)
+        template_response['Time_to_first_output']=first_output_time(stream_channel)
+        return template_response
+
+    # Intiate Chat
+    result, logging_session_id,inf_time= await initiate_chat(user_question,st.session_state.data_dictionary_prompt,linked,
+                                                                 st.session_state.data_dictionary_schema,stream_channel)
+    # Linking ran before the template lookup
+    inf_time["entity_link_time"]=entity_link_time
+    inf_time["template_time"]=template_time
   
     # Step 5: Generating Response Summary
+    stream_channel.stage("summary")
     chat_summary_start_time=time.time()
-    final_response = get_agent_chat_summary(result, usage, logging_session_id, user_question) # await
+    chat_summary_calls={}
+    final_response = await get_agent_chat_summary(result, usage, logging_session_id, user_question, chat_summary_calls)
     print(final_response)
     chat_summary_end_time=time.time()
     chat_summary_time=chat_summary_end_time-chat_summary_start_time
     inf_time["dict_prompt_time"]=dict_prompt_time
     inf_time["chat_summary_time"]=chat_summary_time
+    # Per call breakdown of the concurrent post-processing calls (already part of chat_summary_time)
+    inf_time["chat_summary_calls"]=chat_summary_calls
+    inf_time["answer_cache_time"]=answer_cache_time
+    final_response['answer_cache']="miss"
+    # Which agent chain answered, shown in the UI
+    final_response['lane']=result.get('lane',"full")
+    if is_cacheable(final_response):
+        await asyncio.to_thread(answer_cache.set,user_question,final_response)
     print("-------------------Time-----------------------------")
     print(inf_time)
-    final_response['Total_time']=sum(list(inf_time.values()))
+    final_response['Total_time']=total_time(inf_time)
+    final_response['Time_to_first_output']=first_output_time(stream_channel)
+    print("Time to first output ::",final_response['Time_to_first_output'])
     return final_response
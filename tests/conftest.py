@@ -0,0 +1,72 @@
+import pathlib
+import numpy as np
+import pandas as pd
+import pytest
+from streamlit import config
+from utility import dataset_meta
+from utility.db_pool import read_only_pool
+from utility.execution_backend import duckdb_backend
+from utility.query_guard import table_statistics
+
+
+# Secrets read when the app modules are imported; the data dictionary path is relative to the test's working directory
+SECRETS_PATH=pathlib.Path(__file__).parent/"secrets.toml"
+config.set_option("secrets.files", [str(SECRETS_PATH)])
+
+COLUMNS=["Title","Franchise","IP","Publisher","Main_Genre","Sub_Genre","Conflict_Type","Social_Play","Business_Model",
+         "Release_Date_Month","Processing_Date_Month","Month_Since_Launch","SKU","Region","Platform","Units",
+         "Total_Revenue","Full_Game_Revenue","In_Game_Revenue","Premium_Revenue","Mau"]
+
+TITLES={"Hogwarts Legacy":"Warner Bros. Games","Mortal Kombat 1":"Warner Bros. Games","Elden Ring":"Bandai Namco",
+        "FIFA 23":"Electronic Arts","Minecraft":"Microsoft"}
+
+
+def write_midb_csv(path, months, rows_per_month=40, seed=0):
+    """Write a small MIDB extract with the upload column names, `rows_per_month` rows for every month."""
+    rng=np.random.default_rng(seed)
+    n=rows_per_month*len(months)
+    titles=rng.choice(list(TITLES),n)
+    pd.DataFrame({"Title":titles,"Franchise":[title.split(" ")[0] for title in titles],"IP":[title.split(" ")[0] for title in titles],
+        "Publisher":[TITLES[title] for title in titles],"Main Genre":rng.choice(["Action","RPG","Sports"],n),
+        "Sub Genre":rng.choice(["Open World","Arena"],n),"Conflict Type":rng.choice(["PvP","PvE"],n),
+        "Social Play":rng.choice(["Single","Multi"],n),"Business Model":rng.choice(["Premium","F2P"],n),
+        "Release Date Month":"","Processing Date Month":np.repeat(months,rows_per_month),
+        "Month Since Launch":rng.integers(0,24,n),"SKU":rng.choice(["Physical","Digital"],n),
+        "Region":rng.choice(["North America","Europe"],n),"Platform":rng.choice(["PC","Console"],n),
+        "Units":[f"{value:,}" for value in rng.integers(0,100000,n)],"Total Revenue":rng.integers(0,10**7,n),
+        "Full Game Revenue":rng.integers(0,10**6,n),"In-Game Revenue":rng.integers(0,10**6,n),
+        "Premium Revenue":rng.integers(0,10**5,n),"Mau":rng.integers(0,10**6,n)}).to_csv(path,index=False)
+    return str(path)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """
+    Run the test in an empty directory holding the data dictionary, so database.db, metadata.db and every
+    ingest artifact are created there.
+    """
+    pd.DataFrame({"col_id":range(1,len(COLUMNS)+1),"column_name":COLUMNS,"col_dtype":"TEXT",
+                  "col_desc":[f"{column} of the row" for column in COLUMNS]}).to_excel(tmp_path/"dict.xlsx",sheet_name="Sheet1",index=False)
+    monkeypatch.chdir(tmp_path)
+    # Process wide caches of the previous test's dataset
+    dataset_meta._fingerprint_cache.update(stat=None,fingerprint=None)
+    table_statistics._version=None
+    read_only_pool.reset()
+    duckdb_backend.reset()
+    return tmp_path
+
+
+@pytest.fixture
+def midb_csv(workdir):
+    """Writes MIDB extracts into the working directory: `midb_csv(name, months, rows_per_month, seed)`."""
+    def write(name, months, rows_per_month=40, seed=0):
+        return write_midb_csv(workdir/name, months, rows_per_month, seed)
+    return write
+
+
+@pytest.fixture
+def midb_db(workdir, midb_csv):
+    """A small ingested dataset of four months of 2023, with its indexes, rollups and statistics."""
+    from utility.chat_helper import data_processing_stream
+    data_processing_stream(midb_csv("midb.csv", ["2023-01-01","2023-02-01","2023-03-01","2023-04-01"]))
+    return workdir
@@ -0,0 +1,75 @@
+import sqlite3
+import pandas as pd
+import pytest
+from utility.execution_backend import bound_query,duckdb_backend,export_parquet,run_bounded_query,translate_sqlite
+
+
+QUERIES=[
+    "SELECT strftime('%Y-%m', Processing_Date_Month) AS month, SUM(Total_Revenue) AS revenue FROM midb_table GROUP BY month ORDER BY month",
+    "SELECT DISTINCT strftime('%Y', Processing_Date_Month, '+1 year') AS next_year FROM midb_table",
+    "SELECT DISTINCT date(Processing_Date_Month, 'start of month', '-1 month') AS previous FROM midb_table ORDER BY previous",
+    "SELECT Title, MAX(julianday(Processing_Date_Month) - julianday(Release_Date_Month)) AS days FROM midb_table GROUP BY Title ORDER BY Title",
+    "SELECT Title, SUM(Units) AS Units FROM midb_table WHERE Title LIKE '%RING%' OR Publisher LIKE 'warner%' GROUP BY Title ORDER BY Title",
+    "SELECT Title, CAST(SUM(Premium_Revenue) AS REAL) / SUM(Total_Revenue) AS premium_share FROM midb_table GROUP BY Title ORDER BY Title",
+    "SELECT `Title`, SUM(`Units`) AS `Units` FROM midb_table WHERE `Region` = 'Europe' GROUP BY `Title` ORDER BY `Title`",
+    "SELECT Title, SUM(Units) / 1000 AS thousand_units, MAX(Month_Since_Launch) / 12 AS years FROM midb_table GROUP BY Title ORDER BY Title",
+    "SELECT COUNT(*) AS rows FROM midb_table WHERE Processing_Date_Month >= date('2023-03-15', 'start of month')",
+]
+
+
+@pytest.fixture
+def parquet_db(midb_db):
+    conn=sqlite3.connect(midb_db/"database.db")
+    try:
+        export_parquet(conn)
+    finally:
+        conn.close()
+    duckdb_backend.reset()
+    return midb_db
+
+
+def rows(df):
+    return [tuple(round(value,9) if isinstance(value,float) else value for value in row) for row in df.itertuples(index=False)]
+
+
+@pytest.mark.parametrize("sql", QUERIES)
+def test_translated_query_matches_sqlite(parquet_db, sql):
+    conn=sqlite3.connect(parquet_db/"database.db")
+    try:
+        expected=pd.read_sql_query(sql, conn)
+    finally:
+        conn.close()
+    result=duckdb_backend.read_sql(sql)
+    assert list(result.columns)==list(expected.columns)
+    assert len(expected)>0
+    assert rows(result)==rows(expected)
+
+
+def test_translation_leaves_string_literals_alone():
+    translated=translate_sqlite("SELECT `Title` FROM midb_table WHERE Title LIKE '%like date(x) `a`%' AND CAST(Units AS REAL) > 1")
+    assert translated=="SELECT \"Title\" FROM midb_table WHERE Title ILIKE '%like date(x) `a`%' AND CAST(Units AS DOUBLE) > 1"
+
+
+def test_bound_query_wraps_a_single_select():
+    assert bound_query("SELECT Title FROM midb_table LIMIT 1000; -- top titles", 4)=="SELECT * FROM (SELECT Title FROM midb_table LIMIT 1000) LIMIT 4"
+    with pytest.raises(ValueError):
+        bound_query("SELECT 1; SELECT 2", 4)
+    with pytest.raises(ValueError):
+        bound_query("DELETE FROM midb_table", 4)
+
+
+def test_bounded_query_reports_truncation(midb_db):
+    result=run_bounded_query("SELECT Title, Units FROM midb_table ORDER BY Units DESC LIMIT 1000", limit=3)
+    assert result["columns"]==["Title","Units"]
+    assert len(result["rows"])==3
+    assert result["truncated"]
+
+
+def test_bounded_query_within_the_limit_is_not_truncated(midb_db):
+    result=run_bounded_query("SELECT DISTINCT Region FROM midb_table ORDER BY Region", limit=3)
+    assert result["rows"]==[("Europe",),("North America",)]
+    assert not result["truncated"]
+
+
+def test_bounded_query_returns_errors(midb_db):
+    assert "error" in run_bounded_query("SELECT Missing_Column FROM midb_table")
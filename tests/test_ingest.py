@@ -0,0 +1,62 @@
+import sqlite3
+from utility.chat_helper import data_processing_stream
+from utility.dataset_meta import get_dataset_fingerprint
+from utility.distinct_index import DISTINCT_VALUES_TABLE
+
+
+def month_counts(workdir):
+    conn=sqlite3.connect(workdir/"database.db")
+    try:
+        return dict(conn.execute("SELECT Processing_Date_Month, COUNT(*) FROM midb_table GROUP BY 1 ORDER BY 1"))
+    finally:
+        conn.close()
+
+
+def test_append_loads_only_new_months(workdir, midb_csv):
+    data_processing_stream(midb_csv("jan_feb.csv", ["2023-01-01","2023-02-01"], rows_per_month=30))
+    loaded=month_counts(workdir)
+    stats=data_processing_stream(midb_csv("feb_mar.csv", ["2023-02-01","2023-03-01"], rows_per_month=25, seed=1), mode="append")
+    assert stats["mode"]=="append"
+    assert stats["months"]==["2023-03-01"]
+    assert stats["skipped_rows"]==25
+    assert stats["rows"]==25
+    counts=month_counts(workdir)
+    # The month already loaded keeps its rows, only the new month is added
+    assert counts=={**loaded,"2023-03-01":25}
+
+
+def test_append_of_loaded_months_keeps_the_dataset(workdir, midb_csv):
+    data_processing_stream(midb_csv("jan_feb.csv", ["2023-01-01","2023-02-01"]))
+    fingerprint=get_dataset_fingerprint()
+    stats=data_processing_stream(midb_csv("feb.csv", ["2023-02-01"], seed=1), mode="append")
+    assert stats["rows"]==0
+    assert get_dataset_fingerprint()==fingerprint
+
+
+def test_replace_reingests_a_file_that_is_not_the_whole_dataset(workdir, midb_csv):
+    jan_feb=midb_csv("jan_feb.csv", ["2023-01-01","2023-02-01"], rows_per_month=30)
+    mar=midb_csv("mar.csv", ["2023-03-01"], rows_per_month=25, seed=1)
+    data_processing_stream(jan_feb)
+    loaded=month_counts(workdir)
+    fingerprint=get_dataset_fingerprint()
+    data_processing_stream(mar, mode="append")
+    assert set(month_counts(workdir))=={"2023-01-01","2023-02-01","2023-03-01"}
+    stats=data_processing_stream(jan_feb)
+    assert not stats["skipped"]
+    assert month_counts(workdir)==loaded
+    assert get_dataset_fingerprint()==fingerprint
+
+
+def test_replace_with_the_whole_dataset_is_skipped(workdir, midb_csv):
+    jan_feb=midb_csv("jan_feb.csv", ["2023-01-01","2023-02-01"])
+    data_processing_stream(jan_feb)
+    assert data_processing_stream(jan_feb)["skipped"]
+
+
+def test_planner_statistics_cover_every_ingest_table(midb_db):
+    conn=sqlite3.connect(midb_db/"database.db")
+    try:
+        analyzed={table for (table,) in conn.execute("SELECT DISTINCT tbl FROM sqlite_stat1")}
+    finally:
+        conn.close()
+    assert {"midb_table","rollup_month","rollup_title_month",DISTINCT_VALUES_TABLE}<=analyzed
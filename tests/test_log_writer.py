@@ -0,0 +1,36 @@
+import sqlite3
+import threading
+from utility.log_writer import BufferedLogger,LogWriter
+
+
+class Wrapper():
+    """Stands in for the OpenAIWrapper of one chat's agent."""
+
+
+def log_completions(logger, wrapper, count):
+    for invocation in range(count):
+        logger.log_chat_completion(invocation, 1, id(wrapper), {"messages":[]}, "reply", 0, 0.0, "2024-01-01 00:00:00")
+
+
+def test_concurrent_chats_log_under_their_own_session(tmp_path):
+    writer=LogWriter(dbname=str(tmp_path/"logs.db"))
+    logger=BufferedLogger(writer=writer)
+    first,second=Wrapper(),Wrapper()
+    first_session=logger.start_session([first])
+    second_session=logger.start_session([second])
+    threads=[threading.Thread(target=log_completions, args=(logger, first, 5)),
+             threading.Thread(target=log_completions, args=(logger, second, 3))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    logger.end_session([first])
+    # Completions after the chat ended are no longer attributed to it
+    log_completions(logger, first, 2)
+    writer.close()
+    conn=sqlite3.connect(tmp_path/"logs.db")
+    try:
+        sessions=dict(conn.execute("SELECT session_id, COUNT(*) FROM chat_completions GROUP BY session_id"))
+    finally:
+        conn.close()
+    assert sessions=={first_session:5,second_session:3,logger.session_id:2}
@@ -0,0 +1,75 @@
+import pytest
+from utility import query_guard
+from utility.autogen_agents import SQLExecutorAgent
+from utility.query_cache import query_result_cache
+from utility.query_guard import QueryRejected,check_query
+from utility.tool_call import SQLToolkit
+
+
+SELF_JOIN="SELECT a.Title, b.Title FROM midb_table a, midb_table b WHERE a.Units > b.Units"
+MONTHLY="SELECT Processing_Date_Month, SUM(Total_Revenue) FROM midb_table GROUP BY Processing_Date_Month"
+
+
+@pytest.fixture
+def guarded_db(midb_db, monkeypatch):
+    """The test dataset is tiny, so the guard judges plans by full scans only."""
+    monkeypatch.setattr(query_guard, "QUERY_GUARD_MIN_ROWS", 0)
+    query_result_cache.clear()
+    yield midb_db
+    query_result_cache.clear()
+
+
+@pytest.fixture
+def guard_calls(monkeypatch):
+    """Counts the plan checks of the executor and the validation tool."""
+    calls=[]
+    def counting_check(sql):
+        calls.append(sql)
+        return check_query(sql)
+    monkeypatch.setattr("utility.autogen_agents.check_query", counting_check)
+    monkeypatch.setattr("utility.tool_call.check_query", counting_check)
+    return calls
+
+
+def test_unbounded_self_join_is_rejected(guarded_db):
+    guard=check_query(SELF_JOIN)
+    assert guard["verdict"]=="reject"
+    assert guard["full_scans"]>query_guard.QUERY_GUARD_MAX_SCANS
+    assert any("nested loop join" in reason for reason in guard["reasons"])
+
+
+def test_aggregate_is_accepted(guarded_db):
+    assert check_query(MONTHLY)["verdict"]=="ok"
+
+
+def test_executor_rejects_before_running(guarded_db):
+    with pytest.raises(QueryRejected) as rejected:
+        SQLExecutorAgent.connect_sql(SELF_JOIN)
+    assert rejected.value.guard["verdict"]=="reject"
+
+
+def test_validation_tool_reports_the_rejection(guarded_db):
+    response=SQLToolkit.bounded_query_run()(SELF_JOIN)
+    assert response.startswith("Error: Query rejected before execution")
+
+
+def test_cached_executor_query_skips_the_guard(guarded_db, guard_calls):
+    first=SQLExecutorAgent.connect_sql(MONTHLY)
+    second=SQLExecutorAgent.connect_sql(MONTHLY)
+    assert guard_calls==[MONTHLY]
+    assert second.equals(first)
+
+
+def test_cached_validation_query_skips_the_guard(guarded_db, guard_calls):
+    validate=SQLToolkit.bounded_query_run()
+    first=validate(MONTHLY)
+    second=validate(MONTHLY)
+    assert guard_calls==[MONTHLY]
+    assert second.split("Execution time")[0]==first.split("Execution time")[0]
+
+
+def test_rejected_query_is_checked_again(guarded_db, guard_calls):
+    validate=SQLToolkit.bounded_query_run()
+    validate(SELF_JOIN)
+    validate(SELF_JOIN)
+    assert guard_calls==[SELF_JOIN,SELF_JOIN]
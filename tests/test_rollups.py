@@ -0,0 +1,55 @@
+import sqlite3
+import pytest
+from utility.rollups import plan_rollup,rewrite_query
+
+
+ROUTED=[
+    ("SELECT Title, SUM(Total_Revenue) AS Total_Revenue FROM midb_table WHERE Processing_Date_Month BETWEEN '2023-01-01' AND '2023-03-01' "
+     "GROUP BY Title ORDER BY Total_Revenue DESC LIMIT 3", "rollup_title_month"),
+    ("SELECT Processing_Date_Month, SUM(Units) FROM midb_table GROUP BY Processing_Date_Month ORDER BY 1", "rollup_month"),
+    ("SELECT strftime('%m', Processing_Date_Month) AS month, SUM(Premium_Revenue) FROM midb_table GROUP BY month", "rollup_month"),
+    ("SELECT SUM(Mau) FROM midb_table WHERE Publisher = 'Warner Bros. Games'", "rollup_publisher_month"),
+    ("SELECT MIN(Processing_Date_Month), MAX(Processing_Date_Month) FROM midb_table", "rollup_month"),
+    ("SELECT DISTINCT Publisher FROM midb_table ORDER BY Publisher", "rollup_publisher_month"),
+    ("SELECT m.Region, m.Platform, SUM(m.In_Game_Revenue) AS In_Game_Revenue FROM midb_table AS m WHERE m.Title = 'Elden Ring' "
+     "GROUP BY m.Region, m.Platform ORDER BY In_Game_Revenue", "rollup_title_region_platform_month"),
+    # Monthly MAU averaged over months: only the inner monthly sum is routed
+    ("SELECT Title, AVG(Mau) AS Mau FROM (SELECT Title, Processing_Date_Month, SUM(Mau) AS Mau FROM midb_table "
+     "GROUP BY Title, Processing_Date_Month) GROUP BY Title ORDER BY Mau DESC", "rollup_title_month"),
+]
+
+REJECTED=[
+    "SELECT Title, COUNT(*) FROM midb_table GROUP BY Title",
+    "SELECT Title, AVG(Units) FROM midb_table GROUP BY Title",
+    "SELECT a.Title, SUM(a.Units) FROM midb_table a JOIN rollup_month r ON a.Processing_Date_Month = r.Processing_Date_Month GROUP BY a.Title",
+    "SELECT Title, SUM(Units) OVER (PARTITION BY Title) FROM midb_table",
+    "SELECT Title, Units FROM midb_table WHERE Units > 1000",
+    "SELECT Title, SUM(Units) FROM midb_table WHERE Total_Revenue > 100 GROUP BY Title",
+    "SELECT Title, SUM(Units) FROM midb_table GROUP BY Title ORDER BY Mau",
+    "SELECT Title FROM midb_table WHERE Region = 'Europe'",
+    "SELECT Title, SUM(Units) FROM midb_table WHERE SKU = 'Digital' GROUP BY Title",
+    "SELECT * FROM midb_table WHERE Title = 'Minecraft'",
+    "SELECT Title, SUM(Units) FROM midb_table WHERE Title IN (SELECT Title FROM midb_table WHERE Region = 'Europe') GROUP BY Title",
+]
+
+
+def fetch(db_path, sql):
+    conn=sqlite3.connect(db_path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("sql,rollup", ROUTED)
+def test_routed_query_returns_the_same_result(midb_db, sql, rollup):
+    rewritten=rewrite_query(sql)
+    assert plan_rollup(sql)[0]==rollup
+    assert rollup in rewritten and "midb_table" not in rewritten
+    assert fetch(midb_db/"database.db", rewritten)==fetch(midb_db/"database.db", sql)
+
+
+@pytest.mark.parametrize("sql", REJECTED)
+def test_rejected_shapes_run_on_midb_table(midb_db, sql):
+    assert plan_rollup(sql) is None
+    assert rewrite_query(sql)==sql
@@ -0,0 +1,43 @@
+import sqlite3
+from utility.sql_templates import template_registry
+
+
+PREMIUM=[{"column_name":"Business_Model","value":"Premium","matched_text":"premium"}]
+
+
+def test_value_linked_from_metric_wording_is_not_a_filter():
+    matched=template_registry.match("Top 5 titles by premium revenue in 2023", PREMIUM)
+    assert matched["slots"]["metric"]=="Premium_Revenue"
+    assert matched["slots"]["entity"] is None
+    assert "Business_Model" not in matched["sql_query"]
+
+
+def test_value_linked_from_metric_wording_in_monthly_trend():
+    matched=template_registry.match("Monthly premium revenue trend for 2023", PREMIUM)
+    assert matched["template"].name=="monthly_trend"
+    assert matched["slots"]["entity"] is None
+    assert "Business_Model" not in matched["sql_query"]
+
+
+def test_value_linked_outside_metric_wording_is_a_filter():
+    matched=template_registry.match("Top 5 titles by revenue for premium games in 2023", PREMIUM)
+    assert matched["slots"]["metric"]=="Total_Revenue"
+    assert matched["slots"]["entity"]==("Business_Model","Premium")
+    assert "Business_Model = 'Premium'" in matched["sql_query"]
+
+
+def test_mau_is_averaged_over_months():
+    matched=template_registry.match("Top 3 titles by MAU in 2023")
+    assert matched["sql_query"].startswith("SELECT Title, AVG(Mau) AS Mau FROM (SELECT Title, Processing_Date_Month, SUM(Mau)")
+
+
+def test_mau_shares_add_up_when_groups_are_active_in_different_months():
+    matched=template_registry.match("Share of MAU by genre in 2023")
+    conn=sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE midb_table (Main_Genre TEXT, Processing_Date_Month TEXT, Mau INTEGER)")
+    conn.executemany("INSERT INTO midb_table VALUES (?, ?, ?)",
+                     [("Action","2023-01-01",60),("Action","2023-01-01",40),("RPG","2023-01-01",100),("Action","2023-02-01",300)])
+    rows=conn.execute(matched["sql_query"]).fetchall()
+    conn.close()
+    # Action holds 50% of January and 100% of February, RPG 50% of January only
+    assert rows==[("Action",200.0,75.0),("RPG",100.0,25.0)]
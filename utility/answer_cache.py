@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from dotenv import load_dotenv
+from utility.dataset_meta import connect_metadata
+from utility.db_pool import get_dataset_version
+
+
+load_dotenv()
+
+
+def normalize_question(question):
+    """Lowercase the question and drop punctuation and repeated whitespace, so trivially different phrasings share an entry."""
+    question=re.sub(r"[^a-z0-9%\s]", " ", str(question).lower())
+    return re.sub(r"\s+", " ", question).strip()
+
+
+class AnswerCache():
+    """
+    Persistent cache of final chat responses, keyed by the normalized (refined) question and dataset version.
+
+    Entries live in the metadata store so they survive restarts and are shared by every session. Entries
+    older than `ttl_seconds` expire, and the least recently used entries are evicted beyond `max_entries`.
+    Lookups only read the store: hit and miss counters and the last hit time of entries are kept in memory
+    and flushed at most every `flush_seconds` (and on every store), so a lookup does not change the
+    metadata store on disk.
+    """
+
+    def __init__(self, max_entries=None, ttl_seconds=None, flush_seconds=None) -> None:
+        self.max_entries=int(max_entries or os.getenv("answer_cache_size") or 500)
+        self.ttl_seconds=float(ttl_seconds or os.getenv("answer_cache_ttl") or 7*24*3600)
+        self.flush_seconds=float(flush_seconds or os.getenv("answer_cache_flush_seconds") or 60)
+        self._lock=threading.Lock()
+        self._pending_counts={}
+        self._pending_hits={}
+        self._last_flush=time.time()
+
+    def _connect(self):
+        conn=connect_metadata()
+        conn.execute("""CREATE TABLE IF NOT EXISTS answer_cache (
+            cache_key TEXT PRIMARY KEY,
+            question TEXT,
+            dataset_version TEXT,
+            response TEXT,
+            created_at REAL,
+            last_hit_at REAL,
+            hits INTEGER DEFAULT 0)""")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_answer_cache_last_hit ON answer_cache(last_hit_at)")
+        conn.execute("""CREATE TABLE IF NOT EXISTS answer_cache_stats (
+            name TEXT PRIMARY KEY,
+            value INTEGER)""")
+        return conn
+
+    @staticmethod
+    def _count(conn, name, amount=1):
+        conn.execute("""INSERT INTO answer_cache_stats (name, value) VALUES (?, ?)
+            ON CONFLICT(name) DO UPDATE SET value = value + excluded.value""", (name, amount))
+
+    @staticmethod
+    def make_key(question, dataset_version):
+        return hashlib.sha256(f"{dataset_version}|{normalize_question(question)}".encode("utf-8")).hexdigest()
+
+    def _record(self, name, key=None):
+        """Count a lookup in memory; a hit also remembers the entry's last hit time for the LRU order."""
+        now=time.time()
+        with self._lock:
+            self._pending_counts[name]=self._pending_counts.get(name,0)+1
+            if key is not None:
+                hits,_=self._pending_hits.get(key,(0,now))
+                self._pending_hits[key]=(hits+1,now)
+            due=now-self._last_flush>=self.flush_seconds
+        if due:
+            self.flush()
+
+    def _flush(self, conn):
+        """Write the pending counters and entry hits within the caller's transaction."""
+        with self._lock:
+            counts,self._pending_counts=self._pending_counts,{}
+            hits,self._pending_hits=self._pending_hits,{}
+            self._last_flush=time.time()
+        for name,amount in counts.items():
+            self._count(conn, name, amount)
+        conn.executemany("UPDATE answer_cache SET hits = hits + ?, last_hit_at = ? WHERE cache_key = ?",
+                         [(amount, last_hit_at, key) for key,(amount,last_hit_at) in hits.items()])
+
+    def flush(self):
+        """Persist the hit and miss counters collected in memory since the last flush."""
+        conn=self._connect()
+        try:
+            with conn:
+                self._flush(conn)
+        except Exception as e:
+            print("Answer Cache :: Flush failed ::",e)
+        finally:
+            conn.close()
+
+    def get(self, question):
+        """
+        Returns the cached final response for the question on the current dataset, or None on a miss.
+        Expired entries count as misses and are removed by the next store.
+        """
+        dataset_version=get_dataset_version()
+        key=self.make_key(question, dataset_version)
+        conn=self._connect()
+        try:
+            row=conn.execute("SELECT response, created_at FROM answer_cache WHERE cache_key = ?", (key,)).fetchone()
+        except Exception as e:
+            print("Answer Cache :: Lookup failed ::",e)
+            return None
+        finally:
+            conn.close()
+        if row is None or time.time()-row[1]>self.ttl_seconds:
+            self._record("misses")
+            return None
+        self._record("hits", key)
+        return json.loads(row[0])
+
+    def set(self, question, final_response):
+        """Store a final response for the question on the current dataset and apply the eviction policy."""
+        dataset_version=get_dataset_version()
+        key=self.make_key(question, dataset_version)
+        now=time.time()
+        conn=self._connect()
+        try:
+            with conn:
+                self._flush(conn)
+                conn.execute("""INSERT OR REPLACE INTO answer_cache
+                    (cache_key, question, dataset_version, response, created_at, last_hit_at, hits)
+                    VALUES (?, ?, ?, ?, ?, ?, 0)""",
+                    (key, question, dataset_version, json.dumps(final_response, default=str), now, now))
+                self._evict(conn, now)
+        except Exception as e:
+            print("Answer Cache :: Store failed ::",e)
+        finally:
+            conn.close()
+
+    def _evict(self, conn, now):
+        """Drop expired entries and entries of older datasets, then the least recently used beyond `max_entries`."""
+        evicted=conn.execute("DELETE FROM answer_cache WHERE created_at < ? OR dataset_version IS NOT ?",
+                             (now-self.ttl_seconds, get_dataset_version())).rowcount
+        evicted+=conn.execute("""DELETE FROM answer_cache WHERE cache_key IN (
+            SELECT cache_key FROM answer_cache ORDER BY last_hit_at DESC LIMIT -1 OFFSET ?)""",
+            (self.max_entries,)).rowcount
+        if evicted:
+            self._count(conn, "evictions", evicted)
+
+    def clear(self):
+        """Remove every cached answer."""
+        conn=self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM answer_cache")
+        finally:
+            conn.close()
+
+    def stats(self):
+        """Return the number of entries and the hit, miss and eviction counters."""
+        conn=self._connect()
+        try:
+            with conn:
+                self._flush(conn)
+            stats={name:value for name,value in conn.execute("SELECT name, value FROM answer_cache_stats")}
+            stats["entries"]=conn.execute("SELECT COUNT(*) FROM answer_cache").fetchone()[0]
+            return stats
+        finally:
+            conn.close()
+
+
+def is_cacheable(final_response):
+    """Only answers with a SQL query and a non-empty result are worth serving again."""
+    return (final_response.get("response_flag")==1
+            and final_response.get("sql_query","")!=""
+            and final_response.get("db_result") not in (None,"","[]"))
+
+
+answer_cache=AnswerCache()
@@ -1,6 +1,8 @@
 import os
+import asyncio
+import weakref
 from dotenv import load_dotenv
-from openai import AzureOpenAI
+from openai import AsyncAzureOpenAI
 import openai
 import streamlit as st
 
@@ -9,17 +11,34 @@ AZURE_OPEN_AI_KEY = st.secrets.azure.api_key or os.getenv('api_key')
 AZURE_OPEN_AI_URL = st.secrets.azure.base_url or os.getenv('base_url')
 AZURE_OPEN_AI_VERSION = st.secrets.azure.api_version or os.getenv('api_version')
 
-## Azure Open AI Client
-client = AzureOpenAI(
-    azure_endpoint=AZURE_OPEN_AI_URL,
-    api_version=AZURE_OPEN_AI_VERSION,
-    api_key=AZURE_OPEN_AI_KEY)
+## Azure Open AI Clients, one per event loop (pooled HTTP connections cannot be shared across loops)
+_async_clients = weakref.WeakKeyDictionary()
 
 
-def one_limit_call(prompt_):
+def get_async_client():
+    """Return the AsyncAzureOpenAI client of the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = AsyncAzureOpenAI(
+            azure_endpoint=AZURE_OPEN_AI_URL,
+            api_version=AZURE_OPEN_AI_VERSION,
+            api_key=AZURE_OPEN_AI_KEY)
+        _async_clients[loop] = client
+    return client
+
+
+async def close_async_client():
+    """Close the client of the running event loop and its HTTP connections, before the loop is closed."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
+
+
+async def one_limit_call(prompt_):
     try:
         # Create completion request
-        completion = client.chat.completions.create(
+        completion = await get_async_client().chat.completions.create(
             model=AZURE_OPEN_AI_DEPLOYMENT_NAME,
             temperature=0,
             messages=[
@@ -38,7 +57,7 @@ def one_limit_call(prompt_):
         print("Exception in one_limit_call Azure Call:", e)
 
 
-def refine_question(history,user_question): # async
+async def refine_question(history,user_question):
     history_prompt=""
     for dict1 in history:
         prompt_1=dict1['role']+":" +dict1['content']+"\n"
@@ -48,11 +67,7 @@ def refine_question(history,user_question): # async
     user_history:{history_prompt}
     user input:{user_question}
     question: """
-    client = AzureOpenAI(
-    azure_endpoint=AZURE_OPEN_AI_URL,
-    api_version=AZURE_OPEN_AI_VERSION,
-    api_key=AZURE_OPEN_AI_KEY)
-    completion = client.chat.completions.create(
+    completion = await get_async_client().chat.completions.create(
             model=AZURE_OPEN_AI_DEPLOYMENT_NAME,
             temperature=0,
             messages=[
@@ -67,7 +82,7 @@ def refine_question(history,user_question): # async
 
     return completion.choices[0].message.content, usage
 
-def sql_explanation(sql_query):
+async def sql_explanation(sql_query):
     """
     Generates a plain-language explanation of an SQL query using Azure OpenAI's Chat API.
 
@@ -91,14 +106,14 @@ def sql_explanation(sql_query):
 
     Example:
         sql_query = "SELECT customer_name, SUM(order_amount) FROM orders WHERE order_date >= '2023-01-01' GROUP BY customer_name;"
-        explanation, usage = sql_explanation(sql_query)
+        explanation, usage = await sql_explanation(sql_query)
         print("Explanation:\n", explanation)
         print("Token Usage:", usage)
 
     Notes:
         - The function assumes that the Azure OpenAI environment is configured with the required API key and endpoint.
         - The model used for generating explanations is specified by the `AZURE_OPEN_AI_DEPLOYMENT_NAME` constant.
-        - The API call expects the OpenAI client (`client`) to be initialized beforehand.
+        - The API call uses the async OpenAI client of the running event loop (`get_async_client`).
         - The function is designed specifically for SQL queries and provides tailored explanations for business analysts.
 
     Example Output for Query:
@@ -114,7 +129,7 @@ def sql_explanation(sql_query):
     openai.api_type = "azure"
     try:
         
-        response = client.chat.completions.create(
+        response = await get_async_client().chat.completions.create(
             model=AZURE_OPEN_AI_DEPLOYMENT_NAME,
             messages=[
                 {"role": "system", "content": "You are a useful assistant who explains SQL queries. Your work for Mercedes Benz."},
@@ -3,18 +3,37 @@ from typing import Any, Callable, Dict, List, Optional, Tuple, Type, Union
 from dotenv import load_dotenv
 import os
 import pandas as pd
-import sqlite3
 import autogen
 import re
 from utility.agent_prompts import get_data_analyst_system_message,get_insights_generator_system_message,get_planner_system_message,get_sql_critic_system_message,get_sql_query_executor_system_message
-from utility.tool_call import SQLToolkit
+from utility.tool_call import SQLToolkit,to_async_tools
+from utility.entity_linker import link_question
+from utility.db_pool import get_dataset_version
+from utility.query_cache import query_result_cache
+from utility.execution_backend import run_query
+from utility.api_calls import sql_explanation
+from utility.log_writer import runtime_logger
+from utility.question_router import classify_question
+from utility.schema_pruning import count_tokens,get_schema_pruner
+from utility.chat_helper import DataDictionaryPrompt
+from utility.message_compaction import COMPACTION_ENABLED,MessageCompactor
+from autogen.agentchat.contrib.capabilities.transform_messages import TransformMessages
+from autogen.io.base import IOStream
+from utility.stream_channel import ChannelStream
+from utility.query_guard import QueryRejected,check_query,describe
 import streamlit as st
 import time
 import numpy as np
+import hashlib
+import threading
+import asyncio
 
 
 load_dotenv()
 
+# A single runtime logger for the process, started before any crew is built; every chat gets its session id
+# from `runtime_logger.start_session`
+autogen.runtime_logging.start(logger=runtime_logger)
 
 
 class SQLExecutorAgent(AssistantAgent):
@@ -43,6 +62,7 @@ class SQLExecutorAgent(AssistantAgent):
         """
         super().__init__(name, llm_config=llm_config, system_message=system_message, human_input_mode=human_input_mode, **kwargs)
         self.register_reply([Agent, None], SQLExecutorAgent.generate_sql_reply)
+        self.register_reply([Agent, None], SQLExecutorAgent.a_generate_sql_reply, ignore_async_in_sync_chat=True)
         self.response = None
 
     def send(self, message: Union[Dict, str], recipient: Agent, request_reply: Optional[bool] = None, silent: Optional[bool] = False):
@@ -58,37 +78,28 @@ class SQLExecutorAgent(AssistantAgent):
         super().send(message, recipient, request_reply, silent=True)
 
         
+    @staticmethod
+    def guarded_run_query(query: str):
+        """Run the query unless its plan is rejected, see `check_query`."""
+        guard = check_query(query)
+        if guard["verdict"] == "reject":
+            raise QueryRejected(guard)
+        return run_query(query)
+
     @staticmethod
     def connect_sql(query: str):
         try:
-            # file_path=st.secrets.file.file_path or os.getenv('file_path')
-            # sheet_name=st.secrets.file.sheet_name or  os.getenv('sheet_name')
-            # table_name=st.secrets.file.table_name or os.getenv('table_name')
-            # if file_path.endswith(".xlsx"):
-            #     print("SQL Executor Agent :: File Loaded ::",file_path)
-            #     # Load the Excel sheet into a pandas DataFrame
-            #     df = pd.read_excel(file_path, sheet_name=sheet_name)
-            # else:
-            #     print("SQL Executor Agent :: File Loaded ::",file_path)
-            #     df = pd.read_csv(file_path)
-            
-            # Create an in-memory SQLite database
-            conn = sqlite3.connect("database.db")
-
-            # # Load the DataFrame into the SQLite database
-            # df.to_sql(table_name, conn, index=False, if_exists="replace")
-
-            # Execute the SQL query
-            df1 = pd.read_sql_query(query, conn)
+            # Execute the SQL query on the configured backend, reusing the result of an identical query on the same dataset;
+            # the plan is only checked when the result is not cached
+            df1 = query_result_cache.get_or_compute("executor", query, lambda: SQLExecutorAgent.guarded_run_query(query))
             
-            return df1  # Return the DataFrame with query results
+            return df1.copy()  # Return the DataFrame with query results
         
+        except QueryRejected:
+            raise
         except Exception as e:
             print("SQL query didn't work due to:", e)
             return None
-        finally:
-            # Close the database connection
-            conn.close()
     
     
     def get_db_results(self, generated_sql_query: str):
@@ -98,16 +109,19 @@ class SQLExecutorAgent(AssistantAgent):
         """
         # Execute the query to get a DataFrame
         df = self.connect_sql(generated_sql_query)
+        if df is None:
+            # The query failed, answered like an empty result
+            df = pd.DataFrame()
         
         # Check if DataFrame was obtained successfully
-        if df is not None and not df.empty:
+        if not df.empty:
             print("get_db_results: Successfully obtained DataFrame with shape:", df.shape)
         else:
             print("get_db_results: Failed to obtain DataFrame or it's empty.")
 
 
         # Check if data is within limit
-        if len(df)>1 and len(df) <= 20 and df is not None and not df.empty:
+        if len(df)>1 and len(df) <= 20:
             # Identify column types
             print("get_db_results: Data is within limit.")
             numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
@@ -121,7 +135,7 @@ class SQLExecutorAgent(AssistantAgent):
             print("get_db_results: Data one limit; truncating.")
             return df, 'one-limit'
 
-        elif df is None or df.empty:
+        elif df.empty:
             print("get_db_results: Data zero limit; truncating.")
             return df, 'zero-limit'
 
@@ -153,6 +167,14 @@ class SQLExecutorAgent(AssistantAgent):
         match = re.search(pattern, text, re.DOTALL)
         return match.group(1).strip() if match else None
 
+    @classmethod
+    def extract_clean_sql(cls, text):
+        """Extract the SQL query from an analyst message and strip code fences, or None if there is none."""
+        sql_query = cls.extract_sql(text)
+        if sql_query is None:
+            return None
+        return sql_query.strip('`').strip('```').lstrip('sql').strip()
+
     @staticmethod
     def extract_user_question(text):
         """
@@ -178,17 +200,23 @@ class SQLExecutorAgent(AssistantAgent):
         if messages is None:
             messages = self._oai_messages[sender]
         
-        previous_msg = messages[-2]["content"]
+        # The analyst's message precedes the critic's approval, or is the last one in the fast lane
+        previous_msg = messages[-1]["content"] if messages[-1].get("name")=="data_analyst" else messages[-2]["content"]
         print(previous_msg)
         # Extract SQL query and user question
-        sql_query_ = self.extract_sql(previous_msg).strip('`').strip('```').lstrip('sql').strip()
+        sql_query_ = self.extract_clean_sql(previous_msg)
         user_question = self.extract_user_question(previous_msg).strip()
 
         print("----------------------------------------------\n Extracted SQL query:", sql_query_)
         print("Extracted user question:", user_question)
 
-        # Execute SQL query to get DataFrame and data size flag
-        db_results, data_size_flag = self.get_db_results(sql_query_)
+        try:
+            # Execute SQL query to get DataFrame and data size flag
+            db_results, data_size_flag = self.get_db_results(sql_query_)
+        except QueryRejected as e:
+            # Expensive plans are sent back to the analyst before anything heavy runs
+            guard = e.guard
+            db_results, data_size_flag = pd.DataFrame(), 'rejected-plan'
         db_results_json = db_results.to_json(orient="records")
         print("generate_sql_reply: Data size flag from get_db_results:", data_size_flag)
         print("generate_sql_reply: Resulting DataFrame shape:", db_results.shape)
@@ -265,9 +293,35 @@ class SQLExecutorAgent(AssistantAgent):
 				"name": "sql_query_executor"
 			}
             print("generate_sql_reply: Sorry, I wasn't able to generate the correct query. Would you like to rephrase the question?", db_results_content)
+        elif data_size_flag == 'rejected-plan':
+            reason = f"Query rejected before execution, {describe(guard)}"
+            db_results_content = f"""
+				user_question: {user_question}
+				generated_sql_query: {sql_query_}
+				data_size_flag: {data_size_flag}
+				reason: {reason}
+				"""
+            response = {
+				"user_question":user_question,
+				"content": db_results_content,
+				"generated_sql_query": sql_query_,
+				"data_size_flag": data_size_flag,
+				"reason": reason,
+				"df": db_results_json ,
+				"role": "user",
+				"name": "sql_query_executor"
+			}
+            print("generate_sql_reply: rejected-plan ::", reason)
         self.response =response
         return True, response
 
+    async def a_generate_sql_reply(self, messages: Optional[List[Dict]], sender: "Agent", config):
+        """
+        Async counterpart of `generate_sql_reply` used by `a_initiate_chat`. The query runs on a worker
+        thread, so the event loop keeps serving other chats while it executes.
+        """
+        return await asyncio.to_thread(self.generate_sql_reply, messages, sender, config)
+
 def check_name_occurrences(data, name_value, no_of_iters):
     '''Checks how many times critic_agent or insights_agent have responded. This helps to end the loop'''
     count = sum(1 for entry in data if entry.get('name') == name_value)
@@ -282,17 +336,8 @@ def check_name_occurrences_tool(data, name_value,function_tool, no_of_iters):
 
 
 
-def initiate_chat(user_question,data_dictionary_prompt): # async
-    print("Step 2) -------Tool initialization-------------")
-    tool_start_time=time.time()
-    tool_obj=SQLToolkit()
-    tools,function_map=tool_obj.initialize_tools()
-    tool_end_time=time.time()
-    tool_time=tool_end_time-tool_start_time
-    print("---------Tools initialized---------")
-
-    print("-------Set LLM Configuration for Azure OpenAI-------------")
-    agent_i_start_time=time.time()
+def get_llm_configs(tools):
+    """Build the LLM configurations shared by every agent of a crew."""
     llm_config_azure = [
         {
             "model": st.secrets.azure.model or  os.getenv("model"),
@@ -323,78 +368,254 @@ def initiate_chat(user_question,data_dictionary_prompt): # async
         "timeout": 120,
         "stream": True
     }
-    
+    return llm_config,llm_config_lst,llm_config_common
+
+
+class AgentCrew():
+    """
+    The full set of agents, group chat and manager needed to answer one question.
 
-    print("-------USER PROXY AGENT-------------")
-    user_proxy = autogen.UserProxyAgent(
-        name="user_proxy",
-        system_message="A human admin. Once the task is completed, answer 'TERMINATE-AGENT'",
-        human_input_mode="NEVER",
-        code_execution_config=False
-    )
-
-
-    print("-------PLANNER AGENT-------------")
-    planner_system_message=get_planner_system_message(data_dictionary_prompt)
-    planner = autogen.AssistantAgent(
-        name="planner",
-        system_message=planner_system_message ,
-        human_input_mode="NEVER",
-        llm_config=llm_config_common
-    )
-
-    print("-------Data Analyst Agent-------------")
-    data_analyst_system_message=get_data_analyst_system_message(data_dictionary_prompt)
-    data_analyst = autogen.AssistantAgent(
-        name="data_analyst",
-        system_message=data_analyst_system_message,
-        human_input_mode="NEVER",
-        llm_config=llm_config_lst) # Assuming this contains the necessary tools for data analysis
-
-    data_analyst.register_function(function_map=function_map)
-
-    print("-------SQL CRITIC Agent-------------")
-    sql_critic_system_message=get_sql_critic_system_message(data_dictionary_prompt)
-    sql_critic = autogen.AssistantAgent(
-        name="sql_critic",
-        system_message=sql_critic_system_message ,
-        human_input_mode="NEVER",
-        llm_config=llm_config_common
-    )
-
-    print("-------SQL Executor Agent-------------")
-    sql_query_executor_system_message=get_sql_query_executor_system_message()
-    sql_query_executor = SQLExecutorAgent(
-        name="sql_query_executor",
-        system_message=sql_query_executor_system_message,
-        human_input_mode="NEVER",
-        llm_config=llm_config_common
-    )
-
-    print("-------INSHIGHTS GENERATOR Agent-------------")
-    insights_generator_system_message=get_insights_generator_system_message()
-    insights_generator = autogen.AssistantAgent(
-        name="insights_generator",
-        system_message=insights_generator_system_message,
-        human_input_mode="NEVER",
-        llm_config=llm_config_common
+    A crew is expensive to build (system prompts embed the whole data dictionary), so it is
+    built once by the `AgentPool` and `reset()` between questions instead of being rebuilt.
+    """
+
+    def __init__(self, data_dictionary_prompt, tools, function_map) -> None:
+        llm_config,llm_config_lst,llm_config_common=get_llm_configs(tools)
+
+        print("-------USER PROXY AGENT-------------")
+        self.user_proxy = autogen.UserProxyAgent(
+            name="user_proxy",
+            system_message="A human admin. Once the task is completed, answer 'TERMINATE-AGENT'",
+            human_input_mode="NEVER",
+            code_execution_config=False
+        )
+
+        print("-------PLANNER AGENT-------------")
+        planner_system_message=get_planner_system_message(data_dictionary_prompt)
+        self.planner = autogen.AssistantAgent(
+            name="planner",
+            system_message=planner_system_message ,
+            human_input_mode="NEVER",
+            llm_config=llm_config_common
         )
 
-    print("-------Terminator Agent-------------")
-    terminator_system_message = f"""
+        print("-------Data Analyst Agent-------------")
+        data_analyst_system_message=get_data_analyst_system_message(data_dictionary_prompt)
+        self.data_analyst = autogen.AssistantAgent(
+            name="data_analyst",
+            system_message=data_analyst_system_message,
+            human_input_mode="NEVER",
+            llm_config=llm_config_lst) # Assuming this contains the necessary tools for data analysis
+
+        self.data_analyst.register_function(function_map=function_map)
+
+        print("-------SQL CRITIC Agent-------------")
+        sql_critic_system_message=get_sql_critic_system_message(data_dictionary_prompt)
+        self.sql_critic = autogen.AssistantAgent(
+            name="sql_critic",
+            system_message=sql_critic_system_message ,
+            human_input_mode="NEVER",
+            llm_config=llm_config_common
+        )
+
+        print("-------SQL Executor Agent-------------")
+        sql_query_executor_system_message=get_sql_query_executor_system_message()
+        self.sql_query_executor = SQLExecutorAgent(
+            name="sql_query_executor",
+            system_message=sql_query_executor_system_message,
+            human_input_mode="NEVER",
+            llm_config=llm_config_common
+        )
+
+        print("-------INSHIGHTS GENERATOR Agent-------------")
+        insights_generator_system_message=get_insights_generator_system_message()
+        self.insights_generator = autogen.AssistantAgent(
+            name="insights_generator",
+            system_message=insights_generator_system_message,
+            human_input_mode="NEVER",
+            llm_config=llm_config_common
+            )
+
+        print("-------Terminator Agent-------------")
+        terminator_system_message = f"""
 
 You need to answer with 'max-3-tries'. Do NOT add any introductory phrase or do NOT explain anything else.
 
 """
-    terminator = autogen.AssistantAgent(
-        name="terminator",
-        system_message=terminator_system_message,
-        human_input_mode="NEVER",
-        llm_config=llm_config_common
-    )
-
-    def state_transition(last_speaker, groupchat):
+        self.terminator = autogen.AssistantAgent(
+            name="terminator",
+            system_message=terminator_system_message,
+            human_input_mode="NEVER",
+            llm_config=llm_config_common
+        )
+
+        self.agents=[self.user_proxy,self.planner,self.data_analyst,self.sql_critic,self.sql_query_executor,self.insights_generator,self.terminator]
+
+        # Each LLM call only carries the part of the group chat the agent needs, see MessageCompactor.
+        # The executor is left out, it reads the analyst / critic messages by position.
+        self.compactors={}
+        if COMPACTION_ENABLED:
+            for agent in [self.planner,self.data_analyst,self.sql_critic,self.insights_generator,self.terminator]:
+                self.compactors[agent.name]=MessageCompactor(agent.name)
+                TransformMessages(transforms=[self.compactors[agent.name]],verbose=False).add_to_agent(agent)
+
+        #group chat is required to let all the agents interact with each other 
+        self.groupchat = autogen.GroupChat(
+            agents=self.agents,   
+            messages=[],                        
+            max_round=50,                         
+            speaker_selection_method=self.select_speaker
+        )
+        # Initialize the GroupChatManager with the GroupChat
+        manager_system_message = """You are the manager. You are responsible for the task to be executed correctly by every agent. You need to provide a final summary / answer to the user query as response by looking into the answers of all agents.
+        Project flow:
+        1. data_analyst will understand the user query, look into the database, frame SQL query and return it
+        2. user_proxy will check if the process is done properly"""
+
+        self.manager = autogen.GroupChatManager(
+            groupchat=self.groupchat,
+            llm_config=llm_config,
+            system_message=manager_system_message                                 
+        )
+        # SQL explanation started as soon as the critic approves a query, see start_speculative_explanation
+        self.speculative_explanation=None
+        # "fast" skips planner and critic (see classify_question), "full" runs the whole chain
+        self.lane="full"
+        # Usage of a failed fast-lane attempt, see fall_back_to_full_chain
+        self.carried_usage=None
+        # Data dictionary currently embedded in the planner, analyst and critic prompts, see apply_data_dictionary
+        self.full_data_dictionary_prompt=data_dictionary_prompt
+        self.data_dictionary_prompt=data_dictionary_prompt
+        self.full_prompt_tokens=None
+        # Progress and streamed insights of the current question for the UI, see StreamChannel
+        self.stream_channel=None
+        self.insights_generator.register_reply([Agent, None], self.a_stream_insights_reply, ignore_async_in_sync_chat=True)
+
+    def reset(self):
+        """Clear every agent's history, the group chat messages and the last SQL execution response."""
+        for agent in self.agents:
+            agent.reset()
+        self.groupchat.reset()
+        self.manager.reset()
+        self.sql_query_executor.response=None
+        for compactor in self.compactors.values():
+            compactor.reset()
+        self.lane="full"
+        self.carried_usage=None
+        self.stream_channel=None
+        speculative=self.take_speculative_explanation()
+        if speculative is not None:
+            speculative["task"].cancel()
+
+    def dictionary_prompts(self, data_dictionary_prompt):
+        """System messages of the agents that embed the data dictionary."""
+        return {self.planner:get_planner_system_message(data_dictionary_prompt),
+                self.data_analyst:get_data_analyst_system_message(data_dictionary_prompt),
+                self.sql_critic:get_sql_critic_system_message(data_dictionary_prompt)}
+
+    def apply_data_dictionary(self, data_dictionary_prompt):
+        """
+        Embed a (possibly pruned) data dictionary in the planner, analyst and critic system messages.
+
+        Returns:
+            dict: Per agent, the system message tokens with the full dictionary (`full`) and with this one (`used`).
+        """
+        if self.full_prompt_tokens is None:
+            self.full_prompt_tokens={agent.name:count_tokens(message) for agent,message in self.dictionary_prompts(self.full_data_dictionary_prompt).items()}
+        prompts=self.dictionary_prompts(data_dictionary_prompt)
+        if data_dictionary_prompt!=self.data_dictionary_prompt:
+            for agent,message in prompts.items():
+                agent.update_system_message(message)
+            self.data_dictionary_prompt=data_dictionary_prompt
+        if data_dictionary_prompt==self.full_data_dictionary_prompt:
+            return {name:{"full":tokens,"used":tokens} for name,tokens in self.full_prompt_tokens.items()}
+        return {agent.name:{"full":self.full_prompt_tokens[agent.name],"used":count_tokens(message)} for agent,message in prompts.items()}
+
+    def compaction_stats(self):
+        """Per agent, the history tokens and messages before and after compaction over this question's LLM calls."""
+        return {name:dict(compactor.stats) for name,compactor in self.compactors.items()}
+
+    def fast_lane_succeeded(self):
+        """The fast lane answered if the executor ran the analyst's query and it returned rows."""
+        response=self.sql_query_executor.response
+        return response is not None and response.get("data_size_flag") in ("within-limit","exceeding-limit","one-limit")
+
+    def fall_back_to_full_chain(self):
+        """Reset the crew after a failed fast-lane attempt, keeping its token usage, and switch to the full chain."""
+        usage=self.get_usage()
+        self.reset()
+        self.carried_usage=usage
+
+    def llm_clients(self):
+        """The OpenAIWrapper of every agent of the crew that calls the LLM."""
+        return [agent.client for agent in self.agents+[self.manager] if getattr(agent,"client",None) is not None]
+
+    def get_usage(self):
+        """
+        Token usage of every LLM call made by the crew since its last reset, summed over models.
+
+        Each agent's OpenAIWrapper accumulates usage as its completions return (cache hits included,
+        like the runtime log) and `reset()` clears it, so no log query is needed per question.
+        """
+        usage=dict(self.carried_usage or {"prompt_tokens":0,"completion_tokens":0,"total_tokens":0})
+        for client in self.llm_clients():
+            for model,model_usage in (client.total_usage_summary or {}).items():
+                if model=="total_cost":
+                    continue
+                for key in usage:
+                    usage[key]+=model_usage.get(key) or 0
+        return usage
+
+    def select_speaker(self, last_speaker, groupchat):
+        """Next speaker from `state_transition`, reported to the stream channel as the current stage."""
+        speaker=self.state_transition(last_speaker, groupchat)
+        if speaker is not None and self.stream_channel is not None:
+            self.stream_channel.stage(speaker.name)
+        return speaker
+
+    async def a_stream_insights_reply(self, recipient, messages=None, sender=None, config=None):
+        """Reply of the insights generator (`recipient`) with its completion streamed to the stream channel."""
+        if self.stream_channel is None:
+            return False,None
+        with IOStream.set_default(ChannelStream(self.stream_channel)):
+            return await recipient.a_generate_oai_reply(messages, sender)
+
+    def start_speculative_explanation(self, sql_query):
+        """
+        Start explaining the approved SQL in the background while the executor and insights generator run.
+
+        The query is final once the critic answers ALL-GOOD, so `get_agent_chat_summary` can usually reuse
+        the explanation instead of requesting it after the chat. Only possible in an async chat.
+        """
+        if not sql_query:
+            return
+        try:
+            loop=asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self.speculative_explanation is not None:
+            if self.speculative_explanation["sql_query"]==sql_query:
+                return
+            self.speculative_explanation["task"].cancel()
+        print("Speculative SQL explanation started")
+        self.speculative_explanation={"sql_query":sql_query,"task":loop.create_task(sql_explanation(sql_query))}
+
+    def take_speculative_explanation(self):
+        """Hand the running speculative explanation over to the caller (None if there is none)."""
+        speculative=self.speculative_explanation
+        self.speculative_explanation=None
+        return speculative
+
+    def state_transition(self, last_speaker, groupchat):
         '''Function to define a structured navigation of agents in the flow.'''
+        user_proxy=self.user_proxy
+        planner=self.planner
+        data_analyst=self.data_analyst
+        sql_critic=self.sql_critic
+        sql_query_executor=self.sql_query_executor
+        insights_generator=self.insights_generator
+        terminator=self.terminator
+
         messages = groupchat.messages
         last_message = messages[-1]
         
@@ -407,6 +628,9 @@ You need to answer with 'max-3-tries'. Do NOT add any introductory phrase or do
         if last_speaker is user_proxy:
             # init -> retrieve
             if len(messages) == 1:
+                if self.lane=="fast":
+                    # Simple question, no planning needed
+                    return data_analyst
                 text=f'Last Speaker Name: {last_speaker.name} :: Current Speaker Name: Planner Start'
             
                 return planner # planner data_analyst
@@ -428,6 +652,10 @@ You need to answer with 'max-3-tries'. Do NOT add any introductory phrase or do
 
         elif last_speaker is data_analyst:
             if 'terminate-agent' in messages[-1]["content"].lower():
+                if self.lane=="fast":
+                    # No critic review, the query is run as validated by the analyst's tools
+                    self.start_speculative_explanation(SQLExecutorAgent.extract_clean_sql(messages[-1]["content"]))
+                    return sql_query_executor
                 # retrieve --(execution failed)--> retrieve
                 text=f'Last Speaker Name: {last_speaker.name} :: Current Speaker Name: sql_critic Start'
                 
@@ -441,6 +669,8 @@ You need to answer with 'max-3-tries'. Do NOT add any introductory phrase or do
 
         elif last_speaker is sql_critic:
             if 'all-good' in messages[-1]["content"].lower():
+                # The SQL the executor will run is fixed now, explain it while the rest of the chat runs
+                self.start_speculative_explanation(SQLExecutorAgent.extract_clean_sql(messages[-2]["content"]))
                 # retrieve --(execution failed)--> retrieve
                 text=f'Last Speaker Name: {last_speaker.name} :: Current Speaker Name:sql_query_executor Start'
             
@@ -464,6 +694,8 @@ You need to answer with 'max-3-tries'. Do NOT add any introductory phrase or do
                 data_size_flag = "zero-limit"
             if "one-limit" in last_message.get('content'):
                 data_size_flag = "one-limit"
+            if "rejected-plan" in last_message.get('content'):
+                data_size_flag = "rejected-plan"
 
             print("THE RESPONSE IS ",sql_query_executor.response)
 
@@ -484,6 +716,13 @@ You need to answer with 'max-3-tries'. Do NOT add any introductory phrase or do
             
             elif data_size_flag == "one-limit":
                 return terminator
+
+            elif data_size_flag == "rejected-plan":
+                # The analyst rewrites the query with the plan's reason, unless it was already rejected too often
+                rejections = sum(1 for entry in messages if entry.get('name') == 'sql_query_executor' and "rejected-plan" in entry.get('content'))
+                if rejections >= 3:
+                    return terminator
+                return data_analyst
                 
             else:
                 text=f'Last Speaker Name: {last_speaker.name} :: Current Speaker Name:user_proxy Start'
@@ -504,45 +743,190 @@ You need to answer with 'max-3-tries'. Do NOT add any introductory phrase or do
         
             return None
 
-    #group chat is required to let all the agents interact with each other 
-    groupchat = autogen.GroupChat(
-        agents=[user_proxy,planner,data_analyst,sql_critic,sql_query_executor,insights_generator,terminator],   
-        messages=[],                        
-        max_round=50,                         
-        speaker_selection_method=state_transition
-    )
-    # Initialize the GroupChatManager with the GroupChat
-    manager_system_message = """You are the manager. You are responsible for the task to be executed correctly by every agent. You need to provide a final summary / answer to the user query as response by looking into the answers of all agents.
-    Project flow:
-    1. data_analyst will understand the user query, look into the database, frame SQL query and return it
-    2. user_proxy will check if the process is done properly"""
-
-    manager = autogen.GroupChatManager(
-        groupchat=groupchat,
-        llm_config=llm_config,
-        system_message=manager_system_message                                 
-    )
-    agent_i_end_time=time.time()
-    agent_i_time=agent_i_end_time-agent_i_start_time
-    logging_session_id = autogen.runtime_logging.start(config={"dbname": "logs.db"})
+
+class AgentPool():
+    """
+    Process-wide pool of `AgentCrew` objects shared by every user session.
+
+    Tools, LLM clients and crews are built once per dataset version (and data dictionary prompt)
+    and handed out one question at a time. A crew is reset when it is returned, and the whole
+    pool is discarded as soon as a new dataset is loaded.
+    """
+
+    def __init__(self, max_idle_crews=None) -> None:
+        self.max_idle_crews=int(max_idle_crews or os.getenv("agent_pool_size") or 4)
+        self._lock=threading.Lock()
+        self._key=None
+        self._tools=None
+        self._idle_crews=[]
+
+    def _get_key(self, data_dictionary_prompt):
+        prompt_hash=hashlib.sha256(data_dictionary_prompt.encode("utf-8")).hexdigest()
+        return (get_dataset_version(),prompt_hash)
+
+    def _refresh(self, key):
+        """Drop tools and crews built for an older dataset version. Must be called with the lock held."""
+        if key!=self._key:
+            print("Agent Pool :: New dataset version, discarding",len(self._idle_crews),"idle crews")
+            self._key=key
+            self._tools=None
+            self._idle_crews=[]
+
+    def checkout(self, data_dictionary_prompt):
+        """
+        Hand out an idle crew for the current dataset version, building one only if none is idle.
+
+        Returns:
+            tuple: (crew, key, tool_time, agent_i_time) where the times are the seconds spent
+                   building tools and agents for this checkout (near zero on a warm pool).
+        """
+        key=self._get_key(data_dictionary_prompt)
+        tool_time=0.0
+        agent_i_time=0.0
+        with self._lock:
+            self._refresh(key)
+            if self._tools is None:
+                print("Step 2) -------Tool initialization-------------")
+                tool_start_time=time.time()
+                tools,function_map=SQLToolkit().initialize_tools()
+                # Tools are awaited by the async chat and run on worker threads
+                self._tools=(tools,to_async_tools(function_map))
+                tool_time=time.time()-tool_start_time
+                print("---------Tools initialized---------")
+            tools,function_map=self._tools
+            crew=self._idle_crews.pop() if self._idle_crews else None
+
+        if crew is None:
+            print("-------Building new agent crew-------------")
+            agent_i_start_time=time.time()
+            crew=AgentCrew(data_dictionary_prompt,tools,function_map)
+            agent_i_time=time.time()-agent_i_start_time
+        else:
+            print("-------Reusing pooled agent crew-------------")
+        return crew,key,tool_time,agent_i_time
+
+    def checkin(self, crew, key):
+        """Reset a crew and keep it for the next question if it still matches the current dataset."""
+        crew.reset()
+        with self._lock:
+            if key==self._key and len(self._idle_crews)<self.max_idle_crews:
+                self._idle_crews.append(crew)
+
+    def clear(self):
+        """Discard every pooled crew and tool, e.g. after a new dataset has been ingested."""
+        with self._lock:
+            self._key=None
+            self._tools=None
+            self._idle_crews=[]
+
+
+agent_pool=AgentPool()
+
+
+def prune_data_dictionary(user_question, data_dictionary_prompt, schema_json, linked_values):
+    """
+    Render the data dictionary prompt restricted to the columns relevant to the question, see `SchemaPruner`.
+
+    Returns:
+        tuple: (data dictionary prompt for this question, pruning report). The full prompt is returned when
+               no schema is available, pruning fails or its confidence is too low.
+    """
+    if schema_json is None:
+        return data_dictionary_prompt,{"pruned":False}
+    try:
+        pruned_schema,report=get_schema_pruner(schema_json).prune(user_question,linked_values)
+    except Exception as e:
+        print("Schema Pruning :: Failed, using the full schema ::",e)
+        return data_dictionary_prompt,{"pruned":False}
+    if pruned_schema is None:
+        return data_dictionary_prompt,report
+    return DataDictionaryPrompt.render_prompt(pruned_schema),report
+
+
+def pruning_savings(report, prompt_tokens, chat_history):
+    """Add the system prompt tokens saved per agent, per call and over the agent's calls in this chat, to the report."""
+    calls={}
+    for message in chat_history:
+        calls[message.get("name")]=calls.get(message.get("name"),0)+1
+    report["agents"]={name:{**tokens,"saved_per_call":tokens["full"]-tokens["used"],"calls":calls.get(name,0),
+                            "saved":(tokens["full"]-tokens["used"])*calls.get(name,0)}
+                      for name,tokens in prompt_tokens.items()}
+    report["saved_tokens"]=sum(agent["saved"] for agent in report["agents"].values())
+    return report
+
+
+async def initiate_chat(user_question,data_dictionary_prompt,linked=None,schema_json=None,stream_channel=None):
+    # Resolve categorical values mentioned in the question locally, so the analyst can skip distinct-value lookups
+    entity_link_start_time=time.time()
+    linked_values,linked_context=linked if linked is not None else await asyncio.to_thread(link_question,user_question)
+    entity_link_time=time.time()-entity_link_start_time
+    print("Linked filter values ::",linked_values)
+    message=user_question if linked_context=="" else f"{user_question}\n\n{linked_context}"
+
+    lane,lane_reason=classify_question(user_question,linked_values)
+    print("Lane ::",lane,"::",lane_reason)
+
+    crew,pool_key,tool_time,agent_i_time=await asyncio.to_thread(agent_pool.checkout,data_dictionary_prompt)
+    # Only the columns relevant to the question are embedded in the planner, analyst and critic prompts
+    pruning_start_time=time.time()
+    question_dictionary_prompt,pruning_report=await asyncio.to_thread(prune_data_dictionary,user_question,data_dictionary_prompt,schema_json,linked_values)
+    prompt_tokens=await asyncio.to_thread(crew.apply_data_dictionary,question_dictionary_prompt)
+    schema_pruning_time=time.time()-pruning_start_time
+    print("Schema Pruning ::",pruning_report)
+    crew.stream_channel=stream_channel
+    # The crew's completions are logged under this question's session id by the process wide runtime logger
+    llm_clients=crew.llm_clients()
+    logging_session_id = runtime_logger.start_session(llm_clients)
     print("Logging session ID: " + str(logging_session_id))
     try:
         agent_call_start_time=time.time()
-        result=user_proxy.initiate_chat(manager, 
-                            message=user_question)  
+        result=None
+        if lane=="fast":
+            crew.lane="fast"
+            try:
+                result=await crew.user_proxy.a_initiate_chat(crew.manager, 
+                                    message=message)
+            except Exception as e:
+                print("Exception In Fast Lane ::",e)
+            if result is None or not crew.fast_lane_succeeded():
+                print("Fast lane failed, falling back to the full chain")
+                crew.fall_back_to_full_chain()
+                lane="fallback"
+                # The pruned schema may be what the fast lane missed
+                prompt_tokens=crew.apply_data_dictionary(data_dictionary_prompt)
+                pruning_report["pruned"]=False
+                crew.stream_channel=stream_channel
+                result=None
+        if result is None:
+            result=await crew.user_proxy.a_initiate_chat(crew.manager, 
+                                message=message)  
         agent_call_end_time=time.time()
         agent_call=agent_call_end_time-agent_call_start_time
         inf_time={"tool_time":tool_time,
                 "agent_i_time":agent_i_time,
-                "agent_call":agent_call}
+                "entity_link_time":entity_link_time,
+                "schema_pruning_time":schema_pruning_time,
+                "agent_call":agent_call,
+                # Prompt tokens saved by schema pruning (not a timing, skipped by total_time)
+                "schema_pruning":pruning_savings(pruning_report,prompt_tokens,result.chat_history),
+                "message_compaction":crew.compaction_stats()}
         response={"chat_history":result.chat_history,
-            "sql_execution_response":sql_query_executor.response,
+            "sql_execution_response":crew.sql_query_executor.response,
+            "sql_explanation_task":crew.take_speculative_explanation(),
+            "agent_usage":crew.get_usage(),
+            "lane":lane,
             "message":"ok"} 
         return response,logging_session_id,inf_time
     except Exception as e:
         print("Exception At Agent Initiate ::",e)
-        response={"chat_history":result.chat_history,
-            "sql_execution_response":sql_query_executor.response,
+        response={"chat_history":list(crew.groupchat.messages),
+            "sql_execution_response":crew.sql_query_executor.response,
+            "sql_explanation_task":crew.take_speculative_explanation(),
+            "agent_usage":crew.get_usage(),
+            "lane":lane,
             "message":"ok"}
         inf_time={}
         return response,logging_session_id,inf_time
+    finally:
+        runtime_logger.end_session(llm_clients)
+        agent_pool.checkin(crew,pool_key)
@@ -0,0 +1,203 @@
+import json
+import re
+import numpy as np
+import pandas as pd
+
+
+# Chart hints the insights generator may return, see `get_insights_generator_system_message`
+CHART_HINTS=["line","bar","pie","grouped_bar","dual_axis","none"]
+
+# Dimension columns that hold periods even when they are stored as numbers (e.g. Year = 2023)
+PERIOD_COLUMN=re.compile(r"(date|month|year|quarter|week|period)", re.I)
+PERIOD_VALUE=re.compile(r"^\d{4}(-\d{2}(-\d{2})?)?$|^\d{4}[- ]?Q[1-4]$|^Q[1-4][- ]?\d{4}$", re.I)
+SHARE_WORDS=re.compile(r"\b(share|proportion|percentage|percent|distribution|breakdown|split|mix|contribution)\b", re.I)
+
+MAX_PIE_SLICES=8
+MAX_SERIES=8
+# Two metrics are drawn on separate axes when their scales differ more than this
+DUAL_AXIS_RATIO=10
+
+
+def format_number(value):
+    """Format a number for data labels, e.g. 1534 -> 1.5K, 2300000 -> 2.3M."""
+    if value is None or (isinstance(value,float) and np.isnan(value)):
+        return "-"
+    for limit,suffix in [(1e9,"B"),(1e6,"M"),(1e3,"K")]:
+        if abs(value)>=limit:
+            return f"{value/limit:.1f}{suffix}"
+    return f"{value:.2f}".rstrip("0").rstrip(".") if isinstance(value,float) else str(value)
+
+
+def _label(column):
+    return str(column).replace("_"," ")
+
+
+def _is_period(series):
+    if PERIOD_COLUMN.search(str(series.name)):
+        return True
+    if pd.api.types.is_numeric_dtype(series):
+        return False
+    values=series.dropna().astype(str)
+    return len(values)>0 and values.map(lambda value: bool(PERIOD_VALUE.match(value.strip()))).all()
+
+
+def classify_columns(df):
+    """
+    Splits the result columns into (period columns, category columns, metric columns).
+
+    Numeric columns are metrics unless they hold periods (Year, Month number, ...), which are dimensions.
+    """
+    periods,categories,metrics=[],[],[]
+    for column in df.columns:
+        series=df[column]
+        if _is_period(series):
+            periods.append(column)
+        elif pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            metrics.append(column)
+        else:
+            categories.append(column)
+    return periods,categories,metrics
+
+
+def _axis_values(series):
+    # Numeric-like periods stay categorical, so Plotly does not draw 2020.5 between years
+    return series.fillna("-").astype(str).tolist()
+
+
+def _metric_values(series):
+    return [None if pd.isna(value) else (value.item() if hasattr(value,"item") else value) for value in series]
+
+
+def _bar(x, values, name, **kwargs):
+    return {"type":"bar","x":x,"y":values,"name":name,"text":[format_number(value) for value in values],
+            "textposition":"outside","hovertemplate":"%{x}<br>"+name+": %{y:,}<extra></extra>",**kwargs}
+
+
+def _line(x, values, name, **kwargs):
+    return {"type":"scatter","mode":"lines+markers+text","x":x,"y":values,"name":name,
+            "text":[format_number(value) for value in values],"textposition":"top center",
+            "hovertemplate":"%{x}<br>"+name+": %{y:,}<extra></extra>",**kwargs}
+
+
+def _layout(title, x_title=None, y_title=None, **kwargs):
+    layout={"title":{"text":title},
+            "legend":{"orientation":"h","x":0.5,"xanchor":"center","y":1.12},
+            "margin":{"t":90,"l":60,"r":60,"b":60}}
+    if x_title is not None:
+        layout["xaxis"]={"title":{"text":x_title},"type":"category"}
+    if y_title is not None:
+        layout["yaxis"]={"title":{"text":y_title},"tickformat":"~s"}
+    layout.update(kwargs)
+    return layout
+
+
+def _choose_kind(df, question, hint, periods, categories, metrics):
+    """Pick the chart kind for the shape of the result; a valid hint wins when the shape supports it."""
+    dimensions=periods+categories
+    if not metrics or not dimensions or len(df)<2:
+        return None
+    non_negative=(df[metrics[0]].fillna(0)>=0).all()
+    supported={"bar"}
+    if periods:
+        supported.add("line")
+    if len(metrics)>=2:
+        supported|={"grouped_bar","dual_axis"}
+    if len(dimensions)==1 and len(metrics)==1 and len(df)<=MAX_PIE_SLICES and non_negative:
+        supported.add("pie")
+    if hint=="none":
+        return None
+    if hint in supported:
+        return hint
+    if periods:
+        if len(metrics)>=2:
+            return "dual_axis"
+        return "line"
+    if "pie" in supported and SHARE_WORDS.search(question or ""):
+        return "pie"
+    if len(metrics)>=2:
+        return "grouped_bar"
+    return "bar"
+
+
+def build_chart(df, question="", hint=None):
+    """
+    Builds the Plotly figure of a query result locally, from the dtypes and cardinality of its columns.
+
+    Supported shapes:
+        - time series: a period column and one or more metrics (one line per category when the result also
+          has a category column with few values); two metrics of different scale get a secondary axis.
+        - category ranking: one category and one metric, as bars in descending order.
+        - share of total: one dimension and one non-negative metric with few rows, as a pie when the
+          question asks for a share / distribution or the hint says so.
+        - two-metric comparison: one dimension and several metrics, as grouped bars.
+
+    Args:
+        df (pandas.DataFrame | str): The result, or its JSON records as returned by the executor.
+        question (str, optional): The user question, used to recognize share-of-total questions.
+        hint (str, optional): Chart type suggested by the insights generator, one of `CHART_HINTS`.
+
+    Returns:
+        dict | str: `{"data": [traces], "layout": layout}` of plain Python values, or "" when the
+                    result has no chartable shape.
+    """
+    if isinstance(df,str):
+        if df=="":
+            return ""
+        df=pd.DataFrame(json.loads(df))
+    if df is None or df.empty:
+        return ""
+    hint=str(hint).strip().lower() if hint else None
+    periods,categories,metrics=classify_columns(df)
+    kind=_choose_kind(df, question, hint, periods, categories, metrics)
+    if kind is None:
+        return ""
+    if kind in ("grouped_bar","dual_axis"):
+        metrics=metrics[:2]
+    elif kind!="line":
+        metrics=metrics[:1]
+    metric=metrics[0]
+    title=f"{_label(metric)}" + (f" vs {_label(metrics[1])}" if len(metrics)==2 and kind in ("grouped_bar","dual_axis") else "")
+
+    if periods and kind in ("line","dual_axis","bar","grouped_bar"):
+        x_column=periods[0]
+        df=df.sort_values(x_column, kind="stable")
+        series_column=categories[0] if categories and df[categories[0]].nunique()<=MAX_SERIES and len(metrics)==1 else None
+        title+=f" by {_label(x_column)}"
+        if series_column is not None and kind in ("line","bar"):
+            make=_line if kind=="line" else _bar
+            data=[make(_axis_values(group[x_column]), _metric_values(group[metric]), str(name))
+                  for name,group in df.groupby(series_column, sort=False)]
+            return {"data":data,"layout":_layout(f"{title} and {_label(series_column)}", _label(x_column), _label(metric))}
+        x=_axis_values(df[x_column])
+    else:
+        x_column=(categories+periods)[0]
+        if kind=="bar":
+            df=df.sort_values(metric, ascending=False, kind="stable")
+        x=_axis_values(df[x_column])
+        title+=f" by {_label(x_column)}"
+
+    if kind=="pie":
+        return {"data":[{"type":"pie","labels":x,"values":_metric_values(df[metric]),"textinfo":"label+percent",
+                         "hovertemplate":"%{label}<br>"+_label(metric)+": %{value:,}<extra></extra>"}],
+                "layout":_layout(f"Share of {title}")}
+    if kind=="line":
+        data=[_line(x, _metric_values(df[column]), _label(column)) for column in metrics]
+        return {"data":data,"layout":_layout(title, _label(x_column), _label(metric) if len(metrics)==1 else "Value")}
+    if kind=="bar":
+        return {"data":[_bar(x, _metric_values(df[metric]), _label(metric))],"layout":_layout(title, _label(x_column), _label(metric))}
+
+    second=metrics[1]
+    scales=[df[column].abs().max() for column in metrics]
+    separate_axes=kind=="dual_axis" or (min(scales)>0 and max(scales)/min(scales)>DUAL_AXIS_RATIO)
+    make=_line if periods and kind=="dual_axis" else _bar
+    if separate_axes:
+        data=[make(x, _metric_values(df[metric]), _label(metric)),
+              make(x, _metric_values(df[second]), _label(second), yaxis="y2")]
+        if make is _bar:
+            data[0]["offsetgroup"]=0
+            data[1]["offsetgroup"]=1
+        layout=_layout(title, _label(x_column), _label(metric), barmode="group",
+                       yaxis2={"title":{"text":_label(second)},"overlaying":"y","side":"right","tickformat":"~s"})
+        return {"data":data,"layout":layout}
+    data=[make(x, _metric_values(df[column]), _label(column)) for column in metrics]
+    return {"data":data,"layout":_layout(title, _label(x_column), "Value", barmode="group")}
@@ -1,5 +1,5 @@
 import os
-import sqlite3
+import asyncio
 import pandas as pd
 import json
 import ast
@@ -10,6 +10,18 @@ import streamlit as st
 from utility.logs import *
 from utility.api_calls import *
 import time
+import numpy as np
+from utility.db_pool import connect_rw,get_connection,get_dataset_version,read_only_pool
+from utility.distinct_index import build_distinct_index
+from utility.table_indexes import analyze_tables,build_table_indexes
+from utility.rollups import build_rollups
+from utility.execution_backend import EXECUTION_BACKEND,duckdb_backend,export_parquet
+from utility.entity_linker import get_entity_linker
+from utility.dataset_meta import (DatasetHasher,extend_fingerprint,get_dataset_fingerprint,hash_file,
+                                  is_file_ingested,load_prompt_artifacts,record_ingested_file,save_prompt_artifacts,
+                                  set_dataset_fingerprint)
+from utility.query_cache import normalize_sql,query_result_cache
+from utility.charts import build_chart
 
 
 load_dotenv()
@@ -28,31 +40,19 @@ class DataDictionaryPrompt():
             # Load the Excel sheet into a pandas DataFrame
             df = pd.read_excel(self.dict_file_path, sheet_name=self.dict_sheet_name)
 
-            # Create an in-memory SQLite database
-            # conn = sqlite3.connect(":memory:")
-            conn = sqlite3.connect("database.db")
-
-            # Load the DataFrame into the SQLite database
-            df.to_sql("dict_data", conn, index=False, if_exists="replace")
-            
-            query="select * from dict_data"
-
-            # Execute the SQL query
-            df1 = pd.read_sql_query(query, conn)
+            # Missing descriptions are rendered as None, as they were when read back from SQLite
+            df1 = df.astype(object).where(pd.notnull(df), None)
             data_dict=df1.to_dict(orient="records")
-            return data_dict  # Return the DataFrame with query results
+            return data_dict
             
         except Exception as e:
-            print("SQL query didn't work due to:", e)
+            print("Data Dictionary Prompt :: Reading the data dictionary failed due to:", e)
             return None
-        finally:
-            # Close the database connection
-            conn.close()
 
     def __get_top3(self):
         try:
-            # Load an SQLite database
-            conn = sqlite3.connect("database.db")
+            # Read-only connection from the shared pool
+            conn = get_connection()
             
             query="""select * from midb_table WHERE Title IS NOT NULL
   AND Franchise IS NOT NULL
@@ -94,9 +94,6 @@ class DataDictionaryPrompt():
         except Exception as e:
             print("Data Dictionary Prompt :: SQL query didn't work due to:", e)
             return None
-        finally:
-            # Close the database connection
-            conn.close()
 
     def __get_table_details_with_columns(self):
         column_details=self.__get_data_dict()
@@ -127,8 +124,62 @@ Use Release Date Month for questions focused on the game’s initial release and
         
         return json.dumps(result),date_range
 
-    def get_prompt(self):
+    def __get_dict_mtime(self):
+        return os.path.getmtime(self.dict_file_path)
+
+    def build_artifacts(self):
+        """
+        Renders the data dictionary prompt and computes the sample rows and date range of the current
+        dataset, then stores them in the metadata store. Called once at ingest.
+
+        Returns:
+            tuple: (data_dictionary_prompt, date_range)
+        """
         data_dictionary,date_range=self.__get_table_details_with_columns()
+        data_dictionary_prompt=self.render_prompt(data_dictionary)
+        save_prompt_artifacts(get_dataset_version(),self.__get_dict_mtime(),data_dictionary_prompt,data_dictionary,date_range)
+        print("Data Dictionary Prompt :: Artifacts stored")
+        return data_dictionary_prompt,date_range
+
+    def update_artifacts(self, previous_fingerprint, months):
+        """
+        Carries the artifacts of the previous dataset over to the current one after rows for new months
+        were appended, widening the date range with the new months instead of querying the table again.
+        Falls back to `build_artifacts` when the previous artifacts are not available.
+
+        Args:
+            previous_fingerprint (str): Fingerprint of the dataset before the append.
+            months (list): `Processing_Date_Month` values (YYYY-MM-DD) of the appended rows.
+
+        Returns:
+            tuple: (data_dictionary_prompt, date_range)
+        """
+        artifacts=load_prompt_artifacts(previous_fingerprint,self.__get_dict_mtime())
+        if artifacts is None or not months:
+            return self.build_artifacts()
+        old_range=artifacts["date_range"]
+        date_range={"Max_date":max([date for date in [old_range["Max_date"],*months] if date is not None]),
+                    "Min_date":min([date for date in [old_range["Min_date"],*months] if date is not None])}
+        save_prompt_artifacts(get_dataset_version(),self.__get_dict_mtime(),artifacts["prompt"],artifacts["schema_json"],date_range)
+        print("----------------------Date Range--------------------------")
+        print(date_range)
+        return artifacts["prompt"],date_range
+
+    def get_artifacts(self):
+        """Load the ingest-time artifacts of the current dataset, building them if they are missing or the dictionary file changed."""
+        artifacts=load_prompt_artifacts(get_dataset_version(),self.__get_dict_mtime())
+        if artifacts is None:
+            print("Data Dictionary Prompt :: No stored artifacts, building them")
+            self.build_artifacts()
+            artifacts=load_prompt_artifacts(get_dataset_version(),self.__get_dict_mtime())
+        return artifacts
+
+    def get_prompt(self):
+        artifacts=self.get_artifacts()
+        return artifacts["prompt"],artifacts["date_range"]
+
+    @staticmethod
+    def render_prompt(data_dictionary):
         data_dictionary_prompt = ''
         for table in json.loads(data_dictionary):
             data_dictionary_prompt += f"Table Name:{table['table_name']}\nTable Description:{table['table_desc']}"
@@ -138,106 +189,7 @@ Use Release Date Month for questions focused on the game’s initial release and
             data_dictionary_prompt += f"""\n/* \n3 rows from {table['table_name']} table:\n"""
             data_dictionary_prompt+=table['top-3']
             data_dictionary_prompt += "*/ \n\n"
-        return data_dictionary_prompt,date_range
-
-
-def extract_plotly_components(js_code):
-    """
-    Extracts Plotly trace and layout components from a given JavaScript code snippet.
-
-    This function parses JavaScript code to extract Plotly `trace` and `layout` objects, 
-    which are typically used to define a Plotly chart. It converts these components into 
-    Python dictionaries for further use.
-
-    Args:
-        js_code (str): A string containing JavaScript code that defines Plotly charts, 
-                       including `trace` and `layout` objects.
-
-    Returns:
-        dict: A dictionary with the following keys:
-            - `"data"`: A list of dictionaries representing the extracted `trace` objects.
-            - `"layout"`: A dictionary representing the extracted `layout` object, or 
-                          `None` if no layout is found.
-
-    Raises:
-        None: Errors during JSON parsing are caught and logged, but they do not interrupt 
-              the execution.
-
-    Example:
-        js_code = '''
-        ```javascript
-        var trace1 = {
-            x: [1, 2, 3],
-            y: [10, 15, 13],
-            type: 'scatter'
-        };
-
-        var layout = {
-            title: 'Sample Plot',
-            xaxis: { title: 'X-Axis' },
-            yaxis: { title: 'Y-Axis' }
-        };
-        ```
-        '''
-        components = extract_plotly_components(js_code)
-        print(components)
-        # Output:
-        # {
-        #     "data": [
-        #         {"x": [1, 2, 3], "y": [10, 15, 13], "type": "scatter"}
-        #     ],
-        #     "layout": {
-        #         "title": "Sample Plot",
-        #         "xaxis": {"title": "X-Axis"},
-        #         "yaxis": {"title": "Y-Axis"}
-        #     }
-        # }
-
-    Notes:
-        - The input JavaScript code can include multiple `trace` objects and one `layout` object.
-        - The function attempts to convert JavaScript-like syntax into valid JSON before parsing.
-        - Any errors encountered during JSON parsing are logged for debugging.
-    """
-    
-    def js_to_json(js_object):
-        js_object = js_object.replace("'", '"""')
-        js_object = re.sub(r'(\b[a-zA-Z_][a-zA-Z0-9_]*\b):', r'"\1":', js_object)
-        return js_object
-
-    
-    clean_text = js_code.replace("```javascript", "").replace("```", "").replace("`", "")
-
-    # Extract all trace objects
-    trace_matches = re.findall(r"var\s+trace\d+\s*=\s*({[\s\S]*?});", clean_text)
-    traces = []
-    for trace_str in trace_matches:
-        try:
-            trace_json = js_to_json(trace_str)  # Convert to valid JSON
-#             trace_obj = json.loads(trace_json)  # Parse JSON
-            trace_obj=eval(trace_json)
-            traces.append(trace_obj)
-        except json.JSONDecodeError as e:
-            print(f"Error decoding trace: {e}")
-#             print(f"Offending string:\n{trace_str}")
-    
-    # Extract layout object
-    layout_match = re.search(r"var\s+layout\s*=\s*({[\s\S]*?});", clean_text)
-    layout = None
-    if layout_match:
-        try:
-            layout_str = layout_match.group(1)
-            layout_str=layout_str.replace("false","False").replace("true","True")
-            layout_json = js_to_json(layout_str)  # Convert to valid JSON
-#             layout = json.loads(layout_json)  # Parse JSON
-            layout=eval(layout_json)
-        except json.JSONDecodeError as e:
-            print(f"Error decoding layout: {e}")
-            print(f"Offending string:\n{layout_str}")
-
-    # Return extracted components
-    return {
-        "data": traces,
-        "layout": layout}
+        return data_dictionary_prompt
 
 
 def delete_cache_folder(dir_name = ".cache"):
@@ -326,10 +278,61 @@ def capitalize_sentences(text):
     return capitalized_lines
 
 
-def get_agent_chat_summary(response, 
+# Seconds the post-processing LLM calls of get_agent_chat_summary may take together
+CHAT_SUMMARY_TIMEOUT=float(os.getenv("chat_summary_timeout") or 30)
+
+
+async def run_concurrently(calls, timeout=CHAT_SUMMARY_TIMEOUT):
+    """
+    Runs independent coroutines concurrently under one shared deadline.
+
+    Args:
+        calls (dict): Name -> coroutine.
+        timeout (float, optional): Seconds after which unfinished calls are cancelled.
+
+    Returns:
+        tuple: (results, call_times) where `results` maps every name to the coroutine's return value
+               (None if it failed or missed the deadline) and `call_times` to its duration in seconds.
+    """
+    results={name:None for name in calls}
+    call_times={name:timeout for name in calls}
+
+    async def timed(name, coroutine):
+        start=time.time()
+        try:
+            results[name]=await coroutine
+        except Exception as e:
+            print(f"{name} failed ::",e)
+        finally:
+            call_times[name]=time.time()-start
+
+    tasks=[asyncio.create_task(timed(name, coroutine)) for name,coroutine in calls.items()]
+    if tasks:
+        _,pending=await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            print("Post-processing call missed the deadline, cancelling")
+            task.cancel()
+    return results,call_times
+
+
+def same_sql(sql_a, sql_b):
+    """Compare two SQL queries ignoring formatting differences."""
+    try:
+        return normalize_sql(sql_a)==normalize_sql(sql_b)
+    except Exception:
+        return sql_a.strip()==sql_b.strip()
+
+
+async def join_task(task):
+    """Await a task started earlier, so it can be scheduled like a fresh coroutine."""
+    return await task
+
+
+async def get_agent_chat_summary(response, 
                             usage,
                             logging_session_id,
-                            user_question): # async
+                            user_question,
+                            call_times=None):
     """
     Process and summarize the agent's response for a given user query.
 
@@ -341,10 +344,14 @@ def get_agent_chat_summary(response,
         response (dict): The agent's response, containing:
             - chat_history (list): A list of messages exchanged with the agent.
             - sql_execution_reponse (dict): Details about SQL execution and dataset size.
+            - agent_usage (dict): Token usage of the crew's agents collected in memory during the chat.
+            - sql_explanation_task (dict, optional): Speculative explanation started on critic approval
+              (`sql_query` and its `task`); reused when it explains the final SQL query, cancelled otherwise.
         usage (dict): A dictionary to track token usage (prompt and completion tokens).
         logging_session_id (str): Identifier for the logging session to retrieve chat history.
-        jwt_token (str): Authentication token for accessing and updating user session history.
         user_question (str): The user's query.
+        call_times (dict, optional): Filled with the duration of every post-processing LLM call
+            (`one_limit_call`, `sql_explanation`), which run concurrently under a shared deadline.
 
     Returns:
         dict: A dictionary summarizing the processed response, including:
@@ -354,7 +361,7 @@ def get_agent_chat_summary(response,
             - insights (str): Extracted insights or summary.
             - db_result (str): Result of the database query (if applicable).
             - usage (dict): Updated token usage details.
-            - plotly (any): Extracted Plotly visualization components (if applicable).
+            - plotly (any): Plotly figure built from the result by `build_chart` (if applicable).
             - response_flag (int): Status indicator (0: no results, 1: valid results).
 
     Notes:
@@ -363,7 +370,7 @@ def get_agent_chat_summary(response,
         - If Python code for visualizations exists in the chat history, it extracts and processes it.
 
     Example:
-        result = get_agent_chat_summary(response, usage, session_id, token, "What is the sales trend?")
+        result = await get_agent_chat_summary(response, usage, session_id, "What is the sales trend?")
         print(result["insights"])  # Outputs the insights derived from the agent's response.
     """
 
@@ -371,12 +378,19 @@ def get_agent_chat_summary(response,
     sql_query = ''
     insights = ''
     db_result = None
+    one_limit_prompt = None
+    speculative_explanation = None
+    agent_usage = None
+    if call_times is None:
+        call_times = {}
     
     ## Step-1 :: Extract chat history and SQL execution response from the agent's response
     try:
         chat_history = response['chat_history']
         sql_execution_response = response['sql_execution_response']
         message= response['message']
+        speculative_explanation = response.get('sql_explanation_task')
+        agent_usage = response.get('agent_usage')
         
     except Exception as e:
         print("Step-1 :: Error executing chat history and sql_execution_response ::",e)
@@ -384,22 +398,15 @@ def get_agent_chat_summary(response,
    ## Step-2 :: # Retrieve and calculate token usage from the logging session
     if message== 'ok':
         try:
-            log_df,log_status=log_processing(logging_session_id)
-            # Grouping by 'source_name' and calculating the count and sum
-            if log_status==1:
+            if agent_usage is not None:
+                # Usage accumulated by the crew's clients as each completion returned; the runtime log is
+                # shared by concurrent questions, so it is not read back here
                 print("------------Agent Token Count-----------")
-                # log_data = log_df.groupby("source_name").agg(
-                #         count=("source_name", "count"),
-                #         completion_tokens_sum=("completion_tokens", "sum"),
-                #         prompt_tokens_sum=("prompt_tokens", "sum"),
-                #         response_time_sum=("response_time","sum")
-                #     ).reset_index()
-                usage['prompt_tokens']+=int(log_df['prompt_tokens'].sum())
-                usage['completion_tokens']+=int(log_df['completion_tokens'].sum())
-                # total_tokens=int(log_df['total_tokens'].sum())
+                usage['prompt_tokens']+=agent_usage['prompt_tokens']
+                usage['completion_tokens']+=agent_usage['completion_tokens']
                 print("usage ::",usage)
             else:
-                print("No Logs available for this question...")
+                print("No agent usage available for this question...")
         except Exception as e:
             print("Step-2 :: Error executing Retrieve and calculate token usage from the logging session ::",e)
      
@@ -420,8 +427,12 @@ def get_agent_chat_summary(response,
                 temp = json.loads(content)
                 insights = temp.get('insights')
                 sql_query = temp.get('generated_sql_query')
-                ploty_code = temp.get('plotly_code')
-                plotly_data=extract_plotly_components(ploty_code) 
+                # The chart is built locally from the executed result, the agent only suggests its type
+                try:
+                    plotly_data=build_chart((sql_execution_response or {}).get('df',""), user_question, temp.get('chart_hint'))
+                except Exception as e:
+                    print("Chart builder failed ::",e)
+                    plotly_data=""
                 response_flag=1
                 print("-----------------------Plotly--------------------")
                 print(plotly_data)
@@ -468,6 +479,14 @@ def get_agent_chat_summary(response,
                 plotly_data=""
                 response_flag=1 # Valid Results
 
+            # sql executor agent rejected the query plan as too expensive and the analyst could not rewrite it.
+            elif sql_execution_response['data_size_flag'] == 'rejected-plan':
+                print("------------Rejected plan------------")
+                sql_query = sql_execution_response['generated_sql_query']
+                insights = "Sorry, the query for this question was too expensive to run. Could you narrow down the question (e.g. a title, region or period)?"
+                plotly_data=""
+                response_flag=0 # No Valid Results
+
             # sql executor agent return dataset size is == 1.
             elif sql_execution_response['data_size_flag'] == 'one-limit':
                 # print(sql_execution_response)
@@ -480,28 +499,55 @@ def get_agent_chat_summary(response,
                 question:{question}
                 data:{data}
                 response:(textual response)"""
-                insights,insights_usage=one_limit_call(prompt_)
+                # Issued below together with the SQL explanation
+                one_limit_prompt=prompt_
+                response_flag=1 # Valid Results
+        
+        except Exception as e:
+                print("Error executing prompt tokens ::",e)
+
+        # One-row insights and the SQL explanation are independent, run them concurrently
+        calls={}
+        if one_limit_prompt is not None:
+            calls["one_limit_call"]=one_limit_call(one_limit_prompt)
+        if sql_query!="":
+            if speculative_explanation is not None and same_sql(speculative_explanation["sql_query"],sql_query):
+                print("Reusing speculative SQL explanation")
+                calls["sql_explanation"]=join_task(speculative_explanation.pop("task"))
+            else:
+                calls["sql_explanation"]=sql_explanation(sql_query)
+        if speculative_explanation is not None and "task" in speculative_explanation:
+            # The executed query differs from the approved one (or there is none), discard the explanation
+            speculative_explanation["task"].cancel()
+        call_results,durations=await run_concurrently(calls)
+        call_times.update(durations)
+        print("Post-processing call times ::",call_times)
+
+        if one_limit_prompt is not None:
+            if call_results["one_limit_call"] is not None:
+                insights,insights_usage=call_results["one_limit_call"]
                 # Update token usage: one limit open ai
                 usage['prompt_tokens']+=insights_usage['prompt_tokens']
                 usage['completion_tokens']+=insights_usage['completion_tokens']
                 print("One Limit Insights Token Count Added")
                 print("usage ::",usage)
-                response_flag=1 # Valid Results
-        
-        except Exception as e:
-                print("Error executing prompt tokens ::",e)
+            else:
+                insights="The result is available in the Data tab."
 
         # Explain the SQL query if available
         if sql_query!="":
             # clear the temp session history once get the complete response of user question
             st.session_state.history_manager=[]
-            query_explanation,sql_usage =sql_explanation(sql_query)
             df=sql_execution_response['df']
-            # Update token usage: sql explanation
-            usage['prompt_tokens']+=sql_usage['prompt_tokens']
-            usage['completion_tokens']+=sql_usage['completion_tokens']
-            print("--------SQL query explanation Token Count Added")
-            print("usage ::",usage)
+            if call_results["sql_explanation"] is not None:
+                query_explanation,sql_usage =call_results["sql_explanation"]
+                # Update token usage: sql explanation
+                usage['prompt_tokens']+=sql_usage['prompt_tokens']
+                usage['completion_tokens']+=sql_usage['completion_tokens']
+                print("--------SQL query explanation Token Count Added")
+                print("usage ::",usage)
+            else:
+                query_explanation=""
             print("--------------------SQL Query---------------------")
             print(sql_query)
             print("--------------------Query Explanation---------------------")
@@ -517,8 +563,7 @@ def get_agent_chat_summary(response,
 
         
         ## delete the autogen .cache memory
-        delete_cache_folder()
-        clear_logs(logging_session_id)
+        await asyncio.to_thread(delete_cache_folder)
         return {"question":user_question,
             "sql_query": sql_query,
             "sql_query_explanation": query_explanation,
@@ -529,8 +574,9 @@ def get_agent_chat_summary(response,
             "response_flag":response_flag
             }
     else :
-        delete_cache_folder()
-        clear_logs(logging_session_id)
+        if speculative_explanation is not None:
+            speculative_explanation["task"].cancel()
+        await asyncio.to_thread(delete_cache_folder)
         response_flag=0
         return {"question":user_question,
             "sql_query": '',
@@ -542,46 +588,233 @@ def get_agent_chat_summary(response,
             "response_flag":response_flag
             }
 
-def data_processing(df):
-    pre_start=time.time()
-    # Rename the column name
-    df.rename(columns={"Main Genre":"Main_Genre","Sub Genre":"Sub_Genre","Conflict Type":"Conflict_Type",
+# Column names of the MIDB extract and their SQL friendly names
+COLUMN_RENAMES={"Main Genre":"Main_Genre","Sub Genre":"Sub_Genre","Conflict Type":"Conflict_Type",
             "Social Play":"Social_Play","Business Model":"Business_Model","Release Date Month":"Release_Date_Month",
         "Processing Date Month":"Processing_Date_Month","Month Since Launch":"Month_Since_Launch",
         "Total Revenue":"Total_Revenue","Full Game Revenue":"Full_Game_Revenue","In-Game Revenue":"In_Game_Revenue",
-        "Premium Revenue":"Premium_Revenue" },inplace=True)
+        "Premium Revenue":"Premium_Revenue" }
+DATE_COLUMNS=["Release_Date_Month","Processing_Date_Month"]
+NUMERIC_COLUMNS=['Units','Total_Revenue','Full_Game_Revenue',"In_Game_Revenue","Premium_Revenue","Mau"]
+
+# Pragmas for the bulk insert transaction of the streaming ingest
+INGEST_PRAGMAS={
+    "synchronous":"OFF",
+    "cache_size":-262144,   # 256 MB page cache (negative value is in KiB)
+    "temp_store":"MEMORY"
+}
+
+
+def transform_chunk(df):
+    """
+    Cleans one chunk (or the whole) of the uploaded MIDB extract before it is loaded into SQLite.
+
+    Renames the columns, drops rows without a Title, derives `Release_Date_Month` from
+    `Processing_Date_Month` and `Month_Since_Launch`, and converts the numeric columns to integers.
+
+    Args:
+        df (pandas.DataFrame): Raw rows as read from the CSV file.
+
+    Returns:
+        pandas.DataFrame: The transformed rows.
+    """
+    # Rename the column name
+    df=df.rename(columns=COLUMN_RENAMES)
 
     # Drop the Rows is title missing values
-    new_df=df.dropna(subset=['Title'])
+    new_df=df.dropna(subset=['Title']).copy()
     # Convert the Processing Date Month to the Datetime
-    new_df['Processing_Date_Month']=pd.to_datetime(new_df['Processing_Date_Month'])
-    # Convert the Release Date Month to the Datetime
-    new_df['Release_Date_Month'] = new_df.apply(
-        lambda row: row['Processing_Date_Month'] - pd.DateOffset(months=row['Month_Since_Launch']),
-        axis=1)
-    new_df['Processing_Date_Month']= new_df['Processing_Date_Month'].dt.date # strftime('%Y-%m-%d') # YYYY-MM-DD
-    new_df['Release_Date_Month']= new_df['Release_Date_Month'].dt.date # strftime('%Y-%m-%d') # # YYYY-MM-DD
-    text_columns=["Title","Franchise","IP","Publisher","Main_Genre","Sub_Genre","Conflict_Type","Social_Play","Business_Model","SKU","Platform",""]
-    date_columns=["Release_Date_Month","Processing_Date_Month"]
-    numeric_columns=['Units','Total_Revenue','Full_Game_Revenue',"In_Game_Revenue","Premium_Revenue","Mau"]
-    for col in numeric_columns:
-        if df[col].dtypes=="O":
-            new_df[col]=new_df[col].apply(lambda row: row.replace(",",""))
+    processing_date=pd.to_datetime(new_df['Processing_Date_Month'])
+    # Release Date Month = Processing Date Month - Month Since Launch months (day clipped to the month length)
+    total_months=processing_date.dt.year*12+(processing_date.dt.month-1)-new_df['Month_Since_Launch']
+    release_month=pd.to_datetime(pd.DataFrame({"year":total_months//12,"month":total_months%12+1,"day":1}))
+    release_day=np.minimum(processing_date.dt.day,release_month.dt.days_in_month)
+    new_df['Processing_Date_Month']= processing_date.dt.date # YYYY-MM-DD
+    new_df['Release_Date_Month']= (release_month+pd.to_timedelta(release_day-1,unit="D")).dt.date # YYYY-MM-DD
+    for col in NUMERIC_COLUMNS:
+        if not pd.api.types.is_numeric_dtype(new_df[col]):
+            new_df[col]=new_df[col].astype(str).str.replace(",","")
         new_df[col]=new_df[col].astype('int')
-    # new_df.to_csv("process_df.csv",index =False)
-    # Load the Csv sheet data into SQL Lite
-    print("-------------------------Column Names--------------------------")
-    print(new_df.columns)
-    print("-------------------------------------------------------------")
-    # Create an in-memory SQLite database
-    # conn = sqlite3.connect(":memory:")
-    conn = sqlite3.connect("database.db")
-    # Load the DataFrame into the SQLite database
-    new_df.to_sql("midb_table", conn, index=False, if_exists="replace")
-    st.success("File has been saved in local Database.")
-    pre_end=time.time()
-    print("Data Processing and Loading Time::",pre_end-pre_start)
+    return new_df
 
 
-    
+def finalize_ingest(conn, fingerprint, previous_fingerprint=None, new_months=None):
+    """
+    Builds the ingest-time artifacts once the rows of a new dataset are committed, then closes `conn`.
+
+    Creates the table indexes and monthly rollups, builds the distinct-value index, runs `ANALYZE` once all
+    of them exist, records the dataset fingerprint (which invalidates every cache keyed by dataset version), and precomputes the data
+    dictionary prompt and the entity linker.
+
+    When `previous_fingerprint` is given (rows were only appended), the existing index and artifacts
+    are extended with the new values and months instead of being rebuilt from the full table. When
+    `new_months` is given, only those months are recomputed in the rollups.
+
+    With `execution_backend=duckdb`, the table is also exported to Parquet.
+
+    Returns:
+        dict: `index_time` (table indexes and ANALYZE), `rollup_time`, `export_time` (Parquet export)
+              and `metadata_time` (everything else), in seconds.
+    """
+    incremental=previous_fingerprint is not None
+    # Indexes first, the rollup and distinct value scans below already use them
+    index_time=build_table_indexes(conn)
+    rollup_time=build_rollups(conn, months=new_months)
+    # Columnar copy of the table for the DuckDB execution backend
+    export_time=export_parquet(conn) if EXECUTION_BACKEND=="duckdb" else 0.0
+    metadata_start=time.time()
+    # Distinct values and token index used by the fetch_distinct_values tools
+    build_distinct_index(conn, rebuild=not incremental)
+    # Planner statistics once every table and index of the ingest is built
+    analyze_time=analyze_tables(conn)
+    conn.close()
+    # Pooled read connections reopen against the new data on their next query
+    read_only_pool.reset()
+    duckdb_backend.reset()
+    # A new fingerprint changes every cache key; drop the old results right away as well
+    set_dataset_fingerprint(fingerprint)
+    query_result_cache.clear()
+    # Data dictionary prompt, sample rows and date range are computed once here and loaded by every session
+    if incremental:
+        DataDictionaryPrompt().update_artifacts(previous_fingerprint, new_months)
+    else:
+        DataDictionaryPrompt().build_artifacts()
+    # Build the entity linker for the new data up front so the first question does not pay for it
+    get_entity_linker()
+    return {"index_time":index_time+analyze_time,"rollup_time":rollup_time,"export_time":export_time,
+            "metadata_time":time.time()-metadata_start-analyze_time}
+
+
+def _iso_date(value):
+    return value.isoformat() if value is not None and not pd.isna(value) else None
 
+
+def data_processing_stream(file, chunksize=100000, progress_callback=None, table_name="midb_table", mode="replace", month_policy="skip"):
+    """
+    Streams a MIDB CSV extract into SQLite in fixed-size chunks, so peak memory stays bounded by the chunk size.
+
+    Every chunk is transformed with `transform_chunk` and bulk inserted; all chunks are written inside a
+    single transaction with ingest-tuned pragmas, so readers keep seeing the previous data until the
+    new rows are committed. Safe to run outside the Streamlit script thread (no `st` calls).
+
+    Files are content hashed; appending a file that is already part of the current dataset, or replacing
+    the dataset with the only file it was loaded from, is skipped. In `"append"` mode the existing table
+    is kept and only rows of `Processing_Date_Month` values that are not loaded yet are inserted
+    (`month_policy="skip"`), or the months present in the file replace the loaded ones
+    (`month_policy="replace"`). The fingerprint, distinct-value index and prompt artifacts are then
+    extended rather than recomputed from the full table.
+
+    Args:
+        file (str | file-like): Path or binary file object (e.g. a Streamlit `UploadedFile`) of the CSV.
+        chunksize (int, optional): Number of CSV rows read per chunk. Defaults to 100000.
+        progress_callback (callable, optional): Called after every chunk with a dict holding `rows`,
+            `fraction` (share of the file read, None if unknown), `elapsed` and `rows_per_sec`.
+        table_name (str, optional): Destination table. Defaults to `"midb_table"`.
+        mode (str, optional): `"replace"` the table or `"append"` to it. Append falls back to replace
+            when no dataset is loaded yet. Defaults to `"replace"`.
+        month_policy (str, optional): What `"append"` does with months already loaded: `"skip"` their
+            rows or `"replace"` them. Defaults to `"skip"`.
+
+    Returns:
+        dict: Ingest statistics (`rows`, `chunks`, `skipped_rows`, `months`, `replaced_months`, `mode`,
+              `skipped` (file already ingested), `load_time`, `index_time`, `rollup_time`, `export_time`,
+              `metadata_time`,
+              `total_time`, `rows_per_sec`).
+
+    Raises:
+        ValueError: If the file contains no rows or `mode`/`month_policy` is unknown.
+    """
+    if mode not in ("replace","append"):
+        raise ValueError(f"Unknown ingest mode: {mode}")
+    if month_policy not in ("skip","replace"):
+        raise ValueError(f"Unknown month policy: {month_policy}")
+    pre_start=time.time()
+    file_hash=hash_file(file)
+    file_name=getattr(file,"name",None) or os.path.basename(str(file))
+    stats={"rows":0,"chunks":0,"skipped_rows":0,"months":[],"replaced_months":[],"mode":mode,"skipped":False,
+           "load_time":0.0,"index_time":0.0,"rollup_time":0.0,"export_time":0.0,"metadata_time":0.0,"total_time":0.0,"rows_per_sec":0.0}
+    if is_file_ingested(file_hash, mode):
+        stats["skipped"]=True
+        stats["total_time"]=time.time()-pre_start
+        print("Data Processing :: File already ingested, skipping ::",file_name)
+        return stats
+
+    total_bytes=getattr(file,"size",None) or (os.path.getsize(file) if isinstance(file,str) else None)
+    hasher=DatasetHasher()
+    rows=0
+    chunks=0
+    skipped_rows=0
+    new_months=set()
+    replaced_months=set()
+    insert_sql=None
+    previous_fingerprint=get_dataset_fingerprint()
+    conn = connect_rw()
+    try:
+        for pragma,value in INGEST_PRAGMAS.items():
+            conn.execute(f"PRAGMA {pragma}={value}")
+        table_exists=conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name = ?", (table_name,)).fetchone()[0]==1
+        if mode=="append" and (not table_exists or previous_fingerprint is None):
+            print("Data Processing :: No dataset loaded yet, appending as a full load")
+            mode="replace"
+        existing_months=set()
+        if mode=="append":
+            existing_months=set(month for (month,) in conn.execute(f'SELECT DISTINCT Processing_Date_Month FROM "{table_name}"'))
+        conn.execute("BEGIN")
+        for chunk in pd.read_csv(file, chunksize=chunksize):
+            new_df=transform_chunk(chunk)
+            chunks+=1
+            chunk_months=new_df["Processing_Date_Month"].map(_iso_date)
+            if mode=="append" and month_policy=="skip":
+                keep=~chunk_months.isin(existing_months)
+                skipped_rows+=int((~keep).sum())
+                new_df=new_df[keep]
+                chunk_months=chunk_months[keep]
+            elif mode=="append":
+                for month in (set(chunk_months)&existing_months)-replaced_months:
+                    conn.execute(f'DELETE FROM "{table_name}" WHERE Processing_Date_Month = ?', (month,))
+                    replaced_months.add(month)
+            new_months.update(month for month in chunk_months if month is not None)
+            if insert_sql is None:
+                if mode=="replace":
+                    conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+                    conn.execute(pd.io.sql.get_schema(new_df, table_name, con=conn))
+                columns=list(new_df.columns)
+                column_list=",".join(f'"{col}"' for col in columns)
+                insert_sql=f'INSERT INTO "{table_name}" ({column_list}) VALUES ({",".join("?"*len(columns))})'
+            if len(new_df):
+                hasher.update(new_df)
+                insert_df=new_df[columns].astype(object).where(pd.notnull(new_df[columns]), None)
+                for col in DATE_COLUMNS:
+                    insert_df[col]=insert_df[col].map(lambda value: value.isoformat() if value is not None else None)
+                conn.executemany(insert_sql, insert_df.itertuples(index=False, name=None))
+                rows+=len(new_df)
+            if progress_callback is not None:
+                elapsed=time.time()-pre_start
+                fraction=min(file.tell()/total_bytes,1.0) if total_bytes and hasattr(file,"tell") else None
+                progress_callback({"rows":rows,"fraction":fraction,"elapsed":elapsed,"rows_per_sec":rows/elapsed if elapsed else 0.0})
+        if chunks==0:
+            raise ValueError("The uploaded file does not contain any rows.")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        conn.close()
+        raise
+    load_time=time.time()-pre_start
+    if mode=="replace":
+        fingerprint=hasher.hexdigest()
+        stats.update(finalize_ingest(conn, fingerprint))
+    elif rows==0 and not replaced_months:
+        # Every month of the file is already loaded, the dataset did not change
+        fingerprint=previous_fingerprint
+        conn.close()
+    else:
+        fingerprint=extend_fingerprint(previous_fingerprint, hasher.hexdigest(), replaced_months)
+        # Replaced months removed rows, so the sample rows and distinct values are rebuilt from the table
+        stats.update(finalize_ingest(conn, fingerprint, None if replaced_months else previous_fingerprint, sorted(new_months)))
+    record_ingested_file(file_hash, file_name, mode, rows, sorted(new_months), fingerprint, sorted(replaced_months))
+    total_time=time.time()-pre_start
+    stats.update({"rows":rows,"chunks":chunks,"skipped_rows":skipped_rows,"months":sorted(new_months),
+                  "replaced_months":sorted(replaced_months),"mode":mode,"load_time":load_time,"total_time":total_time,
+                  "rows_per_sec":rows/load_time if load_time else 0.0})
+    print("Data Processing and Loading Time::",stats)
+    return stats
@@ -0,0 +1,271 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import pandas as pd
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+# Metadata lives in its own SQLite file so that ingest artifacts never lock the query database
+METADATA_DB_PATH=os.getenv("metadata_db_path") or "metadata.db"
+
+
+def connect_metadata(db_path=METADATA_DB_PATH):
+    """
+    Opens a connection to the metadata store, creating its tables on first use.
+
+    Args:
+        db_path (str, optional): Path of the metadata SQLite file. Defaults to `METADATA_DB_PATH`.
+
+    Returns:
+        sqlite3.Connection: A new connection. The caller is responsible for closing it.
+    """
+    conn=sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""CREATE TABLE IF NOT EXISTS dataset_info (
+        key TEXT PRIMARY KEY,
+        value TEXT,
+        updated_at REAL)""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS prompt_artifacts (
+        fingerprint TEXT NOT NULL,
+        dict_mtime REAL NOT NULL,
+        prompt TEXT,
+        schema_json TEXT,
+        date_range TEXT,
+        created_at REAL,
+        PRIMARY KEY(fingerprint, dict_mtime))""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS ingested_files (
+        file_hash TEXT PRIMARY KEY,
+        file_name TEXT,
+        mode TEXT,
+        rows INTEGER,
+        months TEXT,
+        fingerprint TEXT,
+        ingested_at REAL)""")
+    return conn
+
+
+class DatasetHasher():
+    """
+    Incrementally computes the fingerprint of an ingested dataset from its DataFrame chunks.
+
+    The fingerprint only depends on the column names and cell values, so ingesting the same data
+    twice yields the same fingerprint.
+    """
+
+    def __init__(self) -> None:
+        self._hash=hashlib.sha256()
+        self.rows=0
+
+    def update(self, df):
+        """Add a chunk of rows to the fingerprint."""
+        if self.rows==0:
+            self._hash.update("|".join(map(str,df.columns)).encode("utf-8"))
+        self._hash.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+        self.rows+=len(df)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+
+def compute_fingerprint(df):
+    """Return the fingerprint of a DataFrame, see `DatasetHasher`."""
+    hasher=DatasetHasher()
+    hasher.update(df)
+    return hasher.hexdigest()
+
+
+def extend_fingerprint(previous_fingerprint, delta_fingerprint, replaced_months=()):
+    """
+    Derives the fingerprint of a dataset after an append ingest from the previous fingerprint and the
+    fingerprint of the appended rows, without hashing the rows already in the table again.
+    """
+    fingerprint=hashlib.sha256()
+    fingerprint.update(f"{previous_fingerprint}|{delta_fingerprint}|{','.join(sorted(replaced_months))}".encode("utf-8"))
+    return fingerprint.hexdigest()
+
+
+def hash_file(file, block_size=1<<20):
+    """
+    Returns the sha256 of the content of an uploaded file.
+
+    Args:
+        file (str | file-like): Path or binary file object. File objects are rewound afterwards.
+        block_size (int, optional): Bytes read at a time. Defaults to 1 MB.
+    """
+    file_hash=hashlib.sha256()
+    if isinstance(file,str):
+        with open(file,"rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                file_hash.update(block)
+    else:
+        file.seek(0)
+        for block in iter(lambda: file.read(block_size), b""):
+            file_hash.update(block)
+        file.seek(0)
+    return file_hash.hexdigest()
+
+
+def is_file_ingested(file_hash, mode="append"):
+    """
+    Check whether ingesting a file with this content hash would leave the current dataset unchanged.
+
+    In `"append"` mode that is the case when the file is already part of the dataset. A `"replace"` ingest
+    drops every other file, so it is only a no-op when this file is the only one recorded.
+    """
+    if not os.path.exists(METADATA_DB_PATH):
+        return False
+    conn=connect_metadata()
+    try:
+        recorded=[row_hash for (row_hash,) in conn.execute("SELECT file_hash FROM ingested_files")]
+    finally:
+        conn.close()
+    if mode=="replace":
+        return recorded==[file_hash]
+    return file_hash in recorded
+
+
+def record_ingested_file(file_hash, file_name, mode, rows, months, fingerprint, replaced_months=()):
+    """
+    Records an ingested file so that uploading the same content again is skipped.
+
+    Args:
+        file_hash (str): Content hash returned by `hash_file`.
+        file_name (str): Name of the uploaded file.
+        mode (str): `"replace"` or `"append"`. A replace ingest forgets every previously recorded file,
+            since their rows are no longer in the table.
+        rows (int): Number of rows inserted from the file.
+        months (list): `Processing_Date_Month` values inserted from the file.
+        fingerprint (str): Dataset fingerprint after the ingest.
+        replaced_months (list, optional): Months whose rows were replaced by this file; files that
+            contributed rows to them are forgotten as well.
+    """
+    conn=connect_metadata()
+    try:
+        with conn:
+            if mode=="replace":
+                conn.execute("DELETE FROM ingested_files")
+            elif replaced_months:
+                stale=[(row_hash,) for row_hash,row_months in conn.execute("SELECT file_hash, months FROM ingested_files")
+                       if set(json.loads(row_months or "[]"))&set(replaced_months)]
+                conn.executemany("DELETE FROM ingested_files WHERE file_hash = ?", stale)
+            conn.execute("""INSERT OR REPLACE INTO ingested_files
+                (file_hash, file_name, mode, rows, months, fingerprint, ingested_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (file_hash, file_name, mode, rows, json.dumps(months), fingerprint, time.time()))
+    finally:
+        conn.close()
+
+
+def set_info(key, value):
+    """Store a value in the `dataset_info` table of the metadata store."""
+    conn=connect_metadata()
+    try:
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO dataset_info (key, value, updated_at) VALUES (?, ?, ?)",
+                         (key, value, time.time()))
+    finally:
+        conn.close()
+
+
+def get_info(key, default=None):
+    """Read a value from the `dataset_info` table of the metadata store."""
+    if not os.path.exists(METADATA_DB_PATH):
+        return default
+    conn=connect_metadata()
+    try:
+        row=conn.execute("SELECT value FROM dataset_info WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+    finally:
+        conn.close()
+
+
+def save_prompt_artifacts(fingerprint, dict_mtime, prompt, schema_json, date_range):
+    """
+    Stores the rendered data dictionary prompt and the dataset metadata computed at ingest.
+
+    Args:
+        fingerprint (str): Fingerprint of the ingested dataset.
+        dict_mtime (float): Modification time of the data dictionary Excel file the prompt was built from.
+        prompt (str): The rendered data dictionary prompt.
+        schema_json (str): Table and column details (including the sample rows) as JSON.
+        date_range (dict): `{"Max_date": ..., "Min_date": ...}` of `Processing_Date_Month`.
+    """
+    conn=connect_metadata()
+    try:
+        with conn:
+            conn.execute("""INSERT OR REPLACE INTO prompt_artifacts
+                (fingerprint, dict_mtime, prompt, schema_json, date_range, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)""",
+                (fingerprint, dict_mtime, prompt, schema_json, json.dumps(date_range, default=str), time.time()))
+            # Artifacts of previous datasets are never read again
+            conn.execute("DELETE FROM prompt_artifacts WHERE fingerprint != ?", (fingerprint,))
+    finally:
+        conn.close()
+
+
+def load_prompt_artifacts(fingerprint, dict_mtime):
+    """
+    Loads the artifacts stored by `save_prompt_artifacts` with a single primary key lookup.
+
+    Returns:
+        dict: `prompt`, `schema_json` and `date_range`, or None if nothing was stored for this
+              dataset and data dictionary version.
+    """
+    if fingerprint is None or not os.path.exists(METADATA_DB_PATH):
+        return None
+    conn=connect_metadata()
+    try:
+        row=conn.execute("""SELECT prompt, schema_json, date_range FROM prompt_artifacts
+            WHERE fingerprint = ? AND dict_mtime = ?""", (fingerprint, dict_mtime)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    return {"prompt":row[0],"schema_json":row[1],"date_range":json.loads(row[2])}
+
+
+_fingerprint_lock=threading.Lock()
+_fingerprint_cache={"stat":None,"fingerprint":None}
+
+
+def _metadata_stat():
+    stat=[]
+    for path in [METADATA_DB_PATH,METADATA_DB_PATH+"-wal"]:
+        try:
+            file_stat=os.stat(path)
+            stat.append((file_stat.st_mtime_ns,file_stat.st_size))
+        except OSError:
+            stat.append(None)
+    return tuple(stat)
+
+
+def set_dataset_fingerprint(fingerprint):
+    """Record the fingerprint of the dataset that was just ingested."""
+    set_info("dataset_fingerprint", fingerprint)
+    with _fingerprint_lock:
+        _fingerprint_cache["stat"]=_metadata_stat()
+        _fingerprint_cache["fingerprint"]=fingerprint
+    print("Dataset fingerprint ::",fingerprint)
+
+
+def get_dataset_fingerprint():
+    """
+    Returns the fingerprint of the currently ingested dataset, or None if no ingest recorded one.
+
+    The value is cached in process and only re-read when the metadata store changes on disk, so it
+    is cheap enough to call on every query.
+    """
+    stat=_metadata_stat()
+    with _fingerprint_lock:
+        if _fingerprint_cache["stat"]==stat:
+            return _fingerprint_cache["fingerprint"]
+    fingerprint=get_info("dataset_fingerprint")
+    with _fingerprint_lock:
+        _fingerprint_cache["stat"]=_metadata_stat()
+        _fingerprint_cache["fingerprint"]=fingerprint
+    return fingerprint
@@ -0,0 +1,105 @@
+import os
+import sqlite3
+import threading
+from urllib.parse import quote
+from dotenv import load_dotenv
+from utility.dataset_meta import get_dataset_fingerprint
+
+
+load_dotenv()
+
+DB_PATH=os.getenv("database_path") or "database.db"
+
+# Pragmas applied to every read-only connection handed out by the pool
+READ_PRAGMAS={
+    "mmap_size":268435456,  # 256 MB memory mapped I/O
+    "cache_size":-65536,    # 64 MB page cache (negative value is in KiB)
+    "temp_store":"MEMORY",
+    "query_only":1
+}
+
+
+def connect_rw(db_path=DB_PATH):
+    """
+    Opens a writable connection for ingest and metadata writes.
+
+    The database is switched to WAL journal mode (a persistent setting stored in the file), so the
+    read-only connections of the pool keep reading while a writer holds the database.
+
+    Args:
+        db_path (str, optional): Path of the SQLite database file. Defaults to `DB_PATH`.
+
+    Returns:
+        sqlite3.Connection: A new writable connection. The caller is responsible for closing it.
+    """
+    conn=sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+def get_dataset_version(db_path=DB_PATH):
+    """
+    Identify the currently loaded dataset.
+
+    Uses the fingerprint recorded by `data_processing_stream`; databases ingested before fingerprints existed
+    fall back to the modification time and size of the database (and WAL) file.
+    """
+    fingerprint=get_dataset_fingerprint()
+    if fingerprint is not None:
+        return fingerprint
+    version=[]
+    for path in [db_path,db_path+"-wal"]:
+        try:
+            stat=os.stat(path)
+            version.append(f"{stat.st_mtime_ns}-{stat.st_size}")
+        except OSError:
+            if path==db_path:
+                return None
+    return "-".join(version)
+
+
+class ReadOnlyConnectionPool():
+    """
+    Hands out one read-only SQLite connection per thread, opened once and reused for every query.
+
+    Connections are opened with a `mode=ro` URI and tuned pragmas (memory mapped I/O, larger page
+    cache, in-memory temp store) so the page cache stays warm across the SQL round trips of a
+    question. `reset()` makes every thread reopen its connection on next use, e.g. after an ingest.
+    """
+
+    def __init__(self, db_path=DB_PATH) -> None:
+        self.db_path=db_path
+        self._local=threading.local()
+        self._generation=0
+
+    def connect(self):
+        """Open a new read-only connection with the pool pragmas applied."""
+        uri=f"file:{quote(os.path.abspath(self.db_path))}?mode=ro"
+        conn=sqlite3.connect(uri, uri=True, check_same_thread=False)
+        for pragma,value in READ_PRAGMAS.items():
+            conn.execute(f"PRAGMA {pragma}={value}")
+        return conn
+
+    def get_connection(self):
+        """Return the calling thread's read-only connection, opening it on first use."""
+        conn=getattr(self._local,"conn",None)
+        if conn is not None and self._local.generation!=self._generation:
+            conn.close()
+            conn=None
+        if conn is None:
+            conn=self.connect()
+            self._local.conn=conn
+            self._local.generation=self._generation
+        return conn
+
+    def reset(self):
+        """Invalidate all pooled connections; each thread reconnects on its next query."""
+        self._generation+=1
+
+
+read_only_pool=ReadOnlyConnectionPool()
+
+
+def get_connection():
+    """Shortcut for `read_only_pool.get_connection()`."""
+    return read_only_pool.get_connection()
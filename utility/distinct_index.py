@@ -0,0 +1,120 @@
+import re
+import time
+
+
+# Categorical columns of midb_table that agents filter on
+CATEGORICAL_COLUMNS=["Title","Franchise","IP","Publisher","Main_Genre","Sub_Genre","Conflict_Type",
+                     "Social_Play","Business_Model","SKU","Region","Platform"]
+
+DISTINCT_VALUES_TABLE="distinct_values"
+DISTINCT_TOKENS_TABLE="distinct_value_tokens"
+
+
+def tokenize(text):
+    """Lowercase the text, drop everything except letters and whitespace and split it into words."""
+    text = re.sub(r'[^a-zA-Z\s]', '', str(text))
+    return text.lower().split()
+
+
+def build_distinct_index(conn, table_name="midb_table", columns=CATEGORICAL_COLUMNS, rebuild=True):
+    """
+    Builds the persistent distinct-value table and its inverted token index for the categorical columns.
+
+    `distinct_values` holds one row per (column, value) and `distinct_value_tokens` maps every word of
+    a value to its row, so `lookup_distinct_values` resolves a filter value with an indexed lookup
+    instead of a `SELECT DISTINCT` over the full table.
+
+    Args:
+        conn (sqlite3.Connection): Writable connection to the database holding `table_name`.
+        table_name (str, optional): Table to index. Defaults to `"midb_table"`.
+        columns (list, optional): Columns to index; columns missing from the table are skipped.
+        rebuild (bool, optional): Drop the existing index first. With `False`, only values not yet
+            indexed are added (used when new rows are appended).
+
+    Returns:
+        int: Number of distinct values newly indexed.
+    """
+    start=time.time()
+    if rebuild:
+        conn.execute(f"DROP TABLE IF EXISTS {DISTINCT_TOKENS_TABLE}")
+        conn.execute(f"DROP TABLE IF EXISTS {DISTINCT_VALUES_TABLE}")
+    conn.execute(f"""CREATE TABLE IF NOT EXISTS {DISTINCT_VALUES_TABLE} (
+        value_id INTEGER PRIMARY KEY,
+        column_name TEXT NOT NULL,
+        value TEXT NOT NULL,
+        UNIQUE(column_name, value))""")
+    conn.execute(f"""CREATE TABLE IF NOT EXISTS {DISTINCT_TOKENS_TABLE} (
+        column_name TEXT NOT NULL,
+        token TEXT NOT NULL,
+        value_id INTEGER NOT NULL,
+        PRIMARY KEY(column_name, token, value_id)) WITHOUT ROWID""")
+
+    table_columns=[row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")]
+    added=0
+    for column in columns:
+        if column not in table_columns:
+            continue
+        existing=set(value for (value,) in conn.execute(
+            f"SELECT value FROM {DISTINCT_VALUES_TABLE} WHERE column_name = ?", (column,)))
+        values=[str(value) for (value,) in conn.execute(
+            f"SELECT DISTINCT {column} FROM {table_name} WHERE {column} IS NOT NULL")]
+        for value in values:
+            if value in existing:
+                continue
+            value_id=conn.execute(f"INSERT INTO {DISTINCT_VALUES_TABLE} (column_name, value) VALUES (?, ?)",
+                                  (column, value)).lastrowid
+            conn.executemany(f"INSERT OR IGNORE INTO {DISTINCT_TOKENS_TABLE} (column_name, token, value_id) VALUES (?, ?, ?)",
+                             [(column, token, value_id) for token in set(tokenize(value))])
+            existing.add(value)
+            added+=1
+    conn.commit()
+    print("Distinct value index built ::",added,"values in",round(time.time()-start,2),"seconds")
+    return added
+
+
+def index_available(conn):
+    """Check whether the distinct-value index tables exist in the database."""
+    rows=conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name IN (?, ?)",
+                      (DISTINCT_VALUES_TABLE, DISTINCT_TOKENS_TABLE)).fetchone()
+    return rows[0]==2
+
+
+def lookup_distinct_values(conn, column_name, look_up_value, limit=15):
+    """
+    Returns the distinct values of a column ranked by how many words of `look_up_value` they contain.
+
+    Values sharing the most words with the look-up value come first; when fewer than `limit` values
+    match, the list is padded with other values of the column, like the original full-scan ranking.
+
+    Args:
+        conn (sqlite3.Connection): Connection to a database with the distinct-value index.
+        column_name (str): Column to search.
+        look_up_value (str): The filter value given by the user or the agent.
+        limit (int, optional): Maximum number of candidates to return. Defaults to 15.
+
+    Returns:
+        list: Up to `limit` distinct values of the column.
+    """
+    keywords=list(set(tokenize(look_up_value)))
+    values=[]
+    if keywords:
+        placeholders=",".join("?"*len(keywords))
+        rows=conn.execute(f"""SELECT v.value_id, v.value, COUNT(*) AS matches
+            FROM {DISTINCT_TOKENS_TABLE} t
+            JOIN {DISTINCT_VALUES_TABLE} v ON v.value_id = t.value_id
+            WHERE t.column_name = ? AND t.token IN ({placeholders})
+            GROUP BY v.value_id
+            ORDER BY matches DESC, v.value_id
+            LIMIT ?""", (column_name, *keywords, limit)).fetchall()
+        values=[value for _,value,_ in rows]
+        matched_ids=[value_id for value_id,_,_ in rows]
+    else:
+        matched_ids=[]
+
+    if len(values)<limit:
+        placeholders=",".join("?"*len(matched_ids))
+        rows=conn.execute(f"""SELECT value FROM {DISTINCT_VALUES_TABLE}
+            WHERE column_name = ? AND value_id NOT IN ({placeholders})
+            ORDER BY value_id LIMIT ?""", (column_name, *matched_ids, limit-len(values))).fetchall()
+        values+=[value for (value,) in rows]
+    return values
@@ -0,0 +1,200 @@
+import re
+import threading
+import time
+from collections import deque
+from utility.db_pool import get_connection,get_dataset_version
+from utility.distinct_index import DISTINCT_VALUES_TABLE,index_available
+from utility.vocabulary import COLUMN_SYNONYMS
+
+
+# Categorical columns whose values are linked in user questions
+LINKED_COLUMNS=["Title","Franchise","IP","Publisher","Main_Genre","Sub_Genre","Conflict_Type",
+                "Social_Play","Business_Model","SKU","Region","Platform"]
+
+# Values shorter than this (after normalization) are too ambiguous to link
+MIN_PATTERN_LENGTH=2
+
+# Values that are also everyday question words, e.g. Conflict_Type 'Both' or Social_Play 'Single'
+AMBIGUOUS_VALUES={"all","any","both","single","multi","other","others","none","new","free","total","top","best",
+                  "unknown","na","n a","yes","no"}
+
+
+def normalize_text(text):
+    """Lowercase the text, turn every non alphanumeric character into a space and pad it with spaces.
+
+    Padding both the question and the patterns with spaces makes every automaton match fall on word boundaries.
+    """
+    text=re.sub(r'[^a-z0-9]+', ' ', str(text).lower()).strip()
+    return f" {text} "
+
+
+class AhoCorasickAutomaton():
+    """
+    Multi-pattern string matcher that finds every occurrence of every pattern in a single pass over the text.
+    """
+
+    def __init__(self) -> None:
+        self.goto=[{}]
+        self.fail=[0]
+        self.output=[[]]
+
+    def add(self, pattern, payload):
+        """Add a pattern with the payload returned when it matches."""
+        state=0
+        for char in pattern:
+            next_state=self.goto[state].get(char)
+            if next_state is None:
+                next_state=len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[state][char]=next_state
+            state=next_state
+        self.output[state].append((len(pattern),payload))
+
+    def finalize(self):
+        """Compute the failure links. Must be called once after all patterns are added."""
+        queue=deque(self.goto[0].values())
+        while queue:
+            state=queue.popleft()
+            for char,next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail_state=self.fail[state]
+                while fail_state and char not in self.goto[fail_state]:
+                    fail_state=self.fail[fail_state]
+                self.fail[next_state]=self.goto[fail_state].get(char,0)
+                self.output[next_state]=self.output[next_state]+self.output[self.fail[next_state]]
+
+    def iter_matches(self, text):
+        """Yield (start, end, payload) for every pattern occurrence in the text."""
+        state=0
+        for index,char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state=self.fail[state]
+            state=self.goto[state].get(char,0)
+            for length,payload in self.output[state]:
+                yield index-length+1,index+1,payload
+
+
+# Normalized column wording, per column
+COLUMN_VOCABULARY={column:{normalize_text(synonym).strip() for synonym in synonyms} for column,synonyms in COLUMN_SYNONYMS.items()}
+
+
+def is_vocabulary(pattern, column_name):
+    """
+    Check whether a normalized value is also metric or column wording, e.g. Business_Model 'Premium' in
+    "premium revenue". Wording of the value's own column ("digital" for SKU 'Digital') is not a collision.
+    """
+    text=pattern.strip()
+    if text in AMBIGUOUS_VALUES:
+        return True
+    return any(text in vocabulary for column,vocabulary in COLUMN_VOCABULARY.items() if column!=column_name)
+
+
+class EntityLinker():
+    """
+    Finds the canonical categorical values (titles, publishers, genres, platforms, ...) mentioned in a question.
+
+    The automaton is built from the ingest-time `distinct_values` table, so the Data Analyst agent receives
+    candidate values to filter on and does not need a `fetch_distinct_values` round trip for them. Values that
+    are also metric or column wording (`is_vocabulary`) are not linked.
+    """
+
+    def __init__(self, conn, columns=LINKED_COLUMNS) -> None:
+        start=time.time()
+        self.automaton=AhoCorasickAutomaton()
+        # normalized pattern -> list of (column_name, canonical value)
+        self.entities={}
+        placeholders=",".join("?"*len(columns))
+        rows=conn.execute(f"SELECT column_name, value FROM {DISTINCT_VALUES_TABLE} WHERE column_name IN ({placeholders})",
+                          tuple(columns)).fetchall()
+        for column_name,value in rows:
+            pattern=normalize_text(value)
+            if len(pattern.strip())<MIN_PATTERN_LENGTH or pattern.strip().isdigit() or is_vocabulary(pattern, column_name):
+                continue
+            if pattern not in self.entities:
+                self.entities[pattern]=[]
+                self.automaton.add(pattern,pattern)
+            self.entities[pattern].append((column_name,value))
+        self.automaton.finalize()
+        print("Entity Linker :: Indexed",len(self.entities),"values in",round(time.time()-start,2),"seconds")
+
+    def link(self, question):
+        """
+        Returns the canonical values mentioned in the question.
+
+        Overlapping matches are resolved in favour of the longest one, e.g. "mortal kombat 1" wins over
+        "mortal kombat".
+
+        Returns:
+            list of dict: One entry per (column, value) with the keys `column_name`, `value` and `matched_text`.
+        """
+        text=normalize_text(question)
+        spans=sorted(self.automaton.iter_matches(text),key=lambda span:(-(span[1]-span[0]),span[0]))
+        taken=[]
+        matches=[]
+        for start,end,pattern in spans:
+            # patterns are space padded, so neighbouring words share a single space
+            if any(start<taken_end-1 and end-1>taken_start for taken_start,taken_end in taken):
+                continue
+            taken.append((start,end))
+            for column_name,value in self.entities[pattern]:
+                matches.append({"column_name":column_name,"value":value,"matched_text":pattern.strip()})
+        return matches
+
+
+def format_linked_values(matches):
+    """Render linked values as the context block appended to the question for the Data Analyst agent."""
+    if not matches:
+        return ""
+    lines=["candidate_filter_values (values found in the database for terms of the question; filter on one only when the question asks for that value, with the exact spelling shown, and do not call `fetch_distinct_values` for it):"]
+    for match in matches:
+        lines.append(f"- {match['column_name']}: '{match['value']}' (matched \"{match['matched_text']}\")")
+    return "\n".join(lines)
+
+
+_linker_lock=threading.Lock()
+_linker_cache={"version":None,"linker":None}
+
+
+def build_entity_linker(conn):
+    """Build the linker from a freshly ingested database and cache it for the current dataset version."""
+    linker=EntityLinker(conn)
+    with _linker_lock:
+        _linker_cache["version"]=get_dataset_version()
+        _linker_cache["linker"]=linker
+    return linker
+
+
+def get_entity_linker():
+    """Return the cached linker for the current dataset version, building it on first use. None if no index exists."""
+    version=get_dataset_version()
+    with _linker_lock:
+        if _linker_cache["version"]==version and _linker_cache["linker"] is not None:
+            return _linker_cache["linker"]
+    conn=get_connection()
+    if not index_available(conn):
+        return None
+    return build_entity_linker(conn)
+
+
+def link_question(question):
+    """
+    Resolves the categorical values mentioned in a question and renders them as agent context.
+
+    Args:
+        question (str): The (refined) user question.
+
+    Returns:
+        tuple: (matches, context) where `matches` is the list returned by `EntityLinker.link` and `context`
+               the text block to append to the question ("" when nothing matched or linking failed).
+    """
+    try:
+        linker=get_entity_linker()
+        if linker is None:
+            return [],""
+        matches=linker.link(question)
+        return matches,format_linked_values(matches)
+    except Exception as e:
+        print("Entity Linker :: Linking failed ::",e)
+        return [],""
@@ -0,0 +1,269 @@
+import os
+import re
+import threading
+import time
+import pandas as pd
+import sqlparse
+from dotenv import load_dotenv
+from utility.db_pool import get_connection
+from utility.rollups import rewrite_query
+
+
+load_dotenv()
+
+# "sqlite" runs the generated SQL on database.db, "duckdb" on a Parquet copy of midb_table written at ingest
+EXECUTION_BACKEND=(os.getenv("execution_backend") or "sqlite").lower()
+PARQUET_PATH=os.getenv("parquet_path") or "midb_table.parquet"
+# Rows returned to the analyst by a validation query, whatever LIMIT the query has
+VALIDATION_ROW_LIMIT=int(os.getenv("validation_row_limit") or 3)
+
+# SQLite declared types -> DuckDB types of the Parquet export. Dates stay VARCHAR, as in SQLite,
+# so string comparisons against 'YYYY-MM-DD' literals keep working.
+DUCKDB_TYPES={"INTEGER":"BIGINT","INT":"BIGINT","BIGINT":"BIGINT","REAL":"DOUBLE","FLOAT":"DOUBLE","DOUBLE":"DOUBLE"}
+
+
+def _import_duckdb():
+    try:
+        import duckdb
+    except ImportError as e:
+        raise ImportError("execution_backend=duckdb requires the duckdb package (pip install duckdb)") from e
+    return duckdb
+
+
+def export_parquet(conn, table_name="midb_table", parquet_path=PARQUET_PATH, chunksize=100000):
+    """
+    Writes the ingested table to a Parquet file for the DuckDB backend.
+
+    Rows are streamed from SQLite in chunks into an in-process DuckDB table, which is then written
+    with `COPY ... TO` and atomically moved over the previous file, so running queries never see a
+    partially written file.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the database holding `table_name`.
+        table_name (str, optional): Table to export. Defaults to `"midb_table"`.
+        parquet_path (str, optional): Destination file. Defaults to `PARQUET_PATH`.
+        chunksize (int, optional): Rows fetched from SQLite at a time. Defaults to 100000.
+
+    Returns:
+        float: Seconds spent on the export.
+    """
+    duckdb=_import_duckdb()
+    start=time.time()
+    columns=[(row[1],DUCKDB_TYPES.get(str(row[2]).upper(),"VARCHAR")) for row in conn.execute(f'PRAGMA table_info("{table_name}")')]
+    export_conn=duckdb.connect(":memory:")
+    try:
+        export_conn.execute("CREATE TABLE export_table ({})".format(",".join(f'"{name}" {col_type}' for name,col_type in columns)))
+        for chunk in pd.read_sql_query(f'SELECT * FROM "{table_name}"', conn, chunksize=chunksize):
+            export_conn.register("chunk_df", chunk)
+            export_conn.execute("INSERT INTO export_table SELECT * FROM chunk_df")
+            export_conn.unregister("chunk_df")
+        temp_path=parquet_path+".tmp"
+        export_conn.execute(f"COPY export_table TO '{temp_path}' (FORMAT PARQUET)")
+    finally:
+        export_conn.close()
+    os.replace(temp_path, parquet_path)
+    export_time=time.time()-start
+    print("DuckDB :: Exported",table_name,"to",parquet_path,"in",round(export_time,2),"seconds")
+    return export_time
+
+
+_STRING_LITERAL=re.compile(r"'(?:[^']|'')*'")
+_DATE_MODIFIER=re.compile(r"^\s*([+-]?\d+)\s+(day|month|year)s?\s*$", re.I)
+
+
+def _mask_literals(sql):
+    return _STRING_LITERAL.sub(lambda match: "'"+" "*(len(match.group())-2)+"'", sql)
+
+
+def _split_arguments(text):
+    """Split the argument list of a function call on its top-level commas."""
+    masked=_mask_literals(text)
+    arguments,depth,start=[],0,0
+    for index,char in enumerate(masked):
+        if char=="(":
+            depth+=1
+        elif char==")":
+            depth-=1
+        elif char=="," and depth==0:
+            arguments.append(text[start:index].strip())
+            start=index+1
+    arguments.append(text[start:].strip())
+    return arguments
+
+
+def _replace_calls(sql, function_name, translate):
+    """
+    Replace every call of a SQLite function with `translate(arguments)`, innermost calls first.
+    Translations must not emit `function_name(` themselves.
+    """
+    pattern=re.compile(rf"(?<![\w.]){function_name}\s*\(", re.I)
+    while True:
+        matches=list(pattern.finditer(_mask_literals(sql)))
+        if not matches:
+            return sql
+        match=matches[-1]
+        masked=_mask_literals(sql)
+        depth=1
+        for end in range(match.end(),len(masked)):
+            if masked[end]=="(":
+                depth+=1
+            elif masked[end]==")":
+                depth-=1
+                if depth==0:
+                    break
+        else:
+            raise ValueError(f"Unbalanced parentheses in {function_name} call")
+        sql=sql[:match.start()]+translate(_split_arguments(sql[match.end():end]))+sql[end+1:]
+
+
+def _timestamp_expression(value, modifiers):
+    """Translate a SQLite time value with date modifiers ('start of month', '-3 months', ...) to a DuckDB TIMESTAMP expression."""
+    if value.strip().lower()=="'now'":
+        expression="CAST(current_timestamp AS TIMESTAMP)"
+    else:
+        expression=f"CAST({value} AS TIMESTAMP)"
+    for modifier in modifiers:
+        if not (modifier.startswith("'") and modifier.endswith("'")):
+            raise ValueError(f"Unsupported date modifier: {modifier}")
+        text=modifier[1:-1]
+        amount=_DATE_MODIFIER.match(text)
+        if text.lower() in ("start of month","start of year","start of day"):
+            expression=f"date_trunc('{text.split()[-1].lower()}', {expression})"
+        elif amount:
+            expression=f"({expression} + INTERVAL ({int(amount.group(1))}) {amount.group(2).upper()})"
+        else:
+            raise ValueError(f"Unsupported date modifier: {modifier}")
+    return expression
+
+
+def translate_sqlite(sql):
+    """
+    Translates the SQLite dialect used by the agent prompts to DuckDB.
+
+    - `LIKE` becomes `ILIKE` (SQLite's LIKE is case-insensitive for ASCII).
+    - `strftime(format, value, ...)` swaps its arguments, `date(...)` returns 'YYYY-MM-DD' text and
+      `julianday(...)` returns fractional days, with the usual date modifiers.
+    - `CAST(... AS REAL)` casts to DOUBLE (REAL is single precision in DuckDB) and backtick quoted
+      identifiers become double quoted.
+    Integer division is enabled on the connection, see `DuckDBBackend.connect`.
+    """
+    sql=_replace_calls(sql, "strftime",
+        lambda args: f"__STRFTIME__({_timestamp_expression(args[1], args[2:])}, {args[0]})")
+    sql=_replace_calls(sql, "date",
+        lambda args: f"CAST(CAST({_timestamp_expression(args[0], args[1:])} AS __DATE__) AS VARCHAR)")
+    sql=_replace_calls(sql, "julianday",
+        lambda args: f"(epoch({_timestamp_expression(args[0], args[1:])}) / 86400.0 + 2440587.5)")
+    sql=sql.replace("__STRFTIME__","strftime").replace("__DATE__","DATE")
+    masked=_mask_literals(sql)
+    edits=[(match.start(),match.end(),"ILIKE") for match in re.finditer(r"(?<![\w])LIKE\b", masked, flags=re.I)]
+    edits+=[(match.start(),match.end(),"AS DOUBLE") for match in re.finditer(r"\bAS\s+REAL\b", masked, flags=re.I)]
+    edits+=[(index,index+1,'"') for index,char in enumerate(masked) if char=="`"]
+    for start,end,replacement in sorted(edits, reverse=True):
+        sql=sql[:start]+replacement+sql[end:]
+    return sql
+
+
+class DuckDBBackend():
+    """
+    Executes queries with DuckDB over the Parquet export of midb_table.
+
+    Like `ReadOnlyConnectionPool`, every thread gets its own connection, opened once and reused;
+    `reset()` makes them reopen after an ingest wrote a new Parquet file.
+    """
+
+    def __init__(self, parquet_path=PARQUET_PATH, table_name="midb_table") -> None:
+        self.parquet_path=parquet_path
+        self.table_name=table_name
+        self._local=threading.local()
+        self._generation=0
+
+    def connect(self):
+        duckdb=_import_duckdb()
+        conn=duckdb.connect(":memory:")
+        # SQLite divides integers with integer division
+        conn.execute("SET integer_division=true")
+        conn.execute(f"CREATE VIEW {self.table_name} AS SELECT * FROM read_parquet('{os.path.abspath(self.parquet_path)}')")
+        return conn
+
+    def get_connection(self):
+        conn=getattr(self._local,"conn",None)
+        if conn is not None and self._local.generation!=self._generation:
+            conn.close()
+            conn=None
+        if conn is None:
+            conn=self.connect()
+            self._local.conn=conn
+            self._local.generation=self._generation
+        return conn
+
+    def reset(self):
+        self._generation+=1
+
+    def read_sql(self, sql):
+        """Execute a SQLite-dialect query and return the result as a DataFrame with SQLite-like dtypes."""
+        cursor=self.get_connection().execute(translate_sqlite(sql))
+        hugeint_columns=[column[0] for column in cursor.description if str(column[1])=="HUGEINT"]
+        df=cursor.df()
+        # SUM over BIGINT is HUGEINT, which pandas receives as float; SQLite returns integers
+        for column in hugeint_columns:
+            if not df[column].isna().any():
+                df[column]=df[column].astype("int64")
+        return df
+
+
+duckdb_backend=DuckDBBackend()
+
+
+def run_query(sql):
+    """
+    Executes a generated query on the configured backend and returns a DataFrame.
+
+    On SQLite, eligible aggregates are answered from the rollup tables (see `rewrite_query`).
+    """
+    if EXECUTION_BACKEND=="duckdb":
+        return duckdb_backend.read_sql(sql)
+    return pd.read_sql_query(rewrite_query(sql), get_connection())
+
+
+def bound_query(query, limit):
+    """
+    Wrap a single SELECT statement as `SELECT * FROM (query) LIMIT limit`.
+
+    Raises:
+        ValueError: If the text is not exactly one SELECT (or WITH ... SELECT) statement.
+    """
+    statements=[statement for statement in sqlparse.parse(query) if str(statement).strip(" \t\r\n;")]
+    if len(statements)!=1:
+        raise ValueError(f"expected a single SQL statement, got {len(statements)}")
+    if statements[0].get_type()!="SELECT":
+        raise ValueError(f"only SELECT queries can be validated, got {statements[0].get_type()}")
+    # Comments are stripped so a trailing `-- ...` cannot swallow the closing parenthesis
+    inner=sqlparse.format(str(statements[0]), strip_comments=True).strip().rstrip(";").strip()
+    return f"SELECT * FROM ({inner}) LIMIT {int(limit)}"
+
+
+def run_bounded_query(query, limit=VALIDATION_ROW_LIMIT, max_string_length=300):
+    """
+    Executes a validation query on the configured backend, materializing at most `limit` + 1 rows.
+
+    The query is wrapped as a bounded subquery (see `bound_query`) and read with `fetchmany`, so the
+    extra row only tells whether the result was truncated.
+
+    Returns:
+        dict: `columns`, `rows` (at most `limit`, long strings truncated), `truncated` and `execution_ms`,
+              or `error` with the error message.
+    """
+    start_time=time.time()
+    try:
+        if EXECUTION_BACKEND=="duckdb":
+            cursor=duckdb_backend.get_connection().execute(translate_sqlite(bound_query(query, limit+1)))
+        else:
+            cursor=get_connection().execute(bound_query(rewrite_query(query), limit+1))
+        rows=cursor.fetchmany(limit+1)
+        columns=[column[0] for column in cursor.description]
+    except Exception as e:
+        return {"error":str(e),"execution_ms":round((time.time()-start_time)*1000,1)}
+    return {"columns":columns,
+            "rows":[tuple(value[:max_string_length] if isinstance(value,str) else value for value in row) for row in rows[:limit]],
+            "truncated":len(rows)>limit,
+            "execution_ms":round((time.time()-start_time)*1000,1)}
@@ -0,0 +1,345 @@
+import atexit
+import json
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from dotenv import load_dotenv
+from autogen.logger.base_logger import BaseLogger
+from autogen.logger.logger_utils import get_current_ts, to_dict
+
+
+load_dotenv()
+
+LOGS_DB_PATH=os.getenv("logs_db_path") or "logs.db"
+# Fraction of questions logged in full; the others only keep the token usage of their completions
+LOG_SAMPLE_RATE=float(os.getenv("log_sample_rate") or 1.0)
+LOG_BATCH_SIZE=int(os.getenv("log_batch_size") or 200)
+LOG_FLUSH_INTERVAL=float(os.getenv("log_flush_interval") or 1.0)
+LOG_RETENTION_DAYS=float(os.getenv("log_retention_days") or 7)
+LOG_MAX_MB=float(os.getenv("log_max_mb") or 200)
+# Seconds between retention checks of the writer thread
+LOG_MAINTENANCE_INTERVAL=float(os.getenv("log_maintenance_interval") or 600)
+
+# Same tables as autogen's SqliteLogger, so the logs stay readable with the usual tooling
+LOG_SCHEMA=["""CREATE TABLE IF NOT EXISTS chat_completions(
+        id INTEGER PRIMARY KEY,
+        invocation_id TEXT,
+        client_id INTEGER,
+        wrapper_id INTEGER,
+        session_id TEXT,
+        request TEXT,
+        response TEXT,
+        is_cached INEGER,
+        cost REAL,
+        start_time DATETIME DEFAULT CURRENT_TIMESTAMP,
+        end_time DATETIME DEFAULT CURRENT_TIMESTAMP)""",
+    """CREATE TABLE IF NOT EXISTS agents (
+        id INTEGER PRIMARY KEY,
+        agent_id INTEGER,
+        wrapper_id INTEGER,
+        session_id TEXT,
+        name TEXT,
+        class TEXT,
+        init_args TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(agent_id, session_id))""",
+    """CREATE TABLE IF NOT EXISTS oai_wrappers (
+        id INTEGER PRIMARY KEY,
+        wrapper_id INTEGER,
+        session_id TEXT,
+        init_args TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(wrapper_id, session_id))""",
+    """CREATE TABLE IF NOT EXISTS oai_clients (
+        id INTEGER PRIMARY KEY,
+        client_id INTEGER,
+        wrapper_id INTEGER,
+        session_id TEXT,
+        class TEXT,
+        init_args TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(client_id, session_id))""",
+    """CREATE TABLE IF NOT EXISTS events (
+        event_name TEXT,
+        source_id INTEGER,
+        source_name TEXT,
+        agent_module TEXT DEFAULT NULL,
+        agent_class_name TEXT DEFAULT NULL,
+        id INTEGER PRIMARY KEY,
+        json_state TEXT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)""",
+    "CREATE INDEX IF NOT EXISTS idx_chat_completions_session_id ON chat_completions(session_id)",
+    "CREATE INDEX IF NOT EXISTS idx_chat_completions_start_time ON chat_completions(start_time)"]
+
+# Table -> timestamp column used by the age based retention
+LOG_TIMESTAMPS={"chat_completions":"start_time","agents":"timestamp","oai_wrappers":"timestamp",
+                "oai_clients":"timestamp","events":"timestamp"}
+
+INSERT_QUERIES={
+    "chat_completions":"""INSERT INTO chat_completions (invocation_id, client_id, wrapper_id, session_id, request,
+        response, is_cached, cost, start_time, end_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+    "agents":"""INSERT INTO agents (agent_id, wrapper_id, session_id, name, class, init_args, timestamp)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (agent_id, session_id) DO UPDATE SET wrapper_id = excluded.wrapper_id, name = excluded.name,
+        class = excluded.class, init_args = excluded.init_args, timestamp = excluded.timestamp""",
+    "oai_wrappers":"""INSERT INTO oai_wrappers (wrapper_id, session_id, init_args, timestamp) VALUES (?, ?, ?, ?)
+        ON CONFLICT (wrapper_id, session_id) DO NOTHING""",
+    "oai_clients":"""INSERT INTO oai_clients (client_id, wrapper_id, session_id, class, init_args, timestamp)
+        VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (client_id, session_id) DO NOTHING""",
+    "events":"""INSERT INTO events (source_id, source_name, event_name, agent_module, agent_class_name, json_state, timestamp)
+        VALUES (?, ?, ?, ?, ?, ?, ?)""",
+}
+
+INIT_ARGS_EXCLUDE=("self", "__class__", "api_key", "organization", "base_url", "azure_endpoint")
+
+
+def _response_json(response, usage_only):
+    if response is None or isinstance(response, str):
+        return json.dumps({"response": response})
+    response=to_dict(response)
+    if usage_only:
+        return json.dumps({"usage":response.get("usage")})
+    return json.dumps(response)
+
+
+class LogWriter():
+    """
+    Process wide writer of the runtime logs.
+
+    Log calls only put a row on a queue; a background thread inserts the rows in batches of up to
+    `batch_size` (or every `flush_interval` seconds) over a single WAL-mode connection, so logging never
+    waits on SQLite in the request path. The same thread applies the retention policy every
+    `maintenance_interval` seconds: rows older than `retention_days` are deleted and the file is
+    compacted, and a file still larger than `max_mb` is rotated to `<dbname>.1`.
+    """
+
+    def __init__(self, dbname=LOGS_DB_PATH, batch_size=LOG_BATCH_SIZE, flush_interval=LOG_FLUSH_INTERVAL,
+                 retention_days=LOG_RETENTION_DAYS, max_mb=LOG_MAX_MB, maintenance_interval=LOG_MAINTENANCE_INTERVAL) -> None:
+        self.dbname=dbname
+        self.batch_size=batch_size
+        self.flush_interval=flush_interval
+        self.retention_days=retention_days
+        self.max_mb=max_mb
+        self.maintenance_interval=maintenance_interval
+        self._queue=queue.Queue()
+        self._lock=threading.Lock()
+        self._thread=None
+        self._conn=None
+        self.stats={"rows":0,"batches":0,"dropped":0,"rotations":0}
+
+    def start(self):
+        """Start the writer thread if it is not running yet."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread=threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self._thread.start()
+
+    def write(self, table, args):
+        """Queue a row for `table`; never blocks."""
+        self.start()
+        self._queue.put((table,args))
+
+    def flush(self, timeout=5.0):
+        """Wait until every row queued so far is committed. Returns False on timeout."""
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        done=threading.Event()
+        self._queue.put(("__flush__",done))
+        return done.wait(timeout)
+
+    def close(self):
+        """Flush the queue and stop the writer thread."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(("__stop__",None))
+        self._thread.join(timeout=10)
+
+    def _connect(self):
+        conn=sqlite3.connect(self.dbname, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for query in LOG_SCHEMA:
+            conn.execute(query)
+        conn.commit()
+        return conn
+
+    def _run(self):
+        try:
+            self._conn=self._connect()
+        except sqlite3.Error as e:
+            print("Log Writer :: Failed to open",self.dbname,"::",e)
+            return
+        last_maintenance=time.time()
+        running=True
+        while running:
+            batch,events=[],[]
+            try:
+                item=self._queue.get(timeout=self.flush_interval)
+                deadline=time.time()+self.flush_interval
+                while True:
+                    table,args=item
+                    if table=="__flush__":
+                        events.append(args)
+                        break
+                    if table=="__stop__":
+                        running=False
+                        break
+                    batch.append(item)
+                    if len(batch)>=self.batch_size:
+                        break
+                    item=self._queue.get(timeout=max(deadline-time.time(),0))
+            except queue.Empty:
+                pass
+            self._write_batch(batch)
+            for done in events:
+                done.set()
+            if time.time()-last_maintenance>=self.maintenance_interval:
+                self.maintain()
+                last_maintenance=time.time()
+        self._conn.close()
+        self._conn=None
+
+    def _write_batch(self, batch):
+        if not batch:
+            return
+        rows={}
+        for table,args in batch:
+            if table=="chat_completions" and callable(args[5]):
+                # The response is serialized here, off the request path
+                args=args[:5]+(args[5](),)+args[6:]
+            rows.setdefault(table,[]).append(args)
+        try:
+            with self._conn:
+                for table,table_rows in rows.items():
+                    self._conn.executemany(INSERT_QUERIES[table], table_rows)
+            self.stats["rows"]+=len(batch)
+            self.stats["batches"]+=1
+        except Exception as e:
+            self.stats["dropped"]+=len(batch)
+            print("Log Writer :: Dropped",len(batch),"log rows ::",e)
+
+    def maintain(self):
+        """Apply the retention policy: delete rows older than `retention_days`, compact, rotate if still too large."""
+        try:
+            cutoff=time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(time.time()-self.retention_days*86400))
+            deleted=0
+            with self._conn:
+                for table,column in LOG_TIMESTAMPS.items():
+                    deleted+=self._conn.execute(f"DELETE FROM {table} WHERE {column} < ?", (cutoff,)).rowcount
+            if deleted:
+                self._conn.execute("VACUUM")
+                print("Log Writer :: Removed",deleted,"log rows older than",self.retention_days,"days")
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            if os.path.getsize(self.dbname)>self.max_mb*1024*1024:
+                self._rotate()
+        except Exception as e:
+            print("Log Writer :: Maintenance failed ::",e)
+
+    def _rotate(self):
+        self._conn.close()
+        os.replace(self.dbname, self.dbname+".1")
+        for suffix in ["-wal","-shm"]:
+            if os.path.exists(self.dbname+suffix):
+                os.remove(self.dbname+suffix)
+        self._conn=self._connect()
+        self.stats["rotations"]+=1
+        print("Log Writer :: Rotated",self.dbname,"to",self.dbname+".1")
+
+
+log_writer=LogWriter()
+atexit.register(log_writer.close)
+
+
+class BufferedLogger(BaseLogger):
+    """
+    Process wide autogen runtime logger, writing through the shared `LogWriter`.
+
+    autogen keeps a single global logger, so concurrent questions share this one. Each chat registers the
+    OpenAIWrappers of its agents with `start_session`; their completions are logged under that chat's session
+    id and their events follow its sampling. A context variable would not reach them: autogen runs the LLM
+    calls of async chats in executor threads. Agents, wrappers and clients are logged once, under the process session id,
+    when a crew is built.
+
+    Questions that are not sampled (see `LOG_SAMPLE_RATE`) only log their completions, reduced to the
+    token usage, so `log_processing` keeps working for them.
+    """
+
+    def __init__(self, writer=log_writer, sample_rate=LOG_SAMPLE_RATE) -> None:
+        self.writer=writer
+        self.sample_rate=sample_rate
+        self.session_id=str(uuid.uuid4())
+        self._lock=threading.Lock()
+        self._sessions={}
+
+    def start(self):
+        # The writer thread starts with the first logged row
+        return self.session_id
+
+    def start_session(self, wrappers):
+        """Log the completions of `wrappers` (the OpenAIWrappers of one chat) under a new session id, which is returned."""
+        session=(str(uuid.uuid4()),random.random()<self.sample_rate)
+        with self._lock:
+            for wrapper in wrappers:
+                self._sessions[id(wrapper)]=session
+        return session[0]
+
+    def end_session(self, wrappers):
+        """Stop logging `wrappers` under their chat's session id."""
+        with self._lock:
+            for wrapper in wrappers:
+                self._sessions.pop(id(wrapper),None)
+
+    def _session(self, wrapper_id):
+        """(session id, sampled) of a chat's wrapper, the process session for anything else."""
+        with self._lock:
+            return self._sessions.get(wrapper_id,(self.session_id,True))
+
+    def log_chat_completion(self, invocation_id, client_id, wrapper_id, request, response, is_cached, cost, start_time):
+        session_id,sampled=self._session(wrapper_id)
+        request_json=json.dumps(request) if sampled else "{}"
+        self.writer.write("chat_completions", (str(invocation_id), client_id, wrapper_id, session_id, request_json,
+            lambda: _response_json(response, not sampled), is_cached, cost, start_time, get_current_ts()))
+
+    def log_new_agent(self, agent, init_args):
+        from autogen import Agent
+
+        args=to_dict(init_args, exclude=INIT_ARGS_EXCLUDE, no_recursive=(Agent,))
+        self.writer.write("agents", (id(agent),
+            agent.client.wrapper_id if hasattr(agent, "client") and agent.client is not None else "",
+            self.session_id, getattr(agent, "name", "") or "", type(agent).__name__, json.dumps(args), get_current_ts()))
+
+    def log_event(self, source, name, **kwargs):
+        from autogen import Agent
+
+        _,sampled=self._session(id(getattr(source, "client", None)))
+        if not sampled:
+            return
+        json_args=json.dumps(kwargs, default=lambda o: f"<<non-serializable: {type(o).__qualname__}>>")
+        is_agent=isinstance(source, Agent)
+        self.writer.write("events", (id(source), source.name if hasattr(source, "name") else source, name,
+            source.__module__ if is_agent else None, source.__class__.__name__ if is_agent else None,
+            json_args, get_current_ts()))
+
+    def log_new_wrapper(self, wrapper, init_args):
+        args=to_dict(init_args, exclude=INIT_ARGS_EXCLUDE)
+        self.writer.write("oai_wrappers", (id(wrapper), self.session_id, json.dumps(args), get_current_ts()))
+
+    def log_new_client(self, client, wrapper, init_args):
+        args=to_dict(init_args, exclude=INIT_ARGS_EXCLUDE)
+        self.writer.write("oai_clients", (id(client), id(wrapper), self.session_id, type(client).__name__,
+            json.dumps(args), get_current_ts()))
+
+    def stop(self):
+        # The writer is shared by every question and keeps running
+        pass
+
+    def get_connection(self):
+        return None
+
+
+runtime_logger=BufferedLogger()
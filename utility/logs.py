@@ -1,6 +1,7 @@
 import json
 import pandas as pd
 import sqlite3
+from utility.log_writer import LOGS_DB_PATH
 
 
 
@@ -71,29 +72,27 @@ def get_log(dbname="logs.db", table="chat_completions"):
     return data
 
 
-def log_processing(logging_session_id):
+def log_processing(logging_session_id, dbname=LOGS_DB_PATH, table="chat_completions"):
     """
     Processes log data for a specific logging session and extracts relevant details.
 
-    This function filters log data for a given `logging_session_id` and transforms it 
-    into a Pandas DataFrame with additional columns derived from the request and response 
-    content, as well as token usage statistics.
+    This function reads only the log rows of the given `logging_session_id` (through an index on
+    `session_id`) and extracts the token usage of every completion with SQLite's JSON functions,
+    so its cost does not grow with the log history. The answer pipeline takes usage from
+    `AgentCrew.get_usage` instead; this reads a session back from the runtime log.
 
     Args:
         logging_session_id (str): The session ID used to filter the log data.
+        dbname (str, optional): The SQLite log database. Defaults to `LOGS_DB_PATH`.
+        table (str, optional): The completions table. Defaults to `"chat_completions"`.
 
     Returns:
-        pandas.DataFrame: A DataFrame containing the following columns:
-            - `prev_agent`: The name of the agent responsible for the last message in the request.
+        tuple: (log_data_df, log_status) where `log_data_df` is a DataFrame (None if there are no logs)
+        with the following columns and `log_status` is 1 if logs were found, else 0:
+            - `session_id`, `invocation_id`: The logging session and the client call.
             - `completion_tokens`: The number of tokens used for the model's response.
             - `prompt_tokens`: The number of tokens used in the prompt.
             - `total_tokens`: The total number of tokens used (prompt + completion).
-            - `request`: The content of the user's request.
-            - `response`: The content of the model's response.
-
-    Raises:
-        KeyError: If required keys are missing in the log data.
-        TypeError: If the log data is not in the expected format.
 
     Example:
         logging_session_id = "12345"
@@ -101,54 +100,29 @@ def log_processing(logging_session_id):
         print(processed_logs.head())
 
     Notes:
-        - The function assumes that the `get_log()` function returns a list of logs, 
-          where each log is a dictionary containing `session_id`, `request`, and `response`.
-        - The `str_to_dict` function is expected to convert JSON-like strings into Python dictionaries.
-        - Ensure that the log data contains the required structure for the function to work properly.
+        - Failed completions are logged with a non JSON response; their token counts are 0.
     """
-    ## Get all the logs from the db
-    log_data = get_log()
-    # check log data present or not
-    if log_data:
-        # Convert into pandas dataframe
-        log_data_df = pd.DataFrame(log_data)
-        ## Filter the logs only for current session question
-        log_data_df=log_data_df.loc[log_data_df['session_id']==logging_session_id]
-        ## check any log recorded for the session id
-        if log_data_df.shape[0]!=0:
-            # log_data_df["prev_agent"] = log_data_df.apply(lambda row: str_to_dict(row["request"])['messages'][-1]['name'], axis=1)
-            log_data_df["completion_tokens"] = log_data_df.apply(lambda row: str_to_dict(row["response"])["usage"]["completion_tokens"], axis=1)
-            log_data_df["prompt_tokens"] = log_data_df.apply(lambda row: str_to_dict(row["response"])["usage"]["prompt_tokens"], axis=1)
-            log_data_df["total_tokens"] = log_data_df.apply(lambda row: str_to_dict(row["response"])["usage"]["total_tokens"], axis=1)
-            # log_data_df["request"] = log_data_df.apply(lambda row: str_to_dict(row["request"])["messages"][0]["content"], axis=1)
-            # log_data_df["response"] = log_data_df.apply(lambda row: str_to_dict(row["response"])["choices"][0]["message"]["content"], axis=1)
-            log_status=1
-        else:
-            log_data_df=None
-            log_status=0
-            print(f"No Logs for {logging_session_id}")
-    else: 
+    conn = sqlite3.connect(dbname)
+    try:
+        ## Get the usage of the current session question only
+        log_data_df = pd.read_sql_query(f"""SELECT session_id, invocation_id,
+            COALESCE(CASE WHEN json_valid(response) THEN json_extract(response, '$.usage.completion_tokens') END, 0) AS completion_tokens,
+            COALESCE(CASE WHEN json_valid(response) THEN json_extract(response, '$.usage.prompt_tokens') END, 0) AS prompt_tokens,
+            COALESCE(CASE WHEN json_valid(response) THEN json_extract(response, '$.usage.total_tokens') END, 0) AS total_tokens
+            FROM {table} WHERE session_id = ?""", conn, params=(logging_session_id,))
+    except (sqlite3.OperationalError, pd.errors.DatabaseError) as e:
+        # The log table does not exist yet
+        print("No Logs ::",e)
+        return None,0
+    finally:
+        conn.close()
+
+    ## check any log recorded for the session id
+    if log_data_df.shape[0]!=0:
+        log_status=1
+    else:
         log_data_df=None
         log_status=0
-        print("No Logs")
+        print(f"No Logs for {logging_session_id}")
         
     return log_data_df,log_status
-
-def clear_logs(logging_session_id,dbname="logs.db", table="chat_completions"):
-    try:
-        # Connect to the SQLite database
-        conn = sqlite3.connect(dbname)
-        cursor = conn.cursor()
-        
-        # Delete rows from the specified table and logging_session_id
-        cursor.execute(f"DELETE FROM {table} WHERE session_id = ?", (logging_session_id,))
-
-        # Commit changes
-        conn.commit()
-        print(f"Cleared table: {table}")
-    except sqlite3.OperationalError as e:
-        print(f"Error: {e}")
-        
-    finally:
-        # Ensure the connection is closed
-        conn.close()
\ No newline at end of file
@@ -0,0 +1,169 @@
+import functools
+import json
+import os
+import re
+from dotenv import load_dotenv
+from utility.schema_pruning import count_tokens
+
+
+load_dotenv()
+
+# Set message_compaction=false to send every agent the full group chat history
+COMPACTION_ENABLED=(os.getenv("message_compaction") or "true").lower()!="false"
+# Token budget of the chat history sent with each LLM call (system message not included)
+COMPACTION_TOKEN_BUDGET=int(os.getenv("message_compaction_budget") or 6000)
+# Characters kept of a stale validation result
+STALE_OUTPUT_CHARS=int(os.getenv("message_compaction_stale_chars") or 200)
+
+# Tools whose earlier outputs are superseded by the next call; distinct value lookups stay, the analyst filters with them
+SUPERSEDED_TOOLS=["sql_db_query_run"]
+
+# Speakers each agent needs to see besides the question and the message it answers. None means every speaker.
+# `tool_exchanges` is how many of the latest tool call/result pairs the agent sees ("all", "latest" or "none").
+AGENT_VISIBILITY={
+    "planner":{"speakers":{"user_proxy","planner"},"tool_exchanges":"none"},
+    "data_analyst":{"speakers":None,"tool_exchanges":"all"},
+    "sql_critic":{"speakers":{"user_proxy","planner","data_analyst","sql_critic"},"tool_exchanges":"latest"},
+    "insights_generator":{"speakers":{"user_proxy","sql_query_executor"},"tool_exchanges":"none"},
+    "terminator":{"speakers":{"user_proxy"},"tool_exchanges":"none"},
+}
+
+SQL_PATTERN=re.compile(r"\bselect\b[\s\S]+\bfrom\b", re.I)
+
+
+@functools.lru_cache(maxsize=2048)
+def _text_tokens(text):
+    return count_tokens(text)
+
+
+def message_tokens(message):
+    """Tokens of a chat message: its content plus any function / tool call it carries."""
+    tokens=_text_tokens(str(message.get("content") or ""))
+    for key in ("function_call","tool_calls"):
+        if message.get(key):
+            tokens+=_text_tokens(json.dumps(message[key], default=str))
+    return tokens
+
+
+def is_call(message):
+    return bool(message.get("function_call") or message.get("tool_calls"))
+
+
+def is_result(message):
+    return message.get("role") in ("function","tool")
+
+
+def tool_name(unit):
+    call=unit[0].get("function_call") or (unit[0].get("tool_calls") or [{}])[0].get("function",{})
+    return call.get("name")
+
+
+class MessageCompactor():
+    """
+    Compacts the group chat history an agent sends to the LLM, registered on the agent through autogen's
+    `TransformMessages` capability so it runs before every reply. The stored history is not modified.
+
+    Applied in order:
+        1. Visibility: only the speakers and tool exchanges the agent needs (`AGENT_VISIBILITY`).
+        2. Superseded SQL drafts: only the data analyst's latest message with SQL is kept.
+        3. Critic feedback: only the latest SQL critic message is kept.
+        4. Stale tool outputs: validation results of earlier queries are cut to `STALE_OUTPUT_CHARS`.
+        5. Token budget: the oldest remaining messages are dropped until the history fits `token_budget`.
+
+    The first message (the question) and the message being answered are always kept as they are. A function
+    call and its result are kept or dropped together, as the API rejects a result without its call.
+    """
+
+    def __init__(self, agent_name, token_budget=None) -> None:
+        self.agent_name=agent_name
+        self.token_budget=token_budget or COMPACTION_TOKEN_BUDGET
+        visibility=AGENT_VISIBILITY.get(agent_name,{"speakers":None,"tool_exchanges":"all"})
+        self.speakers=visibility["speakers"]
+        self.tool_exchanges=visibility["tool_exchanges"]
+        self.reset()
+
+    def reset(self):
+        """Clear the per-question statistics."""
+        self.stats={"calls":0,"tokens_before":0,"tokens_after":0,"messages_before":0,"messages_after":0}
+
+    def speaker(self, message):
+        # An agent's own replies are stored without a name
+        return message.get("name") or (self.agent_name if message.get("role")=="assistant" else None)
+
+    def units(self, messages):
+        """Group the messages into units: a function / tool call with its results, or a single message."""
+        units=[]
+        for message in messages:
+            if is_result(message) and units and is_call(units[-1][0]):
+                units[-1].append(message)
+            else:
+                units.append([message])
+        return units
+
+    def stale_result(self, message):
+        message=dict(message)
+        content=str(message.get("content") or "")
+        if len(content)>STALE_OUTPUT_CHARS:
+            message["content"]=content[:STALE_OUTPUT_CHARS]+f"... [output of an earlier query, {len(content)-STALE_OUTPUT_CHARS} characters omitted]"
+        if message.get("tool_responses"):
+            message["tool_responses"]=[self.stale_result(response) for response in message["tool_responses"]]
+        return message
+
+    def compact(self, messages):
+        if len(messages)<=2:
+            return messages
+        units=self.units(messages)
+        first,rest=units[0],units[1:]
+        # Indexes over every unit after the question, so the message being answered also supersedes older ones
+        exchanges=[index for index,unit in enumerate(rest) if is_call(unit[0])]
+        superseded=[index for index in exchanges if tool_name(rest[index]) in SUPERSEDED_TOOLS]
+        drafts=[index for index,unit in enumerate(rest) if not is_call(unit[0]) and self.speaker(unit[0])=="data_analyst"
+                and SQL_PATTERN.search(str(unit[0].get("content") or ""))]
+        feedback=[index for index,unit in enumerate(rest) if self.speaker(unit[0])=="sql_critic"]
+
+        kept=[]
+        for index,unit in enumerate(rest[:-1]):
+            if is_call(unit[0]):
+                if self.tool_exchanges=="none" or (self.tool_exchanges=="latest" and index!=exchanges[-1]):
+                    continue
+                if index in superseded and index!=superseded[-1]:
+                    unit=[unit[0]]+[self.stale_result(message) for message in unit[1:]]
+            elif is_result(unit[0]):
+                # A result whose call is not in the history cannot be sent alone
+                continue
+            else:
+                if self.speakers is not None and self.speaker(unit[0]) not in self.speakers:
+                    continue
+                if index in drafts and index!=drafts[-1]:
+                    continue
+                if index in feedback and index!=feedback[-1]:
+                    continue
+            kept.append(unit)
+
+        fixed=sum(message_tokens(message) for message in first+rest[-1])
+        sizes=[sum(message_tokens(message) for message in unit) for unit in kept]
+        while kept and fixed+sum(sizes)>self.token_budget:
+            kept.pop(0)
+            sizes.pop(0)
+        return [message for unit in [first]+kept+[rest[-1]] for message in unit]
+
+    def apply_transform(self, messages):
+        compacted=self.compact(messages)
+        before=sum(message_tokens(message) for message in messages)
+        after=sum(message_tokens(message) for message in compacted)
+        self.stats["calls"]+=1
+        self.stats["tokens_before"]+=before
+        self.stats["tokens_after"]+=after
+        self.stats["messages_before"]+=len(messages)
+        self.stats["messages_after"]+=len(compacted)
+        if len(compacted)!=len(messages) or after!=before:
+            print(f"Message Compaction :: {self.agent_name} :: {len(messages)} -> {len(compacted)} messages, {before} -> {after} tokens")
+        return compacted
+
+    def get_logs(self, pre_transform_messages, post_transform_messages):
+        before=sum(message_tokens(message) for message in pre_transform_messages)
+        after=sum(message_tokens(message) for message in post_transform_messages)
+        if before==after and len(pre_transform_messages)==len(post_transform_messages):
+            return "No messages were compacted.",False
+        return (f"Compacted {len(pre_transform_messages)} messages ({before} tokens) to "
+                f"{len(post_transform_messages)} messages ({after} tokens) for {self.agent_name}."),True
@@ -0,0 +1,104 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+import sqlparse
+from dotenv import load_dotenv
+from utility.db_pool import get_dataset_version
+
+
+load_dotenv()
+
+
+def normalize_sql(sql):
+    """
+    Normalizes a SQL query so that formatting-only differences map to the same cache key.
+
+    Comments are stripped, keywords upper-cased, whitespace collapsed and trailing semicolons removed.
+    String literals and identifiers are left untouched.
+    """
+    sql=sqlparse.format(sql, strip_comments=True, keyword_case="upper")
+    sql=re.sub(r"\s+", " ", sql).strip()
+    return sql.rstrip(";").strip()
+
+
+class QueryResultCache():
+    """
+    Bounded LRU cache with a time-to-live for SQL results shared by every session of the process.
+
+    Keys combine a namespace (the calling path, e.g. "executor" or "validation"), the dataset version
+    written at ingest and the normalized SQL, so a new ingest never serves stale results.
+    """
+
+    def __init__(self, max_entries=None, ttl_seconds=None) -> None:
+        self.max_entries=int(max_entries or os.getenv("query_cache_size") or 256)
+        self.ttl_seconds=float(ttl_seconds or os.getenv("query_cache_ttl") or 900)
+        self._entries=OrderedDict()
+        self._lock=threading.Lock()
+        self.hits=0
+        self.misses=0
+
+    def make_key(self, namespace, sql):
+        return (namespace,get_dataset_version(),normalize_sql(sql))
+
+    def get(self, key):
+        """Return the cached value for the key, or None if it is missing or expired."""
+        with self._lock:
+            entry=self._entries.get(key)
+            if entry is None:
+                self.misses+=1
+                return None
+            stored_at,value=entry
+            if time.time()-stored_at>self.ttl_seconds:
+                del self._entries[key]
+                self.misses+=1
+                return None
+            self._entries.move_to_end(key)
+            self.hits+=1
+            return value
+
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entries beyond `max_entries`."""
+        with self._lock:
+            self._entries[key]=(time.time(),value)
+            self._entries.move_to_end(key)
+            while len(self._entries)>self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, namespace, sql, compute, should_cache=lambda value: value is not None):
+        """
+        Returns the cached result for the SQL, computing and storing it on a miss.
+
+        Args:
+            namespace (str): Calling path, so results of different shapes never collide.
+            sql (str): The SQL query.
+            compute (callable): Executes the query when the result is not cached.
+            should_cache (callable, optional): Decides whether a computed result may be cached;
+                by default everything except None (failed queries).
+        """
+        try:
+            key=self.make_key(namespace, sql)
+        except Exception as e:
+            print("Query Cache :: Could not normalize query, bypassing cache ::",e)
+            return compute()
+        value=self.get(key)
+        if value is not None:
+            print(f"Query Cache :: {namespace} hit")
+            return value
+        value=compute()
+        if should_cache(value):
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        """Drop every cached result, e.g. after a new dataset has been ingested."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries":len(self._entries),"hits":self.hits,"misses":self.misses}
+
+
+query_result_cache=QueryResultCache()
@@ -0,0 +1,241 @@
+import os
+import re
+import threading
+from dotenv import load_dotenv
+from utility.db_pool import get_connection,get_dataset_version
+from utility.rollups import rewrite_query
+from utility.execution_backend import EXECUTION_BACKEND
+
+
+load_dotenv()
+
+# Set query_guard=false to execute generated SQL without checking its plan
+QUERY_GUARD_ENABLED=(os.getenv("query_guard") or "true").lower()!="false"
+# Plans costing more than this many full scans of the largest table are flagged / rejected
+QUERY_GUARD_FLAG_SCANS=float(os.getenv("query_guard_flag_scans") or 5)
+QUERY_GUARD_MAX_SCANS=float(os.getenv("query_guard_max_scans") or 50)
+# Plans visiting fewer rows than this are always accepted, whatever the table size
+QUERY_GUARD_MIN_ROWS=float(os.getenv("query_guard_min_rows") or 1000000)
+
+# Share of the rows returned by an index search without statistics, and by a range constraint
+SEARCH_FRACTION=0.1
+RANGE_FRACTION=0.25
+# Share of the rows of a subquery left after its GROUP BY
+GROUPED_FRACTION=0.01
+
+TABLE_ALIAS=re.compile(r"\b(?:from|join)\s+[\"`\[]?(\w+)[\"`\]]?\s+(?:as\s+)?(\w+)", re.I)
+ALIAS_KEYWORDS={"where","on","join","inner","left","right","full","cross","natural","group","order","limit","union","using","having","window"}
+EQUALITY=re.compile(r"(?<![<>!])=\?")
+
+
+class TableStatistics():
+    """Row counts per table and rows per index prefix from `sqlite_stat1`, loaded once per dataset version."""
+
+    def __init__(self) -> None:
+        self._lock=threading.Lock()
+        self._version=None
+        self.table_rows={}
+        self.index_stats={}
+
+    def load(self):
+        version=get_dataset_version()
+        with self._lock:
+            if self._version==version:
+                return self
+            conn=get_connection()
+            table_rows={}
+            index_stats={}
+            try:
+                for table,index,stat in conn.execute("SELECT tbl,idx,stat FROM sqlite_stat1"):
+                    numbers=[int(value) for value in str(stat).split() if value.isdigit()]
+                    if not numbers:
+                        continue
+                    table_rows[table]=max(table_rows.get(table,0),numbers[0])
+                    if index is not None:
+                        index_stats[index]=numbers
+            except Exception as e:
+                print("Query Guard :: No planner statistics ::",e)
+            # Tables without statistics (e.g. empty tables, which ANALYZE skips) are counted once per dataset version
+            for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"):
+                if table not in table_rows:
+                    table_rows[table]=conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+            self.table_rows,self.index_stats,self._version=table_rows,index_stats,version
+            return self
+
+
+table_statistics=TableStatistics()
+
+
+class QueryRejected(Exception):
+    """Raised instead of executing a query whose plan `check_query` rejected; `guard` holds the check result."""
+
+    def __init__(self, guard) -> None:
+        super().__init__(describe(guard))
+        self.guard=guard
+
+
+class PlanCost():
+    """
+    Estimates the rows a query visits from its `EXPLAIN QUERY PLAN`.
+
+    Table accesses of one query block are nested loops: each SCAN / SEARCH multiplies the rows of the
+    loops before it. A full scan reads the table, an index search the rows per key of the index
+    (`sqlite_stat1`). Temp B-trees add the rows they sort, a correlated subquery is costed once per
+    row of the loops enclosing it, and materialized subqueries once.
+    """
+
+    def __init__(self, plan, sql, statistics) -> None:
+        self.statistics=statistics
+        self.children={}
+        for node_id,parent,_,detail in plan:
+            self.children.setdefault(parent,[]).append((node_id,detail))
+        self.sql=sql
+        self.aliases={alias.lower():table for table,alias in TABLE_ALIAS.findall(sql) if alias.lower() not in ALIAS_KEYWORDS}
+        self.largest=max(list(statistics.table_rows.values())+[1])
+        self.materialized={}
+        self.findings=[]
+
+    def table_rows(self, name):
+        # Aliases of tables, CTEs and subqueries; unknown names are costed like the largest table
+        for candidate in [name,self.aliases.get(name.lower())]:
+            if candidate in self.materialized:
+                return self.materialized[candidate]
+            if candidate in self.statistics.table_rows:
+                return self.statistics.table_rows[candidate]
+        return self.largest
+
+    def subquery_text(self, name):
+        """Body of the CTE or derived table `name` in the query, None when it cannot be found."""
+        cte=re.search(rf"\b{re.escape(name)}\s+as\s*\(", self.sql, re.I)
+        derived=re.search(rf"\)\s*(?:as\s+)?{re.escape(name)}\b", self.sql, re.I)
+        if cte is None and derived is None:
+            return None
+        depth=0
+        if cte is not None:
+            for position in range(cte.end(), len(self.sql)):
+                depth+={"(":1,")":-1}.get(self.sql[position],0)
+                if depth<0:
+                    return self.sql[cte.end():position]
+        else:
+            for position in range(derived.start()-1, -1, -1):
+                depth+={")":1,"(":-1}.get(self.sql[position],0)
+                if depth<0:
+                    return self.sql[position+1:derived.start()]
+        return None
+
+    def subquery_rows(self, name, rows, grouped):
+        """Rows out of a materialized subquery: reduced by its GROUP BY / DISTINCT and capped by its LIMIT."""
+        text=self.subquery_text(name) or ""
+        if grouped or re.search(r"\bgroup\s+by\b|\bdistinct\b", text, re.I):
+            rows=rows*GROUPED_FRACTION
+        limit=re.search(r"\blimit\s+(\d+)\s*$", text.strip(), re.I)
+        if limit:
+            rows=min(rows,int(limit.group(1)))
+        return max(rows,1)
+
+    def access_rows(self, detail):
+        words=detail.split()
+        name=words[1]
+        if name=="CONSTANT":
+            return 1
+        rows=self.table_rows(name)
+        if words[0]=="SCAN":
+            return rows
+        if "PRIMARY KEY" in detail and EQUALITY.search(detail):
+            return 1
+        constraint=re.search(r"\(([^()]*)\)\s*$", detail)
+        constraint=constraint.group(1) if constraint else ""
+        equalities=len(EQUALITY.findall(constraint))
+        index=re.search(r"\bINDEX (\w+) \(", detail)
+        stats=self.statistics.index_stats.get(index.group(1)) if index else None
+        if equalities and stats and len(stats)>1:
+            rows=stats[min(equalities,len(stats)-1)]
+        elif equalities:
+            rows=rows*SEARCH_FRACTION**equalities
+        if re.search(r"[<>]", constraint):
+            rows=rows*RANGE_FRACTION
+        return max(rows,1)
+
+    def block(self, parent, outer_rows):
+        """Cost of the query block under `parent`, run `outer_rows` times. Returns (cost, rows out of its loops)."""
+        loop_rows=1
+        cost=0
+        loops=[]
+        for node_id,detail in self.children.get(parent,[]):
+            if detail.startswith(("SCAN ","SEARCH ")):
+                loops.append(detail.split()[1])
+                loop_rows*=self.access_rows(detail)
+                cost+=outer_rows*loop_rows
+            elif detail.startswith("USE TEMP B-TREE"):
+                cost+=outer_rows*loop_rows
+                self.findings.append(f"temp B-tree ({detail[len('USE TEMP B-TREE '):].lower()})")
+            elif detail.startswith("CORRELATED"):
+                sub_cost,_=self.block(node_id, outer_rows*loop_rows)
+                cost+=sub_cost
+                self.findings.append(f"{detail.lower()} re-run for each of ~{outer_rows*loop_rows:,.0f} rows")
+            elif detail.startswith(("MATERIALIZE","CO-ROUTINE")):
+                sub_cost,sub_rows=self.block(node_id, 1)
+                name=detail.split(" ",1)[-1]
+                grouped=any(child.startswith("USE TEMP B-TREE FOR GROUP BY") for _,child in self.children.get(node_id,[]))
+                self.materialized[name]=self.subquery_rows(name, sub_rows, grouped)
+                cost+=sub_cost
+            else:
+                # Subqueries run once, compound queries and OR-by-union branches
+                sub_cost,_=self.block(node_id, outer_rows)
+                cost+=sub_cost
+        if len(loops)>1 and loop_rows>self.largest:
+            self.findings.append(f"nested loop join of {', '.join(loops)} over ~{loop_rows:,.0f} row combinations")
+        return cost,loop_rows
+
+    def estimate(self):
+        cost,_=self.block(0, 1)
+        return cost
+
+
+def explain(sql, conn=None):
+    """The `EXPLAIN QUERY PLAN` rows (id, parent, notused, detail) of a SQLite query."""
+    conn=conn or get_connection()
+    return conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+
+
+def check_query(sql):
+    """
+    Estimates the cost of a generated query from its SQLite query plan before it is executed.
+
+    The plan is the one SQLite would run (after the rollup rewrite); on the DuckDB backend the SQLite plan
+    of the same query is used as an estimate. Cost is in rows visited, compared with full scans of the
+    largest table.
+
+    Returns:
+        dict: `verdict` ("ok", "flag" or "reject"), `cost`, `full_scans`, `reasons` and `plan`. When the plan
+              cannot be built (e.g. a syntax error), the verdict is "ok" and execution reports the error.
+    """
+    if not QUERY_GUARD_ENABLED or not sql:
+        return {"verdict":"ok","cost":None,"full_scans":None,"reasons":[],"plan":[]}
+    try:
+        planned_sql=sql if EXECUTION_BACKEND=="duckdb" else rewrite_query(sql)
+        plan=explain(planned_sql)
+        estimator=PlanCost(plan, planned_sql, table_statistics.load())
+        cost=estimator.estimate()
+    except Exception as e:
+        print("Query Guard :: Plan not available ::",e)
+        return {"verdict":"ok","cost":None,"full_scans":None,"reasons":[],"plan":[]}
+    full_scans=cost/estimator.largest
+    verdict="ok"
+    if cost>=QUERY_GUARD_MIN_ROWS:
+        if full_scans>QUERY_GUARD_MAX_SCANS:
+            verdict="reject"
+        elif full_scans>QUERY_GUARD_FLAG_SCANS:
+            verdict="flag"
+    result={"verdict":verdict,"cost":round(cost),"full_scans":round(full_scans,1),
+            "reasons":list(dict.fromkeys(estimator.findings)),"plan":[row[3] for row in plan]}
+    print("Query Guard ::",result)
+    return result
+
+
+def describe(result):
+    """Explanation of a flagged or rejected plan for the data analyst."""
+    reasons="; ".join(result["reasons"]) or "full scans of large tables"
+    return (f"the query plan is estimated to visit ~{result['cost']:,} rows (~{result['full_scans']:,.0f} full scans "
+            f"of the largest table): {reasons}. Rewrite it to avoid self-joins without selective keys, correlated "
+            f"subqueries and joins of unfiltered tables, e.g. aggregate with GROUP BY first and join the aggregates.")
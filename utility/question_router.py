@@ -0,0 +1,73 @@
+import os
+import re
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+# Set fast_lane=false to send every question through planner and critic
+FAST_LANE_ENABLED=(os.getenv("fast_lane") or "true").lower()!="false"
+FAST_LANE_MAX_WORDS=int(os.getenv("fast_lane_max_words") or 16)
+
+# Metric mentions, most specific first; each pattern counts as one metric and only matches whole words
+METRIC_PATTERNS=[rf"\b(?:{pattern})\b" for pattern in
+                 [r"full[\s-]*game\s+revenue",r"in[\s-]*game\s+revenue",r"premium\s+revenue",r"total\s+revenue",
+                  r"revenue",r"units?(\s+sold)?",r"sales",r"mau",r"monthly\s+active\s+users?",r"active\s+users?",r"players"]]
+
+# Anything asking for more than a single aggregate over a single slice of the data
+COMPLEX_PATTERNS=[r"\bcompar\w*",r"\bvs\.?\b",r"\bversus\b",r"\bgrowth\b",r"\bgrew\b",r"\bchange[sd]?\b",r"\byoy\b",
+                  r"year[\s-]+over[\s-]+year",r"month[\s-]+over[\s-]+month",r"\bincreas\w*",r"\bdecreas\w*",r"\bdecline\w*",
+                  r"\bdifference\b",r"\bratio\b",r"\bshare\b",r"\bpercent\w*",r"%",r"\bproportion\b",r"\bcontribut\w*",
+                  r"\baverage\b",r"\bavg\b",r"\bmedian\b",r"\bcorrelat\w*",r"\bwhy\b",r"\bhow\s+many\s+titles\b",
+                  r"\beach\b",r"\bper\b",r"\bexcept\b",r"\bexcluding\b",r"\bwithout\b",r"\bwhere\b",r"\bbetween\b",
+                  r"\bbetter\b",r"\bworse\b",r"\boutperform\w*",r"\bforecast\w*",r"\bpredict\w*",r"\bsince\s+launch\b",
+                  r"\bcumulative\b",r"\brunning\b",r"\bfirst\b",r"\blast\s+\d+\b",r"\band\b.*\band\b",r"\bor\b"]
+
+YEAR_PATTERN=r"\b(19|20)\d{2}\b"
+MONTH_PATTERN=r"\b(jan(uary)?|feb(ruary)?|mar(ch)?|apr(il)?|may|june?|july?|aug(ust)?|sep(t(ember)?)?|oct(ober)?|nov(ember)?|dec(ember)?|q[1-4])\b"
+
+
+def count_metrics(question):
+    """Number of distinct metrics mentioned in the question; longer mentions hide the shorter ones they contain."""
+    text=question.lower()
+    count=0
+    for pattern in METRIC_PATTERNS:
+        text,found=re.subn(pattern, " ", text)
+        count+=1 if found else 0
+    return count
+
+
+def classify_question(question, linked_values=None):
+    """
+    Decides locally whether a question can take the fast lane (data analyst -> executor, without planner
+    and critic).
+
+    A question is simple when it is short, asks for exactly one metric, filters on at most one resolved
+    value and at most one year, and has no comparison, ratio, grouping or exclusion wording. Anything
+    else, including questions with no recognizable metric (which the planner may need to reject), takes
+    the full chain.
+
+    Args:
+        question (str): The (refined) user question.
+        linked_values (list, optional): Values resolved by `link_question`.
+
+    Returns:
+        tuple: (lane, reason) with lane `"fast"` or `"full"`.
+    """
+    if not FAST_LANE_ENABLED:
+        return "full","fast lane disabled"
+    text=str(question).lower()
+    if len(text.split())>FAST_LANE_MAX_WORDS:
+        return "full","long question"
+    metrics=count_metrics(text)
+    if metrics!=1:
+        return "full",f"{metrics} metrics"
+    for pattern in COMPLEX_PATTERNS:
+        if re.search(pattern, text):
+            return "full",f"complex wording ({pattern})"
+    filters=len(set((value["column_name"],value["value"]) for value in (linked_values or [])))
+    years=len(set(match.group() for match in re.finditer(YEAR_PATTERN, text)))
+    months=len(re.findall(MONTH_PATTERN, text))
+    if filters>1 or years>1 or months>1:
+        return "full","several filters"
+    return "fast","single metric, single filter"
@@ -0,0 +1,239 @@
+import os
+import re
+import threading
+import time
+from dotenv import load_dotenv
+from utility.db_pool import get_connection,get_dataset_version
+
+
+load_dotenv()
+
+SOURCE_TABLE="midb_table"
+ROLLUP_CATALOG_TABLE="rollup_tables"
+
+# Additive metrics materialized as SUM(metric) in every rollup
+ROLLUP_METRICS=["Units","Total_Revenue","Full_Game_Revenue","In_Game_Revenue","Premium_Revenue","Mau"]
+
+# Rollup table -> grain (GROUP BY columns). Every grain includes the month, so append ingest can refresh single months.
+ROLLUP_GRAINS={
+    "rollup_month":["Processing_Date_Month"],
+    "rollup_title_month":["Title","Processing_Date_Month"],
+    "rollup_publisher_month":["Publisher","Processing_Date_Month"],
+    "rollup_franchise_month":["Franchise","Processing_Date_Month"],
+    "rollup_main_genre_month":["Main_Genre","Processing_Date_Month"],
+    "rollup_sub_genre_month":["Sub_Genre","Processing_Date_Month"],
+    "rollup_region_month":["Region","Processing_Date_Month"],
+    "rollup_platform_month":["Platform","Processing_Date_Month"],
+    "rollup_title_region_platform_month":["Title","Region","Platform","Processing_Date_Month"],
+}
+
+# Set query_rollups=false to always run the generated SQL against midb_table
+ROLLUPS_ENABLED=(os.getenv("query_rollups") or "true").lower()!="false"
+
+
+def build_rollups(conn, table_name=SOURCE_TABLE, months=None):
+    """
+    Materializes the monthly rollup tables of `ROLLUP_GRAINS` and records them in the rollup catalog.
+
+    Args:
+        conn (sqlite3.Connection): Writable connection to the database holding `table_name`.
+        table_name (str, optional): Source table. Defaults to `"midb_table"`.
+        months (list, optional): `Processing_Date_Month` values that changed in an append ingest. Only
+            these months are recomputed in rollups that already exist; None rebuilds every rollup.
+
+    Returns:
+        float: Seconds spent building the rollups.
+    """
+    start=time.time()
+    table_columns=[row[1] for row in conn.execute(f'PRAGMA table_info("{table_name}")')]
+    metrics=[metric for metric in ROLLUP_METRICS if metric in table_columns]
+    existing_tables=set(name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type='table'"))
+    conn.execute(f"""CREATE TABLE IF NOT EXISTS {ROLLUP_CATALOG_TABLE} (
+        name TEXT PRIMARY KEY,
+        grain TEXT,
+        row_count INTEGER)""")
+    for name,grain in ROLLUP_GRAINS.items():
+        if not all(column in table_columns for column in grain):
+            continue
+        grain_list=",".join(f'"{column}"' for column in grain)
+        sum_list=",".join(f'SUM("{metric}") AS "{metric}"' for metric in metrics)
+        if months is not None and name in existing_tables:
+            placeholders=",".join("?"*len(months))
+            conn.execute(f"DELETE FROM {name} WHERE Processing_Date_Month IN ({placeholders})", tuple(months))
+            conn.execute(f"""INSERT INTO {name} ({grain_list},{",".join(f'"{metric}"' for metric in metrics)})
+                SELECT {grain_list},{sum_list} FROM "{table_name}"
+                WHERE Processing_Date_Month IN ({placeholders}) GROUP BY {grain_list}""", tuple(months))
+        else:
+            conn.execute(f"DROP TABLE IF EXISTS {name}")
+            conn.execute(f'CREATE TABLE {name} AS SELECT {grain_list},{sum_list} FROM "{table_name}" GROUP BY {grain_list}')
+        row_count=conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+        conn.execute(f"INSERT OR REPLACE INTO {ROLLUP_CATALOG_TABLE} (name, grain, row_count) VALUES (?, ?, ?)",
+                     (name, ",".join(grain), row_count))
+    conn.commit()
+    rollup_time=time.time()-start
+    print("Rollups :: Built",len(ROLLUP_GRAINS),"rollup tables in",round(rollup_time,2),"seconds")
+    return rollup_time
+
+
+_catalog_lock=threading.Lock()
+_catalog_cache={"version":None,"catalog":None}
+
+
+def load_rollup_catalog():
+    """
+    Returns the rollups of the current dataset as (name, grain columns, row count), smallest first,
+    together with the lowercased columns of the source table. Cached per dataset version.
+    """
+    version=get_dataset_version()
+    with _catalog_lock:
+        if _catalog_cache["version"]==version and _catalog_cache["catalog"] is not None:
+            return _catalog_cache["catalog"]
+    conn=get_connection()
+    exists=conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name = ?", (ROLLUP_CATALOG_TABLE,)).fetchone()[0]
+    rollups=[]
+    if exists:
+        rollups=[(name,set(column.lower() for column in grain.split(",")),row_count)
+                 for name,grain,row_count in conn.execute(f"SELECT name, grain, row_count FROM {ROLLUP_CATALOG_TABLE} ORDER BY row_count")]
+    columns=set(row[1].lower() for row in conn.execute(f'PRAGMA table_info("{SOURCE_TABLE}")'))
+    catalog=(rollups,columns)
+    with _catalog_lock:
+        _catalog_cache["version"]=version
+        _catalog_cache["catalog"]=catalog
+    return catalog
+
+
+_STRING_LITERAL=re.compile(r"'(?:[^']|'')*'")
+_IDENTIFIER=re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+# Anything that depends on the number of source rows, combines tables or cannot be analysed safely
+_REJECTED_TOKENS={"join","over","union","intersect","except","count","avg","total","group_concat","window","natural","using"}
+_CLAUSE_KEYWORDS={"where","group","order","limit","having","on","join","inner","left","cross","natural","as","union","window"}
+_METRICS_LOWER=set(metric.lower() for metric in ROLLUP_METRICS)
+
+
+def _mask_literals(sql):
+    """Blank out the content of string literals while keeping every other character at its position."""
+    return _STRING_LITERAL.sub(lambda match: "'"+" "*(len(match.group())-2)+"'", sql)
+
+
+def _enclosing_block(text, position):
+    """Return the (start, end) of the innermost parenthesized block around `position`, or the whole text."""
+    start,depth=0,0
+    for index in range(position-1,-1,-1):
+        if text[index]==")":
+            depth+=1
+        elif text[index]=="(":
+            if depth==0:
+                start=index+1
+                break
+            depth-=1
+    end,depth=len(text),0
+    for index in range(position,len(text)):
+        if text[index]=="(":
+            depth+=1
+        elif text[index]==")":
+            if depth==0:
+                end=index
+                break
+            depth-=1
+    return start,end
+
+
+def _strip_calls(text, functions):
+    """Remove every call of the given functions whose arguments contain no nested parentheses."""
+    return re.sub(rf"\b(?:{'|'.join(functions)})\s*\([^()]*\)", " ", text, flags=re.I)
+
+
+def plan_rollup(sql):
+    """
+    Picks the smallest rollup that returns exactly the same result as `sql` run on `midb_table`.
+
+    The check is deliberately conservative. The query must read `midb_table` exactly once, in a single
+    SELECT without joins, window functions, set operations, nested SELECTs, COUNT/AVG or `*`. Metrics may
+    only appear as `SUM(metric)` (or as output aliases in ORDER BY), every other referenced column must be
+    part of the rollup grain, and the SELECT must aggregate (GROUP BY, DISTINCT or only SUM/MIN/MAX in the
+    select list), so the number of source rows per group never matters.
+
+    Args:
+        sql (str): The generated SQL query.
+
+    Returns:
+        tuple: (rollup table name, start, end) of the `midb_table` reference to replace, or None.
+    """
+    masked=_mask_literals(sql)
+    if "--" in masked or "/*" in masked or ";" in masked.strip().rstrip(";"):
+        return None
+    references=[match for match in re.finditer(rf"(?<![\w.]){SOURCE_TABLE}\b", masked, flags=re.I)]
+    if len(references)!=1:
+        return None
+    reference=references[0]
+    block_start,block_end=_enclosing_block(masked, reference.start())
+    block=masked[block_start:block_end]
+    tokens=[token.lower() for token in _IDENTIFIER.findall(block)]
+    if not tokens or tokens[0]!="select" or tokens.count("select")!=1 or _REJECTED_TOKENS&set(tokens):
+        return None
+    if re.search(r"\bselect\s+(?:distinct\s+)?\*|\.\s*\*", block, flags=re.I):
+        return None
+
+    rollups,source_columns=load_rollup_catalog()
+    if not rollups:
+        return None
+
+    # Table alias, e.g. FROM midb_table m / FROM midb_table AS m
+    after=_IDENTIFIER.findall(masked[reference.end():block_end])
+    alias=None
+    if after and after[0].lower()=="as" and len(after)>1:
+        alias=after[1]
+    elif after and after[0].lower() not in _CLAUSE_KEYWORDS:
+        alias=after[0]
+    qualifiers=[SOURCE_TABLE]+([re.escape(alias)] if alias else [])
+    block=re.sub(rf"\b(?:{'|'.join(qualifiers)})\s*\.\s*", "", block, flags=re.I)
+    block=block.replace('"',' ').replace('`',' ').replace('[',' ').replace(']',' ')
+
+    # Output aliases (SUM(Units) AS Units) are not column references
+    output_aliases=set(name.lower() for name in re.findall(r"\bas\s+([A-Za-z_][A-Za-z0-9_]*)", block, flags=re.I))
+    block=re.sub(r"\bas\s+[A-Za-z_][A-Za-z0-9_]*", " ", block, flags=re.I)
+    order_by=list(re.finditer(r"\border\s+by\b", block, flags=re.I))
+    main_part,order_part=(block[:order_by[-1].start()],block[order_by[-1].start():]) if order_by else (block,"")
+
+    sum_pattern=rf"\bsum\s*\(\s*(?:{'|'.join(ROLLUP_METRICS)})\s*\)"
+    main_part=re.sub(sum_pattern, " ", main_part, flags=re.I)
+    order_part=re.sub(sum_pattern, " ", order_part, flags=re.I)
+    main_columns=set(token.lower() for token in _IDENTIFIER.findall(main_part))&source_columns
+    order_columns=set(token.lower() for token in _IDENTIFIER.findall(order_part))&source_columns
+    if main_columns&_METRICS_LOWER or (order_columns&_METRICS_LOWER)-output_aliases:
+        return None
+
+    # Without GROUP BY or DISTINCT every row of the source feeds the result, so the select list must only aggregate
+    if not re.search(r"\bgroup\s+by\b|\bselect\s+distinct\b", main_part, flags=re.I):
+        select_list=re.search(r"\bselect\b(.*?)\bfrom\b", block, flags=re.I|re.S)
+        if select_list is None or not re.search(r"\b(?:sum|min|max)\s*\(", select_list.group(1), flags=re.I):
+            return None
+        bare_select=_strip_calls(re.sub(sum_pattern, " ", select_list.group(1), flags=re.I), ["min","max"])
+        if set(token.lower() for token in _IDENTIFIER.findall(bare_select))&source_columns:
+            return None
+
+    dimensions=(main_columns|(order_columns-output_aliases))-_METRICS_LOWER
+    for name,grain,_ in rollups:
+        if dimensions<=grain:
+            return name,reference.start(),reference.end()
+    return None
+
+
+def rewrite_query(sql):
+    """
+    Routes an eligible aggregate query to the smallest matching rollup table (see `plan_rollup`).
+
+    Returns the query unchanged when rollups are disabled, not built, not applicable or the analysis fails.
+    """
+    if not ROLLUPS_ENABLED:
+        return sql
+    try:
+        plan=plan_rollup(sql)
+    except Exception as e:
+        print("Rollups :: Query analysis failed, using midb_table ::",e)
+        return sql
+    if plan is None:
+        return sql
+    name,start,end=plan
+    print("Rollups :: Query routed to",name)
+    return sql[:start]+name+sql[end:]
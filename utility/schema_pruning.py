@@ -0,0 +1,175 @@
+import io
+import json
+import math
+import os
+import re
+import threading
+import pandas as pd
+from dotenv import load_dotenv
+from utility.vocabulary import COLUMN_SYNONYMS
+
+
+load_dotenv()
+
+# Set schema_pruning=false to always embed the full data dictionary
+SCHEMA_PRUNING_ENABLED=(os.getenv("schema_pruning") or "true").lower()!="false"
+# Share of the question's content words that must be explained by the selected columns to prune
+MIN_PRUNING_CONFIDENCE=float(os.getenv("schema_pruning_min_confidence") or 0.5)
+# Minimum BM25 score of a column selected by keyword match alone
+MIN_COLUMN_SCORE=float(os.getenv("schema_pruning_min_score") or 1.0)
+
+# Columns almost every query on midb_table filters or groups by
+ALWAYS_KEPT=["Title","Processing_Date_Month"]
+
+# Wording that asks about the data model itself, which needs every column
+FULL_SCHEMA_WORDING=re.compile(r"\b(columns?|fields?|schema|attributes?|describe\s+the\s+(data|table)|what\s+data|everything|all\s+details?)\b")
+
+STOPWORDS=set("""a an the of in on for to by from with and or at as is are was were be been what which who whom whose how
+when where why show me give list tell find get display total top best highest lowest most least all each every per
+this that these those it its their than then vs versus compare compared between over under did do does has have had
+much many number count sum value values data across during last past previous next current latest overall
+i we you our my your please can could would should any some only also there here about into up down""".split())
+
+MONTH_WORDS=set("""jan january feb february mar march apr april may jun june jul july aug august sep sept september
+oct october nov november dec december q1 q2 q3 q4""".split())
+
+TOKEN=re.compile(r"[a-z0-9][a-z0-9\-]*")
+
+
+def tokenize(text):
+    return TOKEN.findall(str(text).lower().replace("_"," "))
+
+
+_encoding_lock=threading.Lock()
+_encoding_cache={}
+
+
+def count_tokens(text):
+    """
+    Count the tokens of a prompt with tiktoken's cl100k_base encoding. The encoding is loaded once; when
+    it cannot be loaded (e.g. no network to fetch it) the count is estimated at 4 characters per token.
+    """
+    with _encoding_lock:
+        if "encoding" not in _encoding_cache:
+            try:
+                import tiktoken
+                _encoding_cache["encoding"]=tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                print("Schema Pruning :: tiktoken encoding unavailable, estimating token counts ::",e)
+                _encoding_cache["encoding"]=None
+        encoding=_encoding_cache["encoding"]
+    if encoding is None:
+        return math.ceil(len(text)/4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+class SchemaPruner():
+    """
+    Selects the columns of the data dictionary relevant to a question and renders a pruned prompt.
+
+    Columns are scored with BM25 over their name, description and synonyms (`COLUMN_SYNONYMS`);
+    synonym phrases and columns of values resolved by the entity linker are selected directly.
+    Pruning is only applied when the selected columns explain enough of the question's content words
+    (`MIN_PRUNING_CONFIDENCE`), otherwise the full schema is kept.
+    """
+
+    def __init__(self, schema_json, k1=1.5, b=0.75) -> None:
+        self.tables=json.loads(schema_json)
+        self.k1=k1
+        self.b=b
+        self.columns=[column["col_name"] for table in self.tables for column in table["columns"]]
+        self.documents={}
+        self.phrases={}
+        for table in self.tables:
+            for column in table["columns"]:
+                name=column["col_name"]
+                synonyms=COLUMN_SYNONYMS.get(name,[])
+                self.documents[name]=tokenize(name)+tokenize(column.get("col_desc") or "")+[token for synonym in synonyms for token in tokenize(synonym)]
+                self.phrases[name]=[synonym for synonym in synonyms if " " in synonym or "-" in synonym]
+        self.average_length=sum(len(document) for document in self.documents.values())/max(len(self.documents),1)
+        self.document_frequency={}
+        for document in self.documents.values():
+            for token in set(document):
+                self.document_frequency[token]=self.document_frequency.get(token,0)+1
+        self.vocabulary=set(self.document_frequency)
+
+    def bm25(self, query_tokens):
+        scores={}
+        total=len(self.documents)
+        for name,document in self.documents.items():
+            score=0.0
+            for token in set(query_tokens):
+                frequency=document.count(token)
+                if frequency==0:
+                    continue
+                idf=math.log(1+(total-self.document_frequency[token]+0.5)/(self.document_frequency[token]+0.5))
+                score+=idf*frequency*(self.k1+1)/(frequency+self.k1*(1-self.b+self.b*len(document)/self.average_length))
+            scores[name]=score
+        return scores
+
+    def select(self, question, linked_values=None):
+        """
+        Returns (columns, confidence): the columns to keep, in dictionary order, and the share of the
+        question's content words they explain. `columns` is None when the full schema is needed.
+        """
+        text=str(question).lower()
+        if FULL_SCHEMA_WORDING.search(text):
+            return None,0.0
+        selected=set(column for column in ALWAYS_KEPT if column in self.columns)
+        for value in (linked_values or []):
+            if value["column_name"] in self.columns:
+                selected.add(value["column_name"])
+            # Entity names are explained by their column, not by keywords
+            text=text.replace(str(value["matched_text"]).lower()," ")
+        for name,phrases in self.phrases.items():
+            for phrase in phrases:
+                if re.search(rf"\b{re.escape(phrase)}\b", text):
+                    selected.add(name)
+        content=[token for token in tokenize(text) if token not in STOPWORDS and token not in MONTH_WORDS and not token.isdigit()]
+        for name,score in self.bm25(content).items():
+            if score>=MIN_COLUMN_SCORE:
+                selected.add(name)
+        if not content:
+            return [column for column in self.columns if column in selected],1.0
+        matched=[token for token in content if token in self.vocabulary]
+        confidence=len(matched)/len(content)
+        return [column for column in self.columns if column in selected],confidence
+
+    def render(self, columns):
+        """Schema JSON restricted to `columns`, with the sample rows cut to the same columns."""
+        tables=[]
+        for table in self.tables:
+            table=dict(table)
+            table["columns"]=[column for column in table["columns"] if column["col_name"] in columns]
+            try:
+                sample=pd.read_csv(io.StringIO(table["top-3"]))
+                table["top-3"]=sample[[column for column in sample.columns if column in columns]].to_csv(index=False)
+            except Exception as e:
+                print("Schema Pruning :: Sample rows kept in full ::",e)
+            tables.append(table)
+        return json.dumps(tables)
+
+    def prune(self, question, linked_values=None):
+        """
+        Returns (schema_json, report) where `schema_json` is the pruned schema, or None to keep the full one,
+        and `report` holds the selected columns and the confidence.
+        """
+        columns,confidence=self.select(question, linked_values)
+        report={"columns":columns,"confidence":round(confidence,2),"pruned":False}
+        if not SCHEMA_PRUNING_ENABLED or columns is None or confidence<MIN_PRUNING_CONFIDENCE or len(columns)>=len(self.columns):
+            return None,report
+        report["pruned"]=True
+        return self.render(columns),report
+
+
+_pruner_lock=threading.Lock()
+_pruner_cache={"schema_json":None,"pruner":None}
+
+
+def get_schema_pruner(schema_json):
+    """Return the pruner of the current schema, built once per schema."""
+    with _pruner_lock:
+        if _pruner_cache["schema_json"]!=schema_json:
+            _pruner_cache["pruner"]=SchemaPruner(schema_json)
+            _pruner_cache["schema_json"]=schema_json
+        return _pruner_cache["pruner"]
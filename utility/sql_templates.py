@@ -0,0 +1,414 @@
+import os
+import re
+from abc import ABC,abstractmethod
+import threading
+import time
+from dotenv import load_dotenv
+from utility.charts import build_chart,format_number
+from utility.entity_linker import normalize_text
+from utility.execution_backend import run_query
+from utility.query_cache import query_result_cache
+
+
+load_dotenv()
+
+# Set sql_templates=false to send every question to the agents
+TEMPLATES_ENABLED=(os.getenv("sql_templates") or "true").lower()!="false"
+TEMPLATE_TABLE="midb_table"
+DEFAULT_TOP_N=10
+MAX_TOP_N=50
+
+# Metric wording -> column, most specific first; the wording only matches whole words
+METRIC_COLUMNS=[(rf"\b(?:{pattern})\b",column) for pattern,column in
+                [(r"full[\s-]*game\s+revenue","Full_Game_Revenue"),(r"in[\s-]*game\s+revenue","In_Game_Revenue"),
+                 (r"premium\s+revenue","Premium_Revenue"),(r"(total\s+)?revenue|sales","Total_Revenue"),
+                 (r"units?(\s+sold)?","Units"),(r"mau|monthly\s+active\s+users?|active\s+users?|players","Mau")]]
+
+# Grouping wording -> column
+DIMENSION_COLUMNS=[(r"sub[\s-]*genres?","Sub_Genre"),(r"genres?","Main_Genre"),(r"titles?|games?","Title"),
+                   (r"publishers?","Publisher"),(r"franchises?","Franchise"),(r"platforms?","Platform"),(r"regions?","Region")]
+
+# Wording no template answers correctly
+REJECTED_WORDING=re.compile(r"\b(average|avg|median|ratio|per\s+(title|game|user|player|publisher)|excluding|except|without|not|"
+                            r"correlat\w*|why|forecast\w*|predict\w*|cumulative|running|quarter|q[1-4]|ytd|this\s+(year|month)|"
+                            r"week|today|yesterday|since|first|lowest|least|bottom|worst|fewest)\b")
+
+MONTHS={"jan":1,"feb":2,"mar":3,"apr":4,"may":5,"jun":6,"jul":7,"aug":8,"sep":9,"oct":10,"nov":11,"dec":12}
+MONTH_YEAR=re.compile(r"\b(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?\s+((?:19|20)\d{2})\b")
+YEAR=re.compile(r"\b(?:19|20)\d{2}\b")
+LAST_MONTHS=re.compile(r"\b(?:last|past|previous)\s+(\d+|twelve|six|three)\s+months?\b")
+WORD_NUMBERS={"three":3,"six":6,"twelve":12}
+
+
+def sql_literal(value):
+    """Quote a value for inlining into vetted SQL."""
+    return "'"+str(value).replace("'","''")+"'"
+
+
+def extract_metric(text):
+    """
+    Returns the single metric column named in the question (None if there is none or several) and the
+    question without the metric wording, so "full game revenue" is not read as a grouping by game.
+    """
+    found=[]
+    for pattern,column in METRIC_COLUMNS:
+        text,count=re.subn(pattern, " ", text)
+        if count and column not in found:
+            found.append(column)
+    return (found[0] if len(found)==1 else None),text
+
+
+def extract_dimension(text):
+    """Return the grouping column named in the question and whether it was named in plural, or (None, False)."""
+    for pattern,column in DIMENSION_COLUMNS:
+        match=re.search(rf"\b(?:{pattern})\b", text)
+        if match:
+            return column,match.group().endswith("s")
+    return None,False
+
+
+def extract_period(text, allow_years=False):
+    """
+    Parses the period of the question into (WHERE condition, description).
+
+    Supports a single year, a range of years ("from 2022 to 2023"), a month ("March 2024") and
+    "last N months" relative to the latest month of the data. Returns ("", "") without a period and
+    None when the period wording is not understood (or lists several years, unless `allow_years`).
+    """
+    month=MONTH_YEAR.search(text)
+    if month:
+        value=f"{month.group(2)}-{MONTHS[month.group(1)]:02d}-01"
+        if len(MONTH_YEAR.findall(text))>1:
+            return None
+        return f"Processing_Date_Month = {sql_literal(value)}",f" in {month.group(0).title()}"
+    last=LAST_MONTHS.search(text)
+    if last:
+        months=int(WORD_NUMBERS.get(last.group(1),last.group(1)))
+        condition=(f"Processing_Date_Month > date((SELECT MAX(Processing_Date_Month) FROM {TEMPLATE_TABLE}), "
+                   f"'-{months} months')")
+        return condition,f" over the last {months} months"
+    if re.search(r"\blast\s+(year|month)\b", text):
+        return None
+    years=sorted(set(YEAR.findall(text)))
+    if not years:
+        return "",""
+    if len(years)==1:
+        return (f"Processing_Date_Month >= '{years[0]}-01-01' AND Processing_Date_Month < '{int(years[0])+1}-01-01'",
+                f" in {years[0]}")
+    if allow_years:
+        return (f"Processing_Date_Month >= '{years[0]}-01-01' AND Processing_Date_Month < '{int(years[-1])+1}-01-01'",
+                f" from {years[0]} to {years[-1]}")
+    if len(years)==2 and re.search(rf"\b(from|between)\s+{years[0]}\s+(to|and|-)\s+{years[1]}\b", text):
+        return (f"Processing_Date_Month >= '{years[0]}-01-01' AND Processing_Date_Month < '{int(years[1])+1}-01-01'",
+                f" from {years[0]} to {years[1]}")
+    return None
+
+
+def where_clause(*conditions):
+    conditions=[condition for condition in conditions if condition]
+    return "WHERE "+" AND ".join(conditions) if conditions else ""
+
+
+def label(column):
+    return column.replace("_"," ")
+
+
+def metric_aggregate(metric, columns, where):
+    """
+    Returns (source, WHERE clause, aggregate) totalling `metric` per `columns` of the outer query.
+
+    Mau counts the unique players of one month and cannot be added up across months, so it is summed per
+    month in a subquery and the outer query averages the monthly values. Other metrics are summed.
+    """
+    if metric!="Mau":
+        return TEMPLATE_TABLE,where,f"SUM({metric})"
+    group_by=", ".join(columns+["Processing_Date_Month"])
+    source=f"(SELECT {group_by}, SUM(Mau) AS Mau FROM {TEMPLATE_TABLE} {where} GROUP BY {group_by})"
+    return source,"","AVG(Mau)"
+
+
+def aggregate_text(metric):
+    return "Averages the monthly" if metric=="Mau" else "Sums"
+
+
+class SQLTemplate(ABC):
+    """
+    A vetted SQL shape with slots filled locally from the question.
+
+    Subclasses define `trigger` (wording that selects the template) and `render(text, slots)`, which
+    returns (sql, explanation, chart hint) or None when the question does not fit the template's slots.
+    """
+    name=""
+    trigger=None
+
+    def matches(self, text):
+        return self.trigger.search(text) is not None
+
+    @abstractmethod
+    def render(self, text, slots):
+        pass
+
+    def insights(self, df, slots):
+        return []
+
+    def chart_frame(self, df, slots):
+        """The columns of the result to plot."""
+        return df
+
+
+class TopNTemplate(SQLTemplate):
+    """Top N titles / publishers / ... by a metric over a period, optionally within one entity."""
+    name="top_n"
+    trigger=re.compile(r"\b(top|best|highest|largest|biggest|leading|most)\b")
+
+    def render(self, text, slots):
+        dimension,plural=extract_dimension(text)
+        if dimension is None or (slots["entity"] is not None and slots["entity"][0]==dimension):
+            return None
+        number=re.search(r"\b(?:top|best|highest|largest|biggest|leading)\s+(\d+)\b", text)
+        # "which title had the highest revenue" asks for one, "top titles" for a list
+        slots["n"]=min(int(number.group(1)),MAX_TOP_N) if number else DEFAULT_TOP_N if plural else 1
+        slots["dimension"]=dimension
+        metric=slots["metric"]
+        source,where,aggregate=metric_aggregate(metric, [dimension], where_clause(slots['entity_condition'],slots['period_condition']))
+        sql=(f"SELECT {dimension}, {aggregate} AS {metric} FROM {source} {where} "
+             f"GROUP BY {dimension} ORDER BY {metric} DESC LIMIT {slots['n']}")
+        explanation=(f"{aggregate_text(metric)} {metric} for every {dimension}{slots['entity_text']}{slots['period_text']}, "
+                     f"orders the values from highest to lowest and keeps the top {slots['n']}.")
+        return sql,explanation,"bar"
+
+    def insights(self, df, slots):
+        metric,dimension=slots["metric"],slots["dimension"]
+        lines=[f"{df[dimension].iloc[0]} leads with {format_number(df[metric].iloc[0])} {label(metric)}{slots['entity_text']}{slots['period_text']}."]
+        if len(df)>1:
+            lines.append(f"{df[dimension].iloc[1]} follows with {format_number(df[metric].iloc[1])}.")
+            lines.append(f"The top {len(df)} together account for {format_number(df[metric].sum())} {label(metric)}.")
+        return lines
+
+
+class ShareTemplate(SQLTemplate):
+    """
+    Share of total of a metric by genre (or another dimension) over a period.
+
+    Mau shares are computed per month and averaged over the months of the period (a group without players
+    in a month has a 0% share of it), so they add up to 100% even when groups are active in different months.
+    """
+    name="share_of_total"
+    trigger=re.compile(r"\b(share|proportion|percent(age)?|breakdown|split|distribution|mix)\b")
+
+    def render(self, text, slots):
+        dimension,_=extract_dimension(text)
+        if dimension is None or (slots["entity"] is not None and slots["entity"][0]==dimension):
+            return None
+        slots["dimension"]=dimension
+        metric=slots["metric"]
+        where=where_clause(slots['entity_condition'],slots['period_condition'])
+        if metric=="Mau":
+            monthly=(f"(SELECT {dimension}, Processing_Date_Month, SUM(Mau) AS Mau FROM {TEMPLATE_TABLE} {where} "
+                     f"GROUP BY {dimension}, Processing_Date_Month)")
+            totals=(f"(SELECT Processing_Date_Month, SUM(Mau) AS Month_Mau FROM {TEMPLATE_TABLE} {where} "
+                    f"GROUP BY Processing_Date_Month)")
+            sql=(f"SELECT {dimension}, AVG(Mau) AS Mau, "
+                 f"ROUND(100.0 * SUM(1.0 * Mau / Month_Mau) / (SELECT COUNT(*) FROM {totals}), 2) AS Share_Percent "
+                 f"FROM {monthly} JOIN {totals} USING (Processing_Date_Month) GROUP BY {dimension} ORDER BY Share_Percent DESC")
+            explanation=(f"Sums Mau per month for every {dimension}{slots['entity_text']}{slots['period_text']}, divides it by "
+                         f"the total Mau of the month and averages these monthly shares over the months of the period, "
+                         f"so the shares add up to 100%.")
+            return sql,explanation,"pie"
+        source,outer_where,aggregate=metric_aggregate(metric, [dimension], where)
+        total_source,total_where,total_aggregate=metric_aggregate(metric, [], where)
+        sql=(f"SELECT {dimension}, {aggregate} AS {metric}, "
+             f"ROUND(100.0 * {aggregate} / (SELECT {total_aggregate} FROM {total_source} {total_where}), 2) AS Share_Percent "
+             f"FROM {source} {outer_where} GROUP BY {dimension} ORDER BY {metric} DESC")
+        explanation=(f"{aggregate_text(metric)} {metric} for every {dimension}{slots['entity_text']}{slots['period_text']} and "
+                     f"divides each value by the overall {metric} of the same period to get its share in percent.")
+        return sql,explanation,"pie"
+
+    def insights(self, df, slots):
+        dimension=slots["dimension"]
+        lines=[f"{df[dimension].iloc[0]} has the largest share of {label(slots['metric'])}{slots['entity_text']}"
+               f"{slots['period_text']} at {df['Share_Percent'].iloc[0]:.1f}%."]
+        if len(df)>1:
+            others=", ".join(f"{row[dimension]} {row['Share_Percent']:.1f}%" for _,row in df.iloc[1:4].iterrows())
+            lines.append(f"Followed by {others}.")
+        return lines
+
+    def chart_frame(self, df, slots):
+        # Averaged monthly Mau values do not add up to the total, their shares do
+        return df[[slots["dimension"],"Share_Percent" if slots["metric"]=="Mau" else slots["metric"]]]
+
+
+class YearOverYearTemplate(SQLTemplate):
+    """A metric per year with the change against the previous year, optionally for one entity."""
+    name="year_over_year"
+    trigger=re.compile(r"\b(yoy|year[\s-]+(over|on)[\s-]+year|annual|yearly|by\s+year|each\s+year|per\s+year)\b|"
+                       r"\b(?:19|20)\d{2}\s+(?:vs\.?|versus|compared\s+to|against)\s+(?:19|20)\d{2}\b|"
+                       r"\bcompare\b.*\b(?:19|20)\d{2}\b.*\b(?:19|20)\d{2}\b")
+    allow_years=True
+
+    def render(self, text, slots):
+        metric=slots["metric"]
+        source,where,aggregate=metric_aggregate(metric, [], where_clause(slots['entity_condition'],slots['period_condition']))
+        sql=(f"SELECT Year, {metric}, ROUND(100.0 * ({metric} - LAG({metric}) OVER (ORDER BY Year)) / "
+             f"LAG({metric}) OVER (ORDER BY Year), 2) AS YoY_Change_Percent FROM ("
+             f"SELECT substr(Processing_Date_Month, 1, 4) AS Year, {aggregate} AS {metric} FROM {source} {where} "
+             f"GROUP BY substr(Processing_Date_Month, 1, 4)) ORDER BY Year")
+        explanation=(f"{aggregate_text(metric)} {metric}{slots['entity_text']} per year{slots['period_text']} and compares "
+                     f"every year with the previous one as a percentage change.")
+        return sql,explanation,"bar"
+
+    def insights(self, df, slots):
+        metric=slots["metric"]
+        lines=[]
+        for _,row in df.iloc[1:].iterrows():
+            change=row["YoY_Change_Percent"]
+            if change!=change:
+                continue
+            direction="up" if change>=0 else "down"
+            lines.append(f"{label(metric)}{slots['entity_text']} in {row['Year']} was {format_number(row[metric])}, "
+                         f"{direction} {abs(change):.1f}% from the previous year.")
+        if not lines:
+            lines.append(f"{label(metric)}{slots['entity_text']} in {df['Year'].iloc[0]} was {format_number(df[metric].iloc[0])}.")
+        return lines
+
+
+class MonthlyTrendTemplate(SQLTemplate):
+    """Monthly trend of a metric, optionally for one entity, over a period."""
+    name="monthly_trend"
+    trigger=re.compile(r"\b(monthly|trend(s|ing)?|over\s+time|month[\s-]+(over|on|by)[\s-]+month|by\s+month|each\s+month|per\s+month)\b")
+
+    def render(self, text, slots):
+        metric=slots["metric"]
+        # One month per row, so the sum is the monthly value for Mau as well
+        sql=(f"SELECT Processing_Date_Month, SUM({metric}) AS {metric} FROM {TEMPLATE_TABLE} "
+             f"{where_clause(slots['entity_condition'],slots['period_condition'])} "
+             f"GROUP BY Processing_Date_Month ORDER BY Processing_Date_Month")
+        explanation=(f"Sums {metric}{slots['entity_text']} for every month{slots['period_text']} and lists the months "
+                     f"in chronological order.")
+        return sql,explanation,"line"
+
+    def insights(self, df, slots):
+        metric=slots["metric"]
+        peak=df.loc[df[metric].idxmax()]
+        lines=[f"{label(metric)}{slots['entity_text']} peaked at {format_number(peak[metric])} in {peak['Processing_Date_Month']}."]
+        if len(df)>1:
+            last,previous=df[metric].iloc[-1],df[metric].iloc[-2]
+            if previous:
+                change=100.0*(last-previous)/previous
+                lines.append(f"The latest month ({df['Processing_Date_Month'].iloc[-1]}) was {format_number(last)}, "
+                             f"{'up' if change>=0 else 'down'} {abs(change):.1f}% from the month before.")
+        return lines
+
+
+class TemplateRegistry():
+    """
+    Answers the most frequent question shapes with vetted SQL, without the agent chain.
+
+    A question is answered only when exactly one template's wording matches and every slot (metric,
+    at most one resolved entity, period, N) can be filled; anything else goes to the agents. Match
+    rate and latency are tracked in process, see `stats()`.
+    """
+
+    def __init__(self, templates=None) -> None:
+        self.templates=templates if templates is not None else [YearOverYearTemplate(),ShareTemplate(),TopNTemplate(),MonthlyTrendTemplate()]
+        self._lock=threading.Lock()
+        self._stats={"questions":0,"matches":0,"answered":0,"fallbacks":0,"match_time":0.0,"execution_time":0.0,
+                     "by_template":{template.name:0 for template in self.templates}}
+
+    def match(self, question, linked_values=None):
+        """
+        Returns the filled template as a dict (`template`, `sql_query`, `explanation`, `chart_hint`, `slots`),
+        or None when the question does not fit exactly one template.
+        """
+        if not TEMPLATES_ENABLED:
+            return None
+        text=re.sub(r"\s+", " ", str(question).lower())
+        if REJECTED_WORDING.search(text):
+            return None
+        candidates=[template for template in self.templates if template.matches(text)]
+        if len(candidates)!=1:
+            return None
+        template=candidates[0]
+        metric,text=extract_metric(text)
+        # Values linked from the metric wording ("premium" of "premium revenue") are not filters
+        linked_values=[value for value in (linked_values or []) if f" {value['matched_text'].lower()} " in normalize_text(text)]
+        entities=list({(value["column_name"],value["value"]) for value in linked_values})
+        for value in linked_values:
+            # Entity names must not be read as grouping words ("Epic Games")
+            text=text.replace(value["matched_text"].lower()," ")
+        period=extract_period(text, getattr(template,"allow_years",False))
+        if metric is None or len(entities)>1 or period is None:
+            return None
+        entity=entities[0] if entities else None
+        slots={"metric":metric,"entity":entity,
+               "entity_condition":f"{entity[0]} = {sql_literal(entity[1])}" if entity else "",
+               "entity_text":f" for {entity[1]}" if entity else "",
+               "period_condition":period[0],"period_text":period[1]}
+        rendered=template.render(text, slots)
+        if rendered is None:
+            return None
+        sql_query,explanation,chart_hint=rendered
+        return {"template":template,"sql_query":re.sub(r"\s+", " ", sql_query).strip(),
+                "explanation":re.sub(r"\s+", " ", explanation).strip(),"chart_hint":chart_hint,"slots":slots}
+
+    def answer(self, question, linked_values=None):
+        """
+        Answers the question from a template, in the format of `get_agent_chat_summary`.
+
+        Returns:
+            dict: The final response, or None when no template matched or the query returned no rows
+                  (the question then goes to the agents).
+        """
+        match_start_time=time.time()
+        matched=self.match(question, linked_values)
+        match_time=time.time()-match_start_time
+        with self._lock:
+            self._stats["questions"]+=1
+            self._stats["match_time"]+=match_time
+            if matched is not None:
+                self._stats["matches"]+=1
+                self._stats["by_template"][matched["template"].name]+=1
+        if matched is None:
+            return None
+        print("SQL Template ::",matched["template"].name,"::",matched["sql_query"])
+        execution_start_time=time.time()
+        try:
+            df=query_result_cache.get_or_compute("executor", matched["sql_query"], lambda: run_query(matched["sql_query"]))
+            insights=matched["template"].insights(df, matched["slots"]) if not df.empty else []
+        except Exception as e:
+            print("SQL Template :: Query failed ::",e)
+            df,insights=None,[]
+        execution_time=time.time()-execution_start_time
+        with self._lock:
+            self._stats["execution_time"]+=execution_time
+            if df is None or df.empty:
+                self._stats["fallbacks"]+=1
+            else:
+                self._stats["answered"]+=1
+        if df is None or df.empty:
+            return None
+        return {"question":question,
+            "sql_query":matched["sql_query"],
+            "sql_query_explanation":matched["explanation"],
+            "insights":insights,
+            "db_result":df.to_json(orient="records"),
+            "plotly":build_chart(matched["template"].chart_frame(df, matched["slots"]), question, matched["chart_hint"]),
+            "response_flag":1,
+            "template":matched["template"].name,
+            }
+
+    def stats(self):
+        """Match rate (matched / questions), answer rate and average match and execution latency in milliseconds."""
+        with self._lock:
+            stats=dict(self._stats)
+            stats["by_template"]=dict(self._stats["by_template"])
+        questions=stats["questions"] or 1
+        matches=stats["matches"] or 1
+        stats["match_rate"]=stats["matches"]/questions
+        stats["answer_rate"]=stats["answered"]/questions
+        stats["avg_match_ms"]=1000*stats.pop("match_time")/questions
+        stats["avg_execution_ms"]=1000*stats.pop("execution_time")/matches
+        return stats
+
+
+template_registry=TemplateRegistry()
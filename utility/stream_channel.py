@@ -0,0 +1,123 @@
+import json
+import re
+import threading
+import time
+
+
+# Progress shown while an agent (or step of `chat`) is working on the question
+STAGE_LABELS={
+    "question":"Reading the question",
+    "planner":"Planning the analysis",
+    "data_analyst":"Writing the SQL query",
+    "sql_critic":"Reviewing the SQL query",
+    "sql_query_executor":"Running the query",
+    "insights_generator":"Writing insights",
+    "terminator":"Wrapping up",
+    "summary":"Preparing the answer",
+}
+
+ANSI_ESCAPE=re.compile(r"\x1b\[[0-9;]*m")
+INSIGHTS_START=re.compile(r'"insights"\s*:\s*\[')
+JSON_STRING=re.compile(r'\s*,?\s*"((?:[^"\\]|\\.)*)("?)')
+
+
+def partial_insights(text):
+    """
+    Insights readable so far from the insights generator's JSON answer, while it is still being generated.
+
+    The last insight may be incomplete. Returns an empty list until the `"insights"` array has started.
+    """
+    start=INSIGHTS_START.search(text)
+    if start is None:
+        return []
+    insights=[]
+    position=start.end()
+    while True:
+        match=JSON_STRING.match(text, position)
+        if match is None:
+            break
+        value=match.group(1)
+        try:
+            value=json.loads(f'"{value}"')
+        except ValueError:
+            # Cut in the middle of an escape sequence
+            value=value.rstrip("\\")
+        if value:
+            insights.append(value)
+        if not match.group(2):
+            break
+        position=match.end()
+    return insights
+
+
+class StreamChannel():
+    """
+    Progress of one question, written by the agents and read by the UI while `chat` runs.
+
+    Holds the current stage and the insights generator's streamed answer. Tokens arrive from the
+    threads that run the LLM calls, the UI polls `snapshot()` from the script thread.
+    """
+
+    def __init__(self) -> None:
+        self._lock=threading.Lock()
+        self.started=time.time()
+        self.stage_name=None
+        self.stages=[]
+        self.text=""
+        self.first_output=None
+        self.version=0
+
+    def stage(self, name):
+        """Record that `name` (an agent or a step of `chat`) started working."""
+        with self._lock:
+            if name==self.stage_name:
+                return
+            self.stage_name=name
+            self.stages.append((name,round(time.time()-self.started,3)))
+            if name=="insights_generator":
+                self.text=""
+            self.version+=1
+
+    def token(self, text):
+        """Append streamed insights generator output."""
+        with self._lock:
+            self.text+=text
+            if self.first_output is None and partial_insights(self.text):
+                self.first_output=time.time()
+            self.version+=1
+
+    def mark_output(self):
+        """Record that the answer is visible, if nothing was streamed before."""
+        with self._lock:
+            if self.first_output is None:
+                self.first_output=time.time()
+
+    def time_to_first_output(self):
+        """Seconds from the question to the first answer content shown, None while nothing was shown."""
+        return None if self.first_output is None else self.first_output-self.started
+
+    def snapshot(self):
+        with self._lock:
+            return {"version":self.version,
+                    "stage":STAGE_LABELS.get(self.stage_name,self.stage_name),
+                    "insights":partial_insights(self.text)}
+
+
+class ChannelStream():
+    """
+    autogen `IOStream` that forwards the streamed completion of an agent to a `StreamChannel`.
+
+    Output is still printed to the console, like autogen's default stream.
+    """
+
+    def __init__(self, channel) -> None:
+        self.channel=channel
+
+    def print(self, *objects, sep=" ", end="\n", flush=False):
+        print(*objects, sep=sep, end=end, flush=flush)
+        text=ANSI_ESCAPE.sub("", sep.join(str(value) for value in objects))
+        if text:
+            self.channel.token(text)
+
+    def input(self, prompt="", *, password=False):
+        return input(prompt)
@@ -0,0 +1,66 @@
+import time
+
+
+# Indexes created on midb_table after every ingest, as (index name, columns).
+# Lookups on Processing_Date_Month and Title alone are served by the leading column of the covering
+# indexes below, so they do not get a separate single-column index.
+MIDB_INDEXES=[
+    ("idx_midb_release_month",["Release_Date_Month"]),
+    ("idx_midb_publisher",["Publisher"]),
+    ("idx_midb_franchise",["Franchise"]),
+    ("idx_midb_region",["Region"]),
+    ("idx_midb_platform",["Platform"]),
+    # Covering indexes for the revenue / units / MAU by month shapes, so these aggregations never touch the table rows
+    ("idx_midb_month_title_metrics",["Processing_Date_Month","Title","Total_Revenue","Units","Mau"]),
+    ("idx_midb_title_month_metrics",["Title","Processing_Date_Month","Total_Revenue","Units","Mau"]),
+    ("idx_midb_month_publisher_metrics",["Processing_Date_Month","Publisher","Total_Revenue","Units","Mau"]),
+    ("idx_midb_month_genre_metrics",["Processing_Date_Month","Main_Genre","Total_Revenue","Units","Mau"]),
+]
+
+
+def build_table_indexes(conn, table_name="midb_table", indexes=MIDB_INDEXES):
+    """
+    Creates the curated indexes on the ingested table. Planner statistics are refreshed separately by
+    `analyze_tables`, once every table of the ingest is built.
+
+    Indexes that already exist are kept (append ingest), indexes referring to columns missing from the
+    table are skipped.
+
+    Args:
+        conn (sqlite3.Connection): Writable connection to the database holding `table_name`.
+        table_name (str, optional): Table to index. Defaults to `"midb_table"`.
+        indexes (list, optional): (index name, columns) pairs. Defaults to `MIDB_INDEXES`.
+
+    Returns:
+        float: Seconds spent building the indexes.
+    """
+    start=time.time()
+    table_columns=[row[1] for row in conn.execute(f'PRAGMA table_info("{table_name}")')]
+    created=0
+    for index_name,columns in indexes:
+        if not all(column in table_columns for column in columns):
+            print("Table Indexes :: Skipping",index_name,":: missing columns")
+            continue
+        column_list=",".join(f'"{column}"' for column in columns)
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON "{table_name}" ({column_list})')
+        created+=1
+    conn.commit()
+    index_time=time.time()-start
+    print("Table Indexes ::",created,"indexes ready in",round(index_time,2),"seconds")
+    return index_time
+
+
+def analyze_tables(conn):
+    """
+    Runs `ANALYZE` so the planner (and the query guard, through `sqlite_stat1`) sees every table and index
+    of the database, including the rollup and distinct-value tables.
+
+    Returns:
+        float: Seconds spent running `ANALYZE`.
+    """
+    start=time.time()
+    conn.execute("ANALYZE")
+    conn.commit()
+    analyze_time=time.time()-start
+    print("Table Indexes :: Planner statistics refreshed in",round(analyze_time,2),"seconds")
+    return analyze_time
@@ -1,6 +1,7 @@
 # from langchain.sql_database import SQLDatabase
 from langchain_community.utilities.sql_database import SQLDatabase
 from sqlalchemy import create_engine
+from sqlalchemy.pool import SingletonThreadPool
 from langchain_openai import AzureChatOpenAI
 from openai import AzureOpenAI
 from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
@@ -10,11 +11,20 @@ from dotenv import load_dotenv
 import streamlit as st
 from pydantic import BaseModel, Field
 from langchain_core.tools import tool
-import sqlite3
-import re 
+import asyncio
+import time
+from typing import Dict, List
+from utility.db_pool import get_connection,read_only_pool
+from utility.query_cache import query_result_cache
+from utility.execution_backend import VALIDATION_ROW_LIMIT,run_bounded_query
+from utility.query_guard import check_query,describe
+from utility.distinct_index import index_available,lookup_distinct_values,tokenize
 
 load_dotenv()
 
+# Table covered by the ingest-time distinct-value index
+INDEXED_TABLE="midb_table"
+
 
 class DataInput(BaseModel):
     query:str = Field(description="the user input query")
@@ -22,44 +32,78 @@ class DataInput(BaseModel):
     column_name: str = Field(description="The name of column to retrieve distinct values.")
 
 
-@tool()
-def fetch_distinct_values(look_up_value:str ,table_name: str, column_name: str):
-    """Always Use this `fetch_distinct_values` tool to retrieve distinct values for specific columns in a SQLlite database table. The result can be used to find variations of a category which are not standardized. The "look_up_value" refers to the value we search for in the list of unique values."""
+def scan_distinct_values(conn, look_up_value, table_name, column_name, limit=15):
+    """Rank the distinct values of a column by scanning the table. Used when the distinct-value index is not available."""
     # Step 1: Preprocess the text to extract keywords
-    def preprocess_text(text):
-        # Lowercase, remove special characters, numbers, and tokenize
-        text = re.sub(r'[^a-zA-Z\s]', '', text)  # Remove punctuation
-        return text.lower().split()  # Split into words
-    query_keywords = preprocess_text(look_up_value)
+    query_keywords = tokenize(look_up_value)
 
     # Step 2: Define a function to calculate match percentage
     def calculate_match_percentage(row, keywords):
-        if row!=None:
-            target_keywords = preprocess_text(row.lower())  # Preprocess target text
+        if row!=None and len(keywords)>0:
+            target_keywords = tokenize(row)  # Preprocess target text
             common_keywords = set(keywords) & set(target_keywords)  # Find common keywords
             match_percentage = len(common_keywords) / len(keywords) * 100  # Calculate match percentage
             return match_percentage
         else:
             return 0
-        
+
+    query = f"SELECT DISTINCT {column_name} FROM {table_name}"
+    df1 = pd.read_sql_query(query, conn)
+
+    # Step 3: Apply the match percentage function to the target column
+    df1['match_percentage'] = df1[column_name].apply(lambda x: calculate_match_percentage(x, query_keywords))
+    df1=df1.sort_values("match_percentage",ascending=False).head(limit)
+    return df1[column_name].to_list()
+
+
+def resolve_distinct_values(look_up_value, table_name, column_name, limit=15):
+    """Return the top `limit` distinct values of a column for a look-up value, using the ingest-time index when present."""
+    # Read-only connection from the shared pool
+    conn = get_connection()
+    if table_name==INDEXED_TABLE and index_available(conn):
+        return lookup_distinct_values(conn, column_name, look_up_value, limit)
+    return scan_distinct_values(conn, look_up_value, table_name, column_name, limit)
+
+
+@tool()
+def fetch_distinct_values(look_up_value:str ,table_name: str, column_name: str):
+    """Always Use this `fetch_distinct_values` tool to retrieve distinct values for specific columns in a SQLlite database table. The result can be used to find variations of a category which are not standardized. The "look_up_value" refers to the value we search for in the list of unique values."""
     results={}
     try:
-        # Instantiate the tool
-        conn = sqlite3.connect("database.db")
-        
-        query = f"SELECT DISTINCT {column_name} FROM {table_name}"
-        df1 = pd.read_sql_query(query, conn)
-
-        # Step 3: Apply the match percentage function to the target column
-        df1['match_percentage'] = df1[column_name].apply(lambda x: calculate_match_percentage(x, query_keywords))
-        df1=df1.sort_values("match_percentage",ascending=False).head(15)
-        results[column_name] = df1[column_name].to_list()
+        results[column_name] = resolve_distinct_values(look_up_value, table_name, column_name)
         return results
 
     except Exception as e:
         return {"error": str(e)}
 
 
+@tool()
+def fetch_distinct_values_batch(lookups: List[Dict[str, str]], table_name: str):
+    """Use this `fetch_distinct_values_batch` tool to resolve several filter values in one call instead of calling `fetch_distinct_values` once per filter. "lookups" is a list of objects, each with a "column_name" and the "look_up_value" to search for in that column's unique values. Returns the matching distinct values for every lookup."""
+    results=[]
+    for lookup in lookups:
+        column_name=lookup.get("column_name")
+        look_up_value=lookup.get("look_up_value","")
+        try:
+            matches=resolve_distinct_values(look_up_value, table_name, column_name)
+            results.append({"column_name":column_name,"look_up_value":look_up_value,"distinct_values":matches})
+        except Exception as e:
+            results.append({"column_name":column_name,"look_up_value":look_up_value,"error":str(e)})
+    return results
+
+
+
+
+def to_async_tools(function_map):
+    """
+    Wraps every tool of a function map in a coroutine that runs it on a worker thread, so that
+    autogen's async chat awaits the SQL work instead of blocking the event loop.
+    """
+    def make_async(func):
+        async def run_tool(**kwargs):
+            return await asyncio.to_thread(func, **kwargs)
+        return run_tool
+    return {name:make_async(func) for name,func in function_map.items()}
 
 
 class SQLToolkit():
@@ -103,6 +147,48 @@ class SQLToolkit():
             function_schema["parameters"]["properties"] = tool.args
         return function_schema
 
+    @staticmethod
+    def format_validation_result(result, execution_ms):
+        '''Text returned to the analyst for a validation run: the sample rows, whether they were truncated and the execution time.'''
+        if "error" in result:
+            return f"Error: {result['error']}"
+        if result["truncated"]:
+            truncation=f"true (only the first {len(result['rows'])} rows are shown, the full query returns more)"
+        else:
+            truncation="false"
+        return (f"Columns: {result['columns']}\n"
+                f"Rows: {result['rows'] if result['rows'] else '[] (the query returned no rows)'}\n"
+                f"Truncated: {truncation}\n"
+                f"Execution time: {execution_ms:.1f} ms")
+
+    @staticmethod
+    def bounded_query_run(limit=VALIDATION_ROW_LIMIT):
+        '''
+        Validation tool that runs the query as a bounded subquery (see `run_bounded_query`), so at most `limit` + 1 rows
+        are ever read, whatever LIMIT the analyst wrote. Identical queries on the same dataset are answered from the
+        shared result cache. On a cache miss, queries with an expensive plan (see `check_query`) are rejected before they run.
+        '''
+        def validate(query):
+            guard=check_query(query)
+            if guard["verdict"]=="reject":
+                return {"error":f"Query rejected before execution, {describe(guard)}"}
+            result=run_bounded_query(query, limit)
+            if guard["verdict"]=="flag":
+                result["warning"]=describe(guard)
+            return result
+
+        def sql_db_query_run(query: str, **kwargs):
+            start_time=time.time()
+            result=query_result_cache.get_or_compute(
+                "validation", query, lambda: validate(query),
+                # errors are returned as text, never cache them
+                should_cache=lambda value: "error" not in value)
+            response=SQLToolkit.format_validation_result(result, (time.time()-start_time)*1000)
+            if result.get("warning"):
+                response+=f"\nWarning: {result['warning']}"
+            return response
+        return sql_db_query_run
+
     def initialize_tools(self):
         # Load the Excel sheet into a pandas DataFrame
         # if self.file_path.endswith(".xlsx"):
@@ -114,7 +200,8 @@ class SQLToolkit():
             
         # Create an SQLAlchemy engine for SQLite (in-memory)
         # engine = create_engine('sqlite:///:memory:')
-        engine = create_engine(f"sqlite:///database.db")
+        # One pooled read-only connection per thread, opened with the same pragmas as the rest of the app
+        engine = create_engine("sqlite://", creator=read_only_pool.connect, poolclass=SingletonThreadPool)
         # Load the DataFrame into the SQLite database
         # df.to_sql(self.table_name, engine, index=False, if_exists="replace")
         db = SQLDatabase(engine=engine, lazy_table_reflection=True)
@@ -138,12 +225,13 @@ class SQLToolkit():
         for tool in toolkit.get_tools():
             if tool.name =="sql_db_query":
                 tool.name="sql_db_query_run"
-                tool_description = """Input to this tool is a detailed and correct SQL query for the user question, output is a result from the database. If the query is not correct, an error message will be returned. If an error is returned, rewrite the query, check the query, and try again."""
+                tool_description = f"""Input to this tool is a single detailed and correct SELECT query for the user question, output is a sample of at most {VALIDATION_ROW_LIMIT} rows from the database, whether the full result has more rows, and the execution time. If the query is not correct, an error message will be returned. If an error is returned, rewrite the query, check the query, and try again."""
                 tool_schema = self.generate_llm_config(tool)
                 tool_schema['description']=tool_description
                 tools.append(tool_schema)
                 tool.description = tool_description
-                function_map[tool.name] = tool._run
+                # Runs on the configured backend (rollup tables on SQLite, the Parquet copy on DuckDB)
+                function_map[tool.name] = self.bounded_query_run()
                 
             # elif tool.name =="sql_db_query_checker":
             #     tool_desc="""Use this tool to double check if your query is correct before executing it. Always use this tool before executing a query with sql_db_query_run tool!"""
@@ -153,9 +241,10 @@ class SQLToolkit():
             #     tool.description = tool_desc
             #     function_map[tool.name] = tool._run
 
-        tool_schema = self.generate_llm_config(fetch_distinct_values)
-        tools.append(tool_schema)
-        function_map[fetch_distinct_values.name] = fetch_distinct_values._run
+        for distinct_tool in [fetch_distinct_values,fetch_distinct_values_batch]:
+            tool_schema = self.generate_llm_config(distinct_tool)
+            tools.append(tool_schema)
+            function_map[distinct_tool.name] = distinct_tool._run
 
         return tools,function_map
             
@@ -0,0 +1,25 @@
+# Business wording of the questions -> column, metrics included. Multi-word entries are phrases.
+COLUMN_SYNONYMS={
+    "Title":["title","titles","game","games"],
+    "Franchise":["franchise","franchises","series"],
+    "IP":["ip","intellectual property"],
+    "Publisher":["publisher","publishers","company","companies","studio","studios"],
+    "Main_Genre":["genre","genres","category","categories"],
+    "Sub_Genre":["sub genre","sub-genre","subgenre","sub genres","subgenres"],
+    "Conflict_Type":["conflict","pvp","pve","competitive","cooperative"],
+    "Social_Play":["social","multiplayer","single player","co-op","coop","online"],
+    "Business_Model":["business model","free to play","free-to-play","f2p","paid","monetization","monetisation"],
+    "Release_Date_Month":["release","released","releases","launch","launched","new"],
+    "Month_Since_Launch":["since launch","after launch","lifecycle","age","months since"],
+    "SKU":["sku","skus","digital","physical","edition","editions"],
+    "Region":["region","regions","regional","country","countries","market","markets","europe","european","america",
+              "american","asia","asian","emea","apac","latam","japan"],
+    "Platform":["platform","platforms","pc","console","consoles","playstation","ps5","ps4","xbox","switch","mobile"],
+    "Units":["units","unit","copies","sold","volume"],
+    "Total_Revenue":["revenue","revenues","sales","earnings","income","gross","grossing","money","total revenue"],
+    "Full_Game_Revenue":["full game","full-game","game revenue","box"],
+    "In_Game_Revenue":["in-game","in game","microtransactions","microtransaction","mtx","dlc"],
+    "Premium_Revenue":["premium","subscription","subscriptions"],
+    "Mau":["mau","maus","monthly active users","active users","users","players","player","engagement"],
+    "Processing_Date_Month":["month","months","monthly","year","years","yearly","date","trend","period","quarter"],
+}